@@ -0,0 +1,83 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction, IsolationLevel, ConcurrencyMode
+
+from random import randint, seed
+
+number_of_records = 100
+seed(3562901)
+
+modes = [(IsolationLevel.SNAPSHOT, ConcurrencyMode.PESSIMISTIC),
+         (IsolationLevel.SERIALIZABLE, ConcurrencyMode.PESSIMISTIC),
+         (IsolationLevel.SNAPSHOT, ConcurrencyMode.OPTIMISTIC)]
+for isolation_level, concurrency_mode in modes:
+    db = Database(isolation_level=isolation_level, concurrency_mode=concurrency_mode)
+    mode = isolation_level + '/' + concurrency_mode
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    grades_table.index.create_index(2)
+
+    records = {}
+    for i in range(0, number_of_records):
+        key = 92106429 + i
+        records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+        query.insert(*records[key])
+    keys = sorted(records.keys())
+    new_key = 92106429 + number_of_records
+    missing_key = 1
+
+    def check(where):
+        for key in keys + [new_key]:
+            result = query.select(key, 0, [1, 1, 1, 1, 1])
+            if key not in records:
+                if result:
+                    print(mode, where, 'error: rolled back insert of', key, 'is visible')
+                continue
+            if not result or result[0].columns != records[key]:
+                print(mode, where, 'error on', key, ':', result, ', correct:', records[key])
+                continue
+            # the secondary index lists the record under its value, and not under rolled back ones
+            if key not in [r.columns[0] for r in query.select(records[key][2], 2, [1, 1, 1, 1, 1])]:
+                print(mode, where, 'index error on', key, ': not found by', records[key][2])
+        if query.select(999, 2, [1, 1, 1, 1, 1]):
+            print(mode, where, 'index error: rolled back value 999 still indexed')
+        correct = sum(columns[1] for columns in records.values())
+        if query.sum(keys[0], new_key, 1) != correct:
+            print(mode, where, 'sum error:', query.sum(keys[0], new_key, 1), ', correct:', correct)
+
+    # a failing query undoes the inserts, updates and deletes that ran before it
+    t = Transaction()
+    t.add_query(query.insert, grades_table, new_key, 1, 999, 1, 1)
+    t.add_query(query.update, grades_table, keys[0], None, 5, 999, None, None)
+    t.add_query(query.update, grades_table, keys[0], None, 6, None, None, None)
+    t.add_query(query.delete, grades_table, keys[1])
+    t.add_query(query.insert, grades_table, keys[1], 0, 999, 0, 0)
+    t.add_query(query.update, grades_table, missing_key, None, 1, None, None, None)
+    if t.run():
+        print(mode, 'abort error: a transaction with a failing query committed')
+    if t.abort_reason != 'query_failed' or t.retryable:
+        print(mode, 'abort error: abort reason', t.abort_reason)
+    check('query failed')
+
+    # abort() after every query succeeded undoes them too
+    t = Transaction()
+    t.add_query(query.update, grades_table, keys[2], None, None, 999, None, None)
+    t.add_query(query.delete, grades_table, keys[3])
+    t.add_query(query.insert, grades_table, new_key, 1, 999, 1, 1)
+    if not t.prepare():
+        print(mode, 'abort error: the transaction failed before abort()')
+    t.abort()
+    check('explicit abort')
+
+    # the records are writable again after the rollback
+    t = Transaction()
+    t.add_query(query.update, grades_table, keys[0], None, 7, None, None, None)
+    t.add_query(query.delete, grades_table, keys[3])
+    t.add_query(query.insert, grades_table, new_key, 1, 2, 3, 4)
+    if not t.run():
+        print(mode, 'abort error: the records are still locked or changed after a rollback')
+    records[keys[0]][1] = 7
+    del records[keys[3]]
+    records[new_key] = [new_key, 1, 2, 3, 4]
+    check('after rollback')
+    print(mode, "abort finished")
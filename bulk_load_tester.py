@@ -0,0 +1,113 @@
+from lstore.db import Database
+from lstore.query import Query
+
+from array import array
+from random import randint, seed
+import os
+import shutil
+import sys
+
+path = './ECS165_bulk'
+shutil.rmtree(path, ignore_errors=True)
+number_of_records = 1000
+seed(3562901)
+
+db = Database()
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+records = {}
+
+
+def new_rows(first_key):
+    rows = []
+    for i in range(0, number_of_records):
+        key = first_key + i
+        rows.append([key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)])
+    return rows
+
+
+def check(query, records, where):
+    for key, columns in records.items():
+        result = query.select(key, 0, [1, 1, 1, 1, 1])
+        if not result or result[0].columns != columns:
+            print(where, 'select error on', key, ':', result and result[0].columns, ', correct:', columns)
+    for value in range(0, 21):
+        found = sorted(r.columns[0] for r in query.select(value, 2, [1, 1, 1, 1, 1]))
+        correct = sorted(key for key, columns in records.items() if columns[2] == value)
+        if found != correct:
+            print(where, 'index error on', value, ':', len(found), 'records found, correct:', len(correct))
+    keys = sorted(records)
+    correct = sum(columns[1] for columns in records.values())
+    if query.sum(keys[0], keys[-1], 1) != correct:
+        print(where, 'sum error:', query.sum(keys[0], keys[-1], 1), ', correct:', correct)
+
+
+# rows, a CSV file and a binary file of little-endian int64s
+rows = new_rows(92106429)
+if grades_table.bulk_load(rows) != number_of_records:
+    print('bulk load error: wrong count for rows')
+records.update((row[0], row) for row in rows)
+
+rows = new_rows(92106429 + number_of_records)
+csv_path = os.path.join(path, 'grades.csv')
+with open(csv_path, 'w') as f:
+    f.write('\n'.join(','.join(str(value) for value in row) for row in rows) + '\n')
+if grades_table.bulk_load(csv_path) != number_of_records:
+    print('bulk load error: wrong count for a CSV file')
+records.update((row[0], row) for row in rows)
+
+rows = new_rows(92106429 + 2 * number_of_records)
+binary_path = os.path.join(path, 'grades.bin')
+values = array('q', [value for row in rows for value in row])
+if sys.byteorder == 'big':
+    values.byteswap()
+with open(binary_path, 'wb') as f:
+    f.write(values.tobytes())
+if grades_table.bulk_load(binary_path) != number_of_records:
+    print('bulk load error: wrong count for a binary file')
+records.update((row[0], row) for row in rows)
+check(query, records, 'bulk load')
+print("Bulk load finished")
+
+# a duplicate key, in the load or already in the table, loads nothing
+size = len(grades_table.rid_to_versions)
+rows = new_rows(92106429 + 3 * number_of_records)
+for bad_rows in (rows + [rows[0]], rows + [records[92106429]], rows + [[1, 2, 3]]):
+    try:
+        grades_table.bulk_load(bad_rows)
+        print('bulk load error: a bad load raised no ValueError')
+    except ValueError:
+        pass
+    if len(grades_table.rid_to_versions) != size or query.select(rows[0][0], 0, [1, 1, 1, 1, 1]):
+        print('bulk load error: a failed load stored records')
+check(query, records, 'failed bulk load')
+print("Bulk load errors finished")
+
+# loaded records take updates like inserted ones
+for key in sorted(records)[::7]:
+    records[key][2] = randint(0, 20)
+    query.update(key, None, None, records[key][2], None, None)
+check(query, records, 'update after bulk load')
+
+# a partitioned table loads each row into the partition owning its key
+partitioned_table = db.create_table('Partitioned', 5, 0, ('hash', 4))
+partitioned_table.index.create_index(2)
+partitioned_query = Query(partitioned_table)
+partitioned_records = {row[0]: row for row in new_rows(92106429)}
+partitioned_table.bulk_load(list(partitioned_records.values()))
+check(partitioned_query, partitioned_records, 'partitioned bulk load')
+print("Partitioned bulk load finished")
+
+# the load is logged: it survives a crash before the next checkpoint
+db.wal._file.close()
+db = Database()
+db.open(path)
+check(Query(db.get_table('Grades')), records, 'recovery')
+check(Query(db.get_table('Partitioned')), partitioned_records, 'partitioned recovery')
+print("Bulk load recovery finished")
+
+db.close()
+shutil.rmtree(path)
@@ -0,0 +1,74 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+
+import sys
+import threading
+
+# switch threads as often as possible, so racing inserts interleave
+sys.setswitchinterval(1e-6)
+
+number_of_keys = 50
+number_of_trials = 20
+num_threads = 8
+
+errors = 0
+for trial in range(number_of_trials):
+    db = Database()
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+
+    # every worker inserts every key: exactly one insert of each key may succeed
+    transaction_workers = []
+    for i in range(num_threads):
+        transaction_workers.append(TransactionWorker())
+        for j in range(number_of_keys):
+            key = 92106429 + j
+            t = Transaction()
+            t.add_query(query.insert, grades_table, key, i, i, i, i)
+            transaction_workers[i].add_transaction(t)
+    for i in range(num_threads):
+        transaction_workers[i].run()
+    for i in range(num_threads):
+        transaction_workers[i].join()
+
+    committed = sum(worker.result for worker in transaction_workers)
+    if committed != number_of_keys:
+        errors += 1
+        print('insert error in trial', trial, ':', committed, 'inserts committed, correct:', number_of_keys)
+    if len(grades_table.rid_to_versions) != number_of_keys:
+        errors += 1
+        print('insert error in trial', trial, ':', len(grades_table.rid_to_versions), 'records, correct:', number_of_keys)
+
+    # the same races outside transactions
+    autocommit_table = db.create_table('Autocommit', 5, 0)
+    autocommit_query = Query(autocommit_table)
+    barrier = threading.Barrier(num_threads)
+    inserted = []
+
+    def insert_all(i):
+        barrier.wait()
+        for j in range(number_of_keys):
+            if autocommit_query.insert(92106429 + j, i, i, i, i):
+                inserted.append(j)
+
+    threads = [threading.Thread(target=insert_all, args=(i,)) for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if sorted(inserted) != list(range(number_of_keys)) or len(autocommit_table.rid_to_versions) != number_of_keys:
+        errors += 1
+        print('autocommit insert error in trial', trial, ':', len(inserted), 'inserts succeeded,',
+              len(autocommit_table.rid_to_versions), 'records, correct:', number_of_keys)
+
+    # scans see each key once, with the values of the insert that won
+    for table, q in ((grades_table, query), (autocommit_table, autocommit_query)):
+        total = q.sum(92106429, 92106429 + number_of_keys - 1, 1)
+        correct = sum(q.select(92106429 + j, 0, [1, 1, 1, 1, 1])[0].columns[1] for j in range(number_of_keys))
+        if total != correct:
+            errors += 1
+            print('sum error in trial', trial, 'on', table.name, ':', total, ', correct:', correct)
+
+print("Concurrent insert finished with", errors, "errors")
@@ -0,0 +1,112 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.replica import Replica
+from lstore.transaction import Transaction
+
+from random import randint, seed
+import shutil
+
+path = './ECS165_durability'
+shutil.rmtree(path, ignore_errors=True)
+number_of_records = 200
+seed(3562901)
+
+
+def crash(db):
+    # the process dies: nothing is persisted and the log is not checkpointed
+    db.wal._file.close()
+
+
+def check(query, records, where):
+    for key, columns in records.items():
+        result = query.select(key, 0, [1, 1, 1, 1, 1])
+        if not result or result[0].columns != columns:
+            print(where, 'select error on', key, ':', result and result[0].columns, ', correct:', columns)
+
+
+db = Database()
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+db.create_table('Dropped', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+records = {}
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+keys = sorted(records.keys())
+for key in keys[::2]:
+    records[key][2] = randint(0, 20)
+    t = Transaction()
+    t.add_query(query.update, grades_table, key, None, None, records[key][2], None, None)
+    t.run()
+for key in keys[::10]:
+    query.delete(key)
+    del records[key]
+db.drop_table('Dropped')
+
+# neither an aborted nor an unfinished transaction may come back
+aborted = Transaction()
+aborted.add_query(query.update, grades_table, keys[1], None, 99, None, None, None)
+aborted.add_query(query.insert, grades_table, 1, 1, 1, 1, 1)
+aborted.prepare()
+aborted.abort()
+unfinished = Transaction()
+unfinished.add_query(query.update, grades_table, keys[3], None, 99, None, None, None)
+unfinished.add_query(query.insert, grades_table, 2, 2, 2, 2, 2)
+unfinished.prepare()
+crash(db)
+
+db = Database()
+db.open(path)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+check(query, records, 'recovery')
+for key in [1, 2] + keys[::10]:
+    if query.select(key, 0, [1, 1, 1, 1, 1]):
+        print('recovery error: recovered', key, 'which was never committed or was deleted')
+if 2 not in grades_table.index.secondary_indexes:
+    print('recovery error: the secondary index was not recovered')
+for key in keys[1::20]:
+    if key in records and key not in [r.columns[0] for r in query.select(records[key][2], 2, [1, 1, 1, 1, 1])]:
+        print('recovery index error on', key, ': not found by', records[key][2])
+if 'Dropped' in db.tables:
+    print('recovery error: the dropped table came back')
+print("Crash recovery finished")
+
+# a replica follows the writer's commits, across checkpoints
+db.close()
+replica = Replica(path, max_staleness=0)
+grades = replica.get_table('Grades')
+check(grades, records, 'replica')
+for key in keys[1::3]:
+    if key in records:
+        records[key][3] = randint(0, 20)
+        query.update(key, None, None, None, records[key][3], None)
+check(grades, records, 'replica tailing')
+db.close()
+for key in keys[1::5]:
+    if key in records:
+        records[key][4] = randint(0, 20)
+        query.update(key, None, None, None, None, records[key][4])
+check(grades, records, 'replica after checkpoint')
+# several checkpoints between two catch-ups make the replica reload
+for _ in range(3):
+    for key in keys[2::7]:
+        if key in records:
+            records[key][1] = randint(0, 20)
+            query.update(key, None, records[key][1], None, None, None)
+    db.close()
+check(grades, records, 'replica after reload')
+# a table created after the last checkpoint
+new_table = db.create_table('New', 5, 0)
+new_records = {key: [key, 1, 2, 3, 4] for key in keys[:10]}
+for columns in new_records.values():
+    Query(new_table).insert(*columns)
+check(replica.get_table('New'), new_records, 'replica new table')
+print("Replica catch-up finished")
+
+db.close()
+shutil.rmtree(path)
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from lstore.config import ISOLATION_LEVEL, CONCURRENCY_MODE, MAX_RETRIES, ENABLE_METRICS
+from lstore.db import Database
+from lstore.lock_manager import LockPolicy
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+
+class AsyncDatabase:
+    """
+    asyncio front-end of a Database, for running many small requests on one event loop.
+
+    Queries work on memory only, so they execute directly on the loop. The wrapped
+    Database uses no-wait locking: a lock conflict never blocks the loop, it aborts
+    the transaction, which is retried after an asynchronous backoff (like
+    TransactionWorker's) while other requests keep running. Disk I/O (open, close,
+    and the log write of a commit) runs in the loop's default executor.
+    """
+
+    def __init__(self, bufferpool_size=10, isolation_level=ISOLATION_LEVEL,
+                 concurrency_mode=CONCURRENCY_MODE, max_retries=MAX_RETRIES, metrics=ENABLE_METRICS):
+        self.db = Database(bufferpool_size, lock_policy=LockPolicy.NO_WAIT,
+                           isolation_level=isolation_level, concurrency_mode=concurrency_mode,
+                           metrics=metrics)
+        self.max_retries = max_retries
+
+    async def open(self, path):
+        await asyncio.get_running_loop().run_in_executor(None, self.db.open, path)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.db.close)
+
+    def create_table(self, name, num_columns, key_index, partitioning=None):
+        return self.db.create_table(name, num_columns, key_index, partitioning)
+
+    def drop_table(self, name):
+        self.db.drop_table(name)
+
+    def get_table(self, name):
+        return self.db.get_table(name)
+
+    async def run(self, transaction):
+        """
+        Run an AsyncTransaction (or Transaction), retrying it with backoff while it
+        aborts on a lock conflict or failed validation, up to max_retries times.
+        Returns True if it committed.
+        """
+        if isinstance(transaction, AsyncTransaction):
+            transaction = transaction.transaction
+        for attempt in range(self.max_retries + 1):
+            if await self._attempt(transaction):
+                return True
+            if not transaction.retryable:
+                break
+            if attempt < self.max_retries:
+                if self.db.metrics is not None:
+                    self.db.metrics.retry()
+                transaction.queued_at = time.perf_counter_ns()
+                await asyncio.sleep(TransactionWorker._backoff(attempt))
+        return False
+
+    async def _attempt(self, transaction):
+        # Transaction.run, except that a commit with a log record to write (and
+        # fsync) waits for it off the loop
+        db = self.db
+        tracer = db.tracer
+        start = time.perf_counter_ns()
+        if tracer is not None and transaction.queued_at is not None:
+            tracer.span("queue", transaction.queued_at, start)
+        committed = False
+        try:
+            if transaction.prepare():
+                state = db.optimistic.get(transaction.tid)
+                if db.wal is not None and (db.undo_logs.get(transaction.tid) or
+                                           (state is not None and state.writes)):
+                    loop = asyncio.get_running_loop()
+                    committed = await loop.run_in_executor(None, transaction.commit)
+                else:
+                    committed = transaction.commit()
+        finally:
+            if tracer is not None:
+                tracer.span("transaction", start, time.perf_counter_ns(),
+                            tid=transaction.tid, committed=committed)
+        return committed
+
+
+class AsyncTransaction:
+    """
+    A transaction for an AsyncDatabase. Queries are added as for a Transaction,
+    with either Query or AsyncQuery methods:
+
+        t = AsyncTransaction()
+        t.add_query(query.update, table, key, None, 5)
+        committed = await adb.run(t)
+
+    After running, self.results holds each query's return value in order.
+    """
+
+    def __init__(self):
+        self.transaction = Transaction()
+
+    def add_query(self, query_fn, table, *args):
+        owner = getattr(query_fn, "__self__", None)
+        if isinstance(owner, AsyncQuery):
+            query_fn = getattr(owner.query, query_fn.__name__)
+        self.transaction.add_query(query_fn, table, *args)
+
+    @property
+    def results(self):
+        return self.transaction.results
+
+
+class AsyncQuery:
+    """
+    Awaitable Query interface. Each call runs as its own single-query transaction
+    on the AsyncDatabase; returns False if it still aborts after max_retries retries.
+    """
+
+    def __init__(self, adb, table):
+        self.adb = adb
+        self.table = table
+        self.query = Query(table)
+
+    async def _run(self, query_fn, *args):
+        txn = Transaction()
+        txn.add_query(query_fn, self.table, *args)
+        if not await self.adb.run(txn):
+            return False
+        return txn.results[0]
+
+    async def insert(self, *columns):
+        return await self._run(self.query.insert, *columns)
+
+    async def update(self, primary_key, *columns):
+        return await self._run(self.query.update, primary_key, *columns)
+
+    async def delete(self, primary_key):
+        return await self._run(self.query.delete, primary_key)
+
+    async def select(self, search_key, search_key_index, projected_columns_index):
+        return await self._run(self.query.select, search_key, search_key_index, projected_columns_index)
+
+    async def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
+        return await self._run(self.query.select_version, search_key, search_key_index,
+                               projected_columns_index, relative_version)
+
+    async def sum(self, start_range, end_range, aggregate_column_index):
+        return await self._run(self.query.sum, start_range, end_range, aggregate_column_index)
+
+    async def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
+        return await self._run(self.query.sum_version, start_range, end_range,
+                               aggregate_column_index, relative_version)
@@ -0,0 +1,685 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from lstore.config import MAX_RETRIES
+from lstore.db import Database
+from lstore.lock_manager import LockPolicy
+from lstore.metrics import Histogram
+from lstore.multiprocess import PartitionedDatabase, PartitionedTransaction
+from lstore.query import Query
+from lstore.transaction import Transaction, IsolationLevel, ConcurrencyMode
+from lstore.transaction_worker import TransactionWorker
+
+# YCSB core workloads: operation mix, and the key distribution they prescribe
+# (None = the one chosen with --distribution). "scan" is a sum over a short key
+# range, the range query this database has; "rmw" reads then updates one record
+# in a single transaction.
+WORKLOADS = {
+    "A": ({"read": 0.5, "update": 0.5}, None),             # update heavy
+    "B": ({"read": 0.95, "update": 0.05}, None),           # read mostly
+    "C": ({"read": 1.0}, None),                            # read only
+    "D": ({"read": 0.95, "insert": 0.05}, "latest"),       # read latest
+    "E": ({"scan": 0.95, "insert": 0.05}, None),           # short ranges
+    "F": ({"read": 0.5, "rmw": 0.5}, None),                # read-modify-write
+}
+DISTRIBUTIONS = ("uniform", "zipfian", "latest")
+ZIPFIAN_THETA = 0.99
+MAX_SCAN_LENGTH = 100
+TABLE_NAME = "usertable"
+
+
+class ZipfianGenerator:
+    """
+    Ranks 0..n-1 with P(rank i) proportional to 1 / (i + 1)^theta, drawn in O(1)
+    (Gray et al., "Quickly generating billion-record synthetic databases", as in YCSB).
+    """
+
+    def __init__(self, n, theta=ZIPFIAN_THETA):
+        self.n = n
+        self.theta = theta
+        self.alpha = 1.0 / (1.0 - theta)
+        self.zetan = sum(1.0 / (i + 1) ** theta for i in range(n))
+        zeta2 = 1.0 + 0.5 ** theta
+        self.eta = (1.0 - (2.0 / n) ** (1.0 - theta)) / (1.0 - zeta2 / self.zetan)
+        self.half_pow_theta = 0.5 ** theta
+
+    def next(self, rng):
+        uz = rng.random() * self.zetan
+        if uz < 1.0:
+            return 0
+        if uz < 1.0 + self.half_pow_theta:
+            return 1
+        return min(self.n - 1, int(self.n * (self.eta * rng.random() - self.eta + 1.0) ** self.alpha))
+
+
+def _fnv64(value):
+    # FNV-1a over the 8 bytes of value: YCSB's scrambling of zipfian ranks over the key space
+    h = 0xCBF29CE484222325
+    for _ in range(8):
+        h = ((h ^ (value & 0xFF)) * 0x100000001B3) & 0xFFFFFFFFFFFFFFFF
+        value >>= 8
+    return h
+
+
+class KeyChooser:
+    """
+    Keys of operations on existing records, and of new records. Keys are 0..n-1 after
+    loading n records; inserts take the next ones. Shared by the driver threads.
+    """
+
+    def __init__(self, record_count, distribution):
+        self.distribution = distribution
+        self.record_count = record_count
+        self._next_insert = itertools.count(record_count)
+        self.inserted = record_count  # keys below this exist (or are being inserted)
+        self.zipfian = ZipfianGenerator(record_count) if distribution != "uniform" else None
+
+    def existing(self, rng):
+        if self.distribution == "uniform":
+            return rng.randrange(self.inserted)
+        rank = self.zipfian.next(rng)
+        if self.distribution == "latest":
+            return max(0, self.inserted - 1 - rank)
+        # scrambled, so the popular keys are spread over the key space
+        return _fnv64(rank) % self.record_count
+
+    def new(self):
+        key = next(self._next_insert)
+        self.inserted = max(self.inserted, key + 1)
+        return key
+
+
+def _choose(mix, rng):
+    u = rng.random()
+    for op, share in mix:
+        u -= share
+        if u < 0:
+            return op
+    return mix[-1][0]
+
+
+class Results:
+    """
+    Latency histograms per operation and abort counts of one driver thread.
+    """
+
+    def __init__(self):
+        self.latency = {}
+        self.aborts = 0
+        self.retries = 0
+        self.failed = 0   # operations still aborted after every retry
+
+    def record(self, op, nanoseconds, ok):
+        histogram = self.latency.get(op)
+        if histogram is None:
+            histogram = self.latency[op] = Histogram()
+        histogram.record(nanoseconds, not ok)
+        if not ok:
+            self.failed += 1
+
+    def merge(self, other):
+        for op, histogram in other.latency.items():
+            self.latency.setdefault(op, Histogram()).merge(histogram)
+        self.aborts += other.aborts
+        self.retries += other.retries
+        self.failed += other.failed
+
+    def report(self, operations, seconds):
+        overall = Histogram()
+        for histogram in self.latency.values():
+            overall.merge(histogram)
+        return {"operations": operations, "seconds": seconds,
+                "ops_per_sec": operations / seconds if seconds else 0.0,
+                "aborts": self.aborts, "retries": self.retries, "failed": self.failed,
+                "latency": {op: histogram.snapshot() for op, histogram in sorted(self.latency.items())},
+                "overall": overall.snapshot()}
+
+
+def _operation(op, keys, rng, num_columns):
+    """
+    The queries of one operation, as [(query name, args)].
+    """
+    if op == "insert":
+        key = keys.new()
+        return [("insert", (key,) + tuple(rng.randrange(1000) for _ in range(num_columns - 1)))]
+    key = keys.existing(rng)
+    if op == "read":
+        return [("select", (key, 0, [1] * num_columns))]
+    if op == "scan":
+        return [("sum", (key, key + rng.randint(1, MAX_SCAN_LENGTH) - 1, rng.randrange(1, num_columns)))]
+    update = [None] * num_columns
+    update[rng.randrange(1, num_columns)] = rng.randrange(1000)
+    if op == "update":
+        return [("update", (key, *update))]
+    return [("select", (key, 0, [1] * num_columns)), ("update", (key, *update))]  # rmw
+
+
+class ThreadedRunner:
+    """
+    Runs operations on one in-process Database from any number of threads. Each
+    operation is a transaction, re-run with backoff while it aborts (up to
+    max_retries), unless autocommit runs its queries directly.
+    """
+
+    def __init__(self, args):
+        self.db = Database(metrics=args.metrics)
+        self.table = self.db.create_table(TABLE_NAME, args.columns, 0)
+        self.query = Query(self.table)
+        self.autocommit = args.autocommit
+        self.max_retries = args.max_retries
+        self.bulk_load = args.bulk_load
+
+    def load(self, rows):
+        if self.bulk_load:
+            self.table.bulk_load(rows)
+            return
+        for row in rows:
+            self.query.insert(*row)
+
+    def execute(self, queries, results):
+        if self.autocommit:
+            return all(getattr(self.query, name)(*args) is not False for name, args in queries)
+        for attempt in range(self.max_retries + 1):
+            txn = Transaction()
+            for name, args in queries:
+                txn.add_query(getattr(self.query, name), self.table, *args)
+            if txn.run():
+                return True
+            results.aborts += 1
+            if not txn.retryable:
+                break
+            if attempt < self.max_retries:
+                results.retries += 1
+                time.sleep(TransactionWorker._backoff(attempt))
+        return False
+
+    def run(self, plan, threads):
+        """
+        Execute plan ([(op, queries)]) split over `threads` threads; returns (Results, seconds).
+        """
+        parts = [plan[i::threads] for i in range(threads)]
+        results = [Results() for _ in parts]
+
+        def drive(part, res):
+            clock = time.perf_counter_ns
+            for op, queries in part:
+                start = clock()
+                ok = self.execute(queries, res)
+                res.record(op, clock() - start, ok)
+
+        workers = [threading.Thread(target=drive, args=(part, res)) for part, res in zip(parts, results)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - start
+        total = Results()
+        for res in results:
+            total.merge(res)
+        return total, seconds
+
+    def stats(self):
+        return {"bufferpool": self.db.bufferpool.stats(), "database": self.db.stats()}
+
+    def close(self):
+        pass
+
+
+class ProcessRunner:
+    """
+    Runs operations on a PartitionedDatabase, one process per partition. One driver
+    thread sends the operations in pipelined batches of batch_size; an operation's
+    latency is the time until its batch completes. Aborted ones are re-sent.
+    """
+
+    def __init__(self, args):
+        self.db = PartitionedDatabase(args.processes)
+        self.db.open()
+        self.db.create_table(TABLE_NAME, args.columns, 0)
+        self.batch_size = args.batch
+        self.max_retries = args.max_retries
+
+    def _transaction(self, queries):
+        txn = PartitionedTransaction()
+        for name, args in queries:
+            txn.add_query(TABLE_NAME, name, *args)
+        return txn
+
+    def load(self, rows):
+        rows = list(rows)
+        for i in range(0, len(rows), 1000):
+            self.db.run_all([self._transaction([("insert", row)]) for row in rows[i:i + 1000]])
+
+    def run(self, plan, threads):
+        results = Results()
+        clock = time.perf_counter_ns
+        start = time.perf_counter()
+        for i in range(0, len(plan), self.batch_size):
+            batch = plan[i:i + self.batch_size]
+            batch_start = clock()
+            pending = list(range(len(batch)))
+            for attempt in range(self.max_retries + 1):
+                outcomes = self.db.run_all([self._transaction(batch[j][1]) for j in pending])
+                aborted = [j for j, committed in zip(pending, outcomes) if not committed]
+                for j, committed in zip(pending, outcomes):
+                    if committed:
+                        results.record(batch[j][0], clock() - batch_start, True)
+                if not aborted:
+                    break
+                results.aborts += len(aborted)
+                if attempt < self.max_retries:
+                    results.retries += len(aborted)
+                pending = aborted
+            else:
+                for j in pending:
+                    results.record(batch[j][0], clock() - batch_start, False)
+        return results, time.perf_counter() - start
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        self.db.close()
+
+
+def run_ycsb(args, workload):
+    """
+    Load args.records records, then run args.operations operations of `workload`.
+    Returns the report as a dict.
+    """
+    mix, distribution = WORKLOADS[workload]
+    distribution = distribution or args.distribution
+    rng = random.Random(args.seed)
+    runner = ProcessRunner(args) if args.processes else ThreadedRunner(args)
+    try:
+        rows = [(key,) + tuple(rng.randrange(1000) for _ in range(args.columns - 1))
+                for key in range(args.records)]
+        start = time.perf_counter()
+        runner.load(rows)
+        load_seconds = time.perf_counter() - start
+
+        # operations are drawn up front, so the drivers only measure the database
+        keys = KeyChooser(args.records, distribution)
+        mix = sorted(mix.items())
+        plan = []
+        for _ in range(args.operations):
+            op = _choose(mix, rng)
+            plan.append((op, _operation(op, keys, rng, args.columns)))
+        tracing = args.trace and not args.processes
+        if tracing:
+            runner.db.start_tracing(profile_interval=0.001)
+        results, seconds = runner.run(plan, args.threads)
+        if tracing:
+            runner.db.stop_tracing(f"{args.trace}.{workload}.json")
+        report = {
+            "workload": workload,
+            "config": {"records": args.records, "operations": args.operations, "columns": args.columns,
+                       "distribution": distribution, "threads": 1 if args.processes else args.threads,
+                       "processes": args.processes, "autocommit": args.autocommit, "seed": args.seed},
+            "load": {"records": args.records, "seconds": load_seconds,
+                     "ops_per_sec": args.records / load_seconds if load_seconds else 0.0},
+            "run": results.report(len(plan), seconds),
+        }
+        report.update(runner.stats())
+        return report
+    finally:
+        runner.close()
+
+
+def _summary(report):
+    run = report["run"]
+    overall = run["overall"]
+    return (f"workload {report['workload']}: {run['ops_per_sec']:.0f} ops/s, "
+            f"p50 {overall['p50_us']:.1f}us p99 {overall['p99_us']:.1f}us p999 {overall['p999_us']:.1f}us, "
+            f"{run['aborts']} aborts")
+
+
+def add_ycsb_arguments(parser):
+    parser.add_argument("--workload", default="ABCDEF",
+                        help="YCSB workloads to run, one after the other, each on a fresh database (default ABCDEF)")
+    parser.add_argument("--records", type=int, default=10000, help="records loaded before running")
+    parser.add_argument("--operations", type=int, default=10000, help="operations per workload")
+    parser.add_argument("--columns", type=int, default=5, help="columns per record, the key included")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="zipfian",
+                        help="key distribution of workloads that do not prescribe one")
+    parser.add_argument("--threads", type=int, default=1, help="driver threads on one Database")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="run on a PartitionedDatabase with this many partition processes instead")
+    parser.add_argument("--batch", type=int, default=1, help="operations per pipelined batch (--processes)")
+    parser.add_argument("--autocommit", action="store_true",
+                        help="run queries directly instead of as transactions (threads)")
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES, help="re-runs of an aborted operation")
+    parser.add_argument("--metrics", action="store_true",
+                        help="enable the database's metrics and include Database.stats() (threads)")
+    parser.add_argument("--bulk-load", action="store_true",
+                        help="load the records with Table.bulk_load instead of inserts (threads)")
+    parser.add_argument("--trace",
+                        help="write a Chrome trace of each run, with CPU per Query method, to "
+                             "TRACE.<workload>.json (threads)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+
+
+def run_concurrency(args, policy, isolation, mode, keys, length, write_ratio):
+    """
+    One point of the concurrency sweep: args.workers TransactionWorkers, each running
+    args.transactions transactions of `length` queries on keys drawn uniformly from
+    the first `keys` records (fewer keys, more contention), a write_ratio share of
+    them updates and the rest selects. Returns the report as a dict.
+    """
+    rng = random.Random(args.seed)
+    db = Database(lock_policy=policy, isolation_level=isolation, concurrency_mode=mode, metrics=True)
+    table = db.create_table(TABLE_NAME, args.columns, 0)
+    query = Query(table)
+    for key in range(max(keys, args.records)):
+        query.insert(key, *(rng.randrange(1000) for _ in range(args.columns - 1)))
+    db.stats(reset=True)  # count the run only
+
+    workers = []
+    for _ in range(args.workers):
+        worker = TransactionWorker(max_retries=args.max_retries)
+        for _ in range(args.transactions):
+            txn = Transaction()
+            for _ in range(length):
+                key = rng.randrange(keys)
+                if rng.random() < write_ratio:
+                    update = [None] * args.columns
+                    update[rng.randrange(1, args.columns)] = rng.randrange(1000)
+                    txn.add_query(query.update, table, key, *update)
+                else:
+                    txn.add_query(query.select, table, key, 0, [1] * args.columns)
+            worker.add_transaction(txn)
+        workers.append(worker)
+    start = time.perf_counter()
+    for worker in workers:
+        worker.run()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+
+    committed = sum(worker.result for worker in workers)
+    aborts = sum(worker.aborts for worker in workers)
+    stats = db.stats()
+    lock_wait = stats["locks"]["lock_wait"]
+    return {
+        "config": {"lock_policy": policy, "isolation_level": isolation, "concurrency_mode": mode,
+                   "keys": keys, "transaction_length": length, "write_ratio": write_ratio,
+                   "workers": args.workers, "transactions": args.workers * args.transactions,
+                   "seed": args.seed},
+        "seconds": seconds,
+        "committed": committed,
+        "tps": committed / seconds if seconds else 0.0,
+        "aborts": aborts,
+        "abort_rate": aborts / (aborts + committed) if aborts + committed else 0.0,
+        "abort_reasons": stats["transactions"]["abort_reasons"],
+        "retries": sum(worker.retries for worker in workers),
+        "gave_up": args.workers * args.transactions - committed,
+        "lock_wait": {"total_ms": lock_wait["mean_us"] * lock_wait["count"] / 1000,
+                      "waits": lock_wait["count"], "p99_us": lock_wait["p99_us"]},
+        "commit_latency": stats["transactions"]["commit_latency"],
+        "locks": {k: stats["locks"][k] for k in ("requests", "conflicts", "refused", "upgrade_failures",
+                                                 "wounds", "escalations", "hot_keys")},
+    }
+
+
+def _concurrency_summary(report):
+    c = report["config"]
+    return (f"{c['lock_policy']:>10} {c['isolation_level']:>12} {c['concurrency_mode']:>3} "
+            f"keys={c['keys']:<6} len={c['transaction_length']:<3} writes={c['write_ratio']:<4}: "
+            f"{report['tps']:.0f} TPS, abort rate {report['abort_rate']:.1%}, {report['retries']} retries, "
+            f"lock wait {report['lock_wait']['total_ms']:.1f}ms")
+
+
+def _list(cast):
+    return lambda text: [cast(item) for item in text.split(",")]
+
+
+def add_concurrency_arguments(parser):
+    parser.add_argument("--policies", type=_list(str),
+                        default=[LockPolicy.NO_WAIT, LockPolicy.WAIT_DIE, LockPolicy.WOUND_WAIT],
+                        help="lock policies, comma-separated (default NO_WAIT,WAIT_DIE,WOUND_WAIT)")
+    parser.add_argument("--isolation", type=_list(str),
+                        default=[IsolationLevel.SNAPSHOT, IsolationLevel.SERIALIZABLE],
+                        help="isolation levels (default SNAPSHOT,SERIALIZABLE)")
+    parser.add_argument("--modes", type=_list(str),
+                        default=[ConcurrencyMode.PESSIMISTIC, ConcurrencyMode.OPTIMISTIC],
+                        help="concurrency modes (default 2PL,OCC)")
+    parser.add_argument("--keys", type=_list(int), default=[10, 1000],
+                        help="sizes of the key range transactions draw from: the contention levels (default 10,1000)")
+    parser.add_argument("--lengths", type=_list(int), default=[1, 8],
+                        help="queries per transaction (default 1,8)")
+    parser.add_argument("--write-ratios", type=_list(float), default=[0.2, 0.8],
+                        help="share of the queries that are updates (default 0.2,0.8)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent TransactionWorkers")
+    parser.add_argument("--transactions", type=int, default=100, help="transactions per worker")
+    parser.add_argument("--records", type=int, default=1000, help="records loaded before running")
+    parser.add_argument("--columns", type=int, default=5, help="columns per record, the key included")
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES,
+                        help="re-runs of an aborted transaction")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+
+
+class PeakRss:
+    """
+    Context manager measuring the process's peak resident set size while its block
+    runs: peak (bytes) and peak - start. On Linux the kernel's high-water mark is
+    reset on entry and read on exit, so nothing is missed; elsewhere a thread
+    samples the RSS, or falls back to the process-wide peak from getrusage.
+    """
+    INTERVAL = 0.001
+
+    def __enter__(self):
+        self.start = self.peak = self._rss()
+        self._sampler = None
+        if not self._reset_high_water_mark():
+            self._stop = threading.Event()
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._sampler is None:
+            self.peak = self._high_water_mark()
+        else:
+            self._stop.set()
+            self._sampler.join()
+            self.peak = max(self.peak, self._rss())
+
+    def _sample(self):
+        while not self._stop.wait(self.INTERVAL):
+            self.peak = max(self.peak, self._rss())
+
+    @staticmethod
+    def _reset_high_water_mark():
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _high_water_mark():
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    @staticmethod
+    def _rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def report(self):
+        return {"peak_bytes": self.peak, "growth_bytes": self.peak - self.start}
+
+
+def _disk_usage(path):
+    """
+    Bytes under path: total, and per kind of file (.tbl, log, spilled pages, other).
+    """
+    usage = {"tables": 0, "wal": 0, "pages": 0, "other": 0}
+    for root, _, files in os.walk(path):
+        for name in files:
+            size = os.path.getsize(os.path.join(root, name))
+            if name.endswith(".tbl"):
+                usage["tables"] += size
+            elif name.startswith("wal.log"):
+                usage["wal"] += size
+            elif name.endswith(".page"):
+                usage["pages"] += size
+            else:
+                usage["other"] += size
+    usage["total"] = sum(usage.values())
+    return usage
+
+
+def run_persistence(args, records, versions):
+    """
+    One point of the persistence sweep, in a scratch directory: build a table of
+    `records` records with `versions` versions each, then time close (serialize and
+    write), open, and recovery after a crash that leaves args.crash_updates logged
+    updates to replay. Returns the report as a dict.
+    """
+    rng = random.Random(args.seed)
+    path = tempfile.mkdtemp(prefix="lstore-bench-", dir=args.dir)
+    try:
+        db = Database()
+        db.open(path)
+        query = Query(db.create_table(TABLE_NAME, args.columns, 0))
+        start = time.perf_counter()
+        for key in range(records):
+            query.insert(key, *(rng.randrange(1000) for _ in range(args.columns - 1)))
+        for _ in range(versions - 1):
+            for key in range(records):
+                query.update(key, None, rng.randrange(1000), *([None] * (args.columns - 2)))
+        build_seconds = time.perf_counter() - start
+
+        gc.collect()
+        with PeakRss() as close_rss:
+            start = time.perf_counter()
+            db.close()
+            close_seconds = time.perf_counter() - start
+        disk = _disk_usage(path)
+        del db, query
+        gc.collect()
+
+        with PeakRss() as open_rss:
+            start = time.perf_counter()
+            db = Database()
+            db.open(path)
+            open_seconds = time.perf_counter() - start
+
+        # crash: commit updates (logged), then stop without persisting the tables
+        query = Query(db.get_table(TABLE_NAME))
+        updates = min(args.crash_updates, records)
+        for key in range(updates):
+            query.update(key, None, -key, *([None] * (args.columns - 2)))
+        if db.wal is not None:
+            db.wal.close()
+        wal_bytes = _disk_usage(path)["wal"]
+        del db, query
+        gc.collect()
+
+        with PeakRss() as recovery_rss:
+            start = time.perf_counter()
+            db = Database()
+            db.open(path)
+            recovery_seconds = time.perf_counter() - start
+        query = Query(db.get_table(TABLE_NAME))
+        recovered = all(query.select(key, 0, [0, 1] + [0] * (args.columns - 2))[0].columns == [-key]
+                        for key in range(0, updates, max(1, updates // 100)))
+        db.close()
+        return {
+            "config": {"records": records, "versions": versions, "columns": args.columns,
+                       "crash_updates": updates, "seed": args.seed},
+            "build_seconds": build_seconds,
+            "close": dict(seconds=close_seconds, **close_rss.report()),
+            "disk_bytes": disk,
+            "bytes_per_record": disk["tables"] / records if records else 0.0,
+            "open": dict(seconds=open_seconds, **open_rss.report()),
+            "recovery": dict(seconds=recovery_seconds, wal_bytes=wal_bytes, recovered=recovered,
+                             **recovery_rss.report()),
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _persistence_summary(report):
+    c = report["config"]
+    return (f"records={c['records']:<8} versions={c['versions']:<3}: close {report['close']['seconds']:.3f}s, "
+            f"{report['disk_bytes']['total'] / 1e6:.1f}MB, open {report['open']['seconds']:.3f}s "
+            f"(+{report['open']['growth_bytes'] / 1e6:.1f}MB RSS), recovery of {c['crash_updates']} updates "
+            f"{report['recovery']['seconds']:.3f}s")
+
+
+def add_persistence_arguments(parser):
+    parser.add_argument("--records", type=_list(int), default=[1000, 10000, 100000],
+                        help="table sizes, comma-separated (default 1000,10000,100000)")
+    parser.add_argument("--versions", type=_list(int), default=[1, 4],
+                        help="versions per record, the insert included (default 1,4)")
+    parser.add_argument("--columns", type=int, default=5, help="columns per record, the key included")
+    parser.add_argument("--crash-updates", type=int, default=10000,
+                        help="updates logged but not persisted before the simulated crash")
+    parser.add_argument("--dir", help="where the scratch databases go (default: the system temp directory)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="L-Store benchmarks. Reports are printed as JSON, "
+                                                 "a one-line summary of each to stderr.")
+    commands = parser.add_subparsers(dest="command")
+    add_ycsb_arguments(commands.add_parser("ycsb", help="YCSB-style workloads A-F (the default)"))
+    add_concurrency_arguments(commands.add_parser(
+        "concurrency", help="committed TPS and abort rates of concurrent TransactionWorkers, sweeping "
+                            "lock policy, isolation, concurrency mode, contention, length and writes"))
+    add_persistence_arguments(commands.add_parser(
+        "persistence", help="close/open time, file size, peak RSS and crash recovery time by table size"))
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv = ["ycsb"] + argv
+    args = parser.parse_args(argv)
+
+    reports = []
+    if args.command == "ycsb":
+        for workload in args.workload.upper():
+            if workload not in WORKLOADS:
+                parser.error(f"unknown workload '{workload}'")
+            reports.append(run_ycsb(args, workload))
+            print(_summary(reports[-1]), file=sys.stderr)
+    elif args.command == "concurrency":
+        for point in itertools.product(args.policies, args.isolation, args.modes, args.keys, args.lengths,
+                                       args.write_ratios):
+            reports.append(run_concurrency(args, *point))
+            print(_concurrency_summary(reports[-1]), file=sys.stderr)
+    elif args.command == "persistence":
+        for records, versions in itertools.product(args.records, args.versions):
+            reports.append(run_persistence(args, records, versions))
+            print(_persistence_summary(reports[-1]), file=sys.stderr)
+    output = json.dumps(reports, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,105 @@
 import collections
+import os
+import shutil
+import tempfile
 import threading
+import time
+from lstore.metrics import Histogram
+from lstore.page import Page
+
+class PoolCounters:
+    """
+    Page access counters, of a whole Bufferpool or of one table's pages.
+    """
+    __slots__ = ("hits", "misses", "evictions", "writebacks")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0  # dirty pages written to disk, on eviction or flush
+
+    def as_dict(self):
+        accesses = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_ratio": self.hits / accesses if accesses else 0.0,
+                "evictions": self.evictions, "writebacks": self.writebacks}
 
 class Bufferpool:
     """
     Simplified bufferpool. 
     Uses an LRU eviction policy by default and 
     a dictionary {page_id -> page} in memory.
+    Pages live in files "<page_id>.page" under `directory`; dirty pages are
+    written back when evicted or flushed.
+    Page ids are "<table name>.<n>"; stats() reports hits, misses, evictions and
+    write-backs overall and per table, and disk read/write latencies.
     """
 
-    def __init__(self, size):
+    def __init__(self, size, directory=None):
         self.size = size
+        self.directory = directory
         self.pages = {}
         self.lru_list = collections.deque()
         self.dirty_pages = set()
         self._lock = threading.Lock()
+        # counters, updated under self._lock
+        self.counters = PoolCounters()
+        self.table_counters = {}    # table name -> PoolCounters
+        self.read_latency = Histogram()
+        self.write_latency = Histogram()
+        self.stats_since = time.monotonic()
+
+    def open(self, directory):
+        """
+        Keep pages under `directory`, emptied first: pages only hold spilled versions,
+        which are written back into the tables when the database is persisted.
+        """
+        with self._lock:
+            self.pages.clear()
+            self.lru_list.clear()
+            self.dirty_pages.clear()
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.makedirs(directory)
+            self.directory = directory
 
     def get_page(self, page_id):
         with self._lock:
-            if page_id in self.pages:
-                # Move to front of LRU
-                self._touch(page_id)
-                return self.pages[page_id]
+            return self._get_page(page_id)
+
+    def _get_page(self, page_id):
+        # caller holds self._lock
+        if page_id in self.pages:
+            # Move to front of LRU
+            self._touch(page_id)
+            self._count("hits", page_id)
+            return self.pages[page_id]
+        self._count("misses", page_id)
+
+        # Evict if needed
+        if len(self.pages) >= self.size:
+            self.evict_page()
+
+        page = self.load_from_disk(page_id)
+        self.pages[page_id] = page
+        self.lru_list.appendleft(page_id)
+        return page
 
-            # Evict if needed
-            if len(self.pages) >= self.size:
-                self.evict_page()
+    def read_values(self, page_id, slot, count):
+        """
+        The `count` integers stored from `slot` on page_id.
+        """
+        with self._lock:
+            return self._get_page(page_id).read_many(slot, count)
 
-            # "Load" page from disk (stub)
-            page = self.load_from_disk(page_id)
-            self.pages[page_id] = page
-            self.lru_list.appendleft(page_id)
-            return page
+    def write_values(self, page_id, slot, values):
+        """
+        Store integers from `slot` on page_id; the page becomes dirty.
+        """
+        with self._lock:
+            self._get_page(page_id).write_many(slot, values)
+            self.dirty_pages.add(page_id)
 
     def mark_dirty(self, page_id):
         with self._lock:
@@ -40,17 +109,79 @@ class Bufferpool:
         if not self.lru_list:
             return
         page_id = self.lru_list.pop()
+        self._count("evictions", page_id)
         if page_id in self.dirty_pages:
             self.write_to_disk(page_id)
             self.dirty_pages.remove(page_id)
         del self.pages[page_id]
 
+    def flush(self):
+        """
+        Write every dirty page back to disk.
+        """
+        with self._lock:
+            for page_id in list(self.dirty_pages):
+                self.write_to_disk(page_id)
+            self.dirty_pages.clear()
+
+    def _page_path(self, page_id):
+        if self.directory is None:
+            # not opened on a database path: spill to a private temporary directory
+            self.directory = tempfile.mkdtemp(prefix="lstore-pages-")
+        return os.path.join(self.directory, f"{page_id}.page")
+
     def load_from_disk(self, page_id):
-        # Stub
-        return f"Page-{page_id}"
+        path = self._page_path(page_id)
+        if not os.path.exists(path):
+            return Page()
+        start = time.perf_counter_ns()
+        with open(path, "rb") as f:
+            page = Page(bytearray(f.read()))
+        self.read_latency.record(time.perf_counter_ns() - start)
+        return page
 
     def write_to_disk(self, page_id):
-        print(f"Writing Page-{page_id} to disk.")
+        start = time.perf_counter_ns()
+        with open(self._page_path(page_id), "wb") as f:
+            f.write(self.pages[page_id].data)
+        self.write_latency.record(time.perf_counter_ns() - start)
+        self._count("writebacks", page_id)
+
+    def _count(self, counter, page_id):
+        # caller holds self._lock
+        setattr(self.counters, counter, getattr(self.counters, counter) + 1)
+        table_name = page_id.rsplit(".", 1)[0] if isinstance(page_id, str) else None
+        counters = self.table_counters.get(table_name)
+        if counters is None:
+            counters = self.table_counters[table_name] = PoolCounters()
+        setattr(counters, counter, getattr(counters, counter) + 1)
+
+    def stats(self):
+        """
+        Snapshot of the counters since the pool was created (or reset_stats): hit
+        ratio, evictions (and per second), dirty pages now resident and write-backs,
+        disk read/write latencies in microseconds, and the counters of each table.
+        """
+        with self._lock:
+            stats = self.counters.as_dict()
+            elapsed = time.monotonic() - self.stats_since
+            stats["evictions_per_sec"] = stats["evictions"] / elapsed if elapsed else 0.0
+            stats["capacity"] = self.size
+            stats["resident"] = len(self.pages)
+            stats["dirty"] = len(self.dirty_pages)
+            stats["dirty_ratio"] = len(self.dirty_pages) / len(self.pages) if self.pages else 0.0
+            stats["tables"] = {name: counters.as_dict() for name, counters in self.table_counters.items()}
+        stats["read_latency"] = self.read_latency.snapshot()
+        stats["write_latency"] = self.write_latency.snapshot()
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self.counters = PoolCounters()
+            self.table_counters = {}
+            self.stats_since = time.monotonic()
+        self.read_latency.clear()
+        self.write_latency.clear()
 
     def _touch(self, page_id):
         # Move page_id to front of LRU
@@ -0,0 +1,204 @@
+import itertools
+import queue
+import socket
+import threading
+from lstore.multiprocess import PartitionedQuery, PartitionedTransaction
+from lstore.server import FRAME_HEADER, pack_frame, unpack_frame
+
+
+class RemoteTransaction(PartitionedTransaction):
+    """
+    A transaction for a Client, with queries described by table name, operation name
+    and arguments:
+
+        t = RemoteTransaction()
+        t.add_query("Grades", "update", key, None, 5, None, None, None)
+
+    After running, self.results holds each query's return value in order.
+    """
+
+
+class RemoteQuery(PartitionedQuery):
+    """
+    Query-like interface for one table on a server.
+    Each call runs as its own single-query transaction; returns False if it aborts.
+    """
+
+
+class Connection:
+    """
+    One socket to a server. Not thread-safe: Client hands each connection to one
+    thread at a time.
+    """
+
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.connect(address)
+        self._ids = itertools.count(1)
+        self._replies = {}  # request_id -> reply read ahead of its turn
+        self._buffer = bytearray()
+
+    def send(self, kind, body):
+        """
+        Send a request without waiting for the reply; returns its request id.
+        """
+        request_id = next(self._ids)
+        self.sock.sendall(pack_frame([request_id, kind, body]))
+        return request_id
+
+    def reply(self, request_id):
+        """
+        Wait for the reply to request_id, buffering replies to other requests.
+        Raises RuntimeError if the server reported an error.
+        """
+        while request_id not in self._replies:
+            reply_id, status, payload = self._read_frame()
+            self._replies[reply_id] = (status, payload)
+        status, payload = self._replies.pop(request_id)
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def _read_frame(self):
+        while True:
+            if len(self._buffer) >= FRAME_HEADER.size:
+                size = FRAME_HEADER.unpack_from(self._buffer)[0]
+                end = FRAME_HEADER.size + size
+                if len(self._buffer) >= end:
+                    frame = bytes(self._buffer[FRAME_HEADER.size:end])
+                    del self._buffer[:end]
+                    return unpack_frame(frame)
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            self._buffer += chunk
+
+    def close(self):
+        self.sock.close()
+
+
+class Client:
+    """
+    Client of an lstore server (see lstore.server), with a pool of up to pool_size
+    connections shared by the calling threads.
+    `address` is a Unix socket path or a (host, port) pair.
+    """
+
+    def __init__(self, address, pool_size=4):
+        self.address = address
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                grow = True
+            else:
+                grow = False
+        if grow:
+            try:
+                return Connection(self.address)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return self._idle.get()
+
+    def _release(self, conn):
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self._opened -= 1
+
+    def _request(self, kind, body):
+        conn = self._acquire()
+        try:
+            result = conn.reply(conn.send(kind, body))
+        except (OSError, ConnectionError):
+            self._discard(conn)
+            raise
+        except Exception:
+            self._release(conn)
+            raise
+        self._release(conn)
+        return result
+
+    def create_table(self, name, num_columns, key_index, partitioning=None):
+        self._request("create_table", [name, num_columns, key_index, partitioning])
+        return RemoteQuery(self, name)
+
+    def drop_table(self, name):
+        self._request("drop_table", [name])
+
+    def get_table(self, name):
+        if name not in self.tables():
+            raise RuntimeError(f"Table '{name}' not found. Did you create it or load it from disk?")
+        return RemoteQuery(self, name)
+
+    def tables(self):
+        """
+        {name: (num_columns, key)} of the server's tables.
+        """
+        return {name: (num_columns, key) for name, num_columns, key in self._request("tables", [])}
+
+    def run(self, txn):
+        """
+        Run one RemoteTransaction. Returns True if it committed.
+        """
+        committed, results = self._request("run", txn.queries)
+        if committed:
+            txn.results = results
+        return committed
+
+    def run_all(self, transactions, batch_size=None):
+        """
+        Run many transactions, pipelined: they are sent in "batch" requests of
+        batch_size transactions (all in one if None) before any reply is awaited.
+        Transactions in a call are concurrent: no order between them is guaranteed.
+        Returns a list of booleans (committed or not), one per transaction.
+        """
+        transactions = list(transactions)
+        size = batch_size or max(1, len(transactions))
+        batches = [transactions[i:i + size] for i in range(0, len(transactions), size)]
+        conn = self._acquire()
+        try:
+            ids = [conn.send("batch", [txn.queries for txn in batch]) for batch in batches]
+            outcomes = []
+            for batch, request_id in zip(batches, ids):
+                for txn, (committed, results) in zip(batch, conn.reply(request_id)):
+                    if committed:
+                        txn.results = results
+                    outcomes.append(committed)
+        except (OSError, ConnectionError):
+            self._discard(conn)
+            raise
+        except Exception:
+            self._release(conn)
+            raise
+        self._release(conn)
+        return outcomes
+
+    def close(self):
+        """
+        Close the pooled connections. The server keeps running.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
@@ -2,8 +2,28 @@ PAGE_SIZE = 4096              # bytes per page
 NUM_COLS_LIMIT = 16           # just an example
 FRAME_CAPACITY = 8            # how many pages can be in memory at once
 BACKGROUND_MERGE = True       # toggles background merge
+RID_BLOCK_SIZE = 256          # RIDs a thread reserves from a table at a time
+VERSION_RETENTION = 2         # tail versions kept behind the newest for select_version
 REPLACEMENT_POLICY = 'LRU'    # for the bufferpool
+MEMORY_BUDGET = None          # bytes all tables of a Database may hold before old versions spill to disk (None = no limit)
+TABLE_MEMORY_BUDGET = None    # default per-table budget, likewise
 DATA_PATH = "./data"          # directory to store table files
+ENABLE_WAL = True             # log commits to <db path>/wal.log; replayed by open()
+WAL_FSYNC = False             # fsync every commit (durable across power loss, not just crashes)
+REPLICA_MAX_STALENESS = 0.1   # seconds a Replica read may lag the writer's log
+BULK_READ_ROWS = 4096         # records Table.bulk_load reads from a binary file at a time
+BULK_LOG_ROWS = 10000         # records per log record when a bulk load is logged
+ENABLE_METRICS = False        # default for Database(metrics=...): per-operation latencies, commit/abort counts
 
 # For concurrency
 ENABLE_CONCURRENCY = True
+LOCK_STRIPES = 64             # mutexes the lock table is striped across (by RID hash)
+LOCK_POLICY = 'NO_WAIT'       # on conflict: 'NO_WAIT', 'WAIT_DIE' or 'WOUND_WAIT'
+LOCK_WAIT_TIMEOUT = 5.0       # seconds a waiting lock request may block before giving up (None = forever)
+LOCK_ESCALATION_THRESHOLD = 1000  # row locks a transaction takes in one table before escalating to a table lock
+ISOLATION_LEVEL = 'SNAPSHOT'  # 'SNAPSHOT' (lock-free MVCC reads) or 'SERIALIZABLE' (shared read locks)
+CONCURRENCY_MODE = '2PL'      # '2PL' (lock as you go) or 'OCC' (buffer writes, validate at commit)
+MAX_RETRIES = 10              # times a TransactionWorker re-runs an aborted transaction
+RETRY_BACKOFF_BASE = 0.001    # seconds; backoff doubles per retry, with full jitter
+RETRY_BACKOFF_MAX = 0.1       # cap on a single backoff
+MAX_IN_FLIGHT = 256           # requests a PartitionedDatabase leaves unanswered per partition before reading replies
@@ -1,34 +1,84 @@
 import os
+import sys
+import threading
+import time
+from array import array
 import msgpack
+from lstore.config import LOCK_POLICY, ISOLATION_LEVEL, CONCURRENCY_MODE, ENABLE_WAL, MEMORY_BUDGET, ENABLE_METRICS, BULK_LOG_ROWS
 from lstore.table import Table
+from lstore.partition import PartitionedTable
 from lstore.bufferpool import Bufferpool
 from lstore.index import Index
 from lstore.page import Page
 from lstore.query import Query
 from lstore.lock_manager import LockManager
+from lstore.metrics import Metrics
+from lstore.tracing import Tracer, SamplingProfiler, MAX_EVENTS
+from lstore.wal import WriteAheadLog
+
+WAL_FILE = "wal.log"
 
 class Database:
     """
     Database interface to manage tables, transactions, and persistence.
     """
 
-    def __init__(self, bufferpool_size=10):
+    def __init__(self, bufferpool_size=10, lock_policy=LOCK_POLICY, isolation_level=ISOLATION_LEVEL,
+                 concurrency_mode=CONCURRENCY_MODE, memory_budget=MEMORY_BUDGET, metrics=ENABLE_METRICS):
         self.tables = {}
         self.db_path = None
+        # pages holding versions spilled to stay within memory_budget bytes (see Table.spill)
         self.bufferpool = Bufferpool(bufferpool_size)
-        # Single global lock manager for concurrency
-        self.lock_manager = LockManager()
+        self.memory_budget = memory_budget
+        # Single global lock manager for concurrency; lock_policy is a LockPolicy value
+        self.lock_manager = LockManager(lock_policy, track_contention=metrics)
         self._next_txn_id = 0
+        # Logical clock stamped on every version, and the start timestamp of each running transaction
+        self._clock = 0
+        self.active_transactions = {}   # tid -> start timestamp
+        self._txn_lock = threading.Lock()
+        # How transactions read (an IsolationLevel value), and the undo log of each running
+        # transaction, appended as its queries execute: tid -> [entry, ...] (see log_undo)
+        self.isolation_level = isolation_level
+        self.undo_logs = {}
+        # Default ConcurrencyMode for transactions, the OptimisticState of each running
+        # optimistic transaction (tid -> state), and the lock serializing their validation
+        self.concurrency_mode = concurrency_mode
+        self.optimistic = {}
+        # why a running transaction is about to abort, when it is not the query that
+        # failed but a lock it could not get: tid -> reason (see Transaction.abort)
+        self._blame = {}
+        self._commit_lock = threading.Lock()
+        # Redo log of committed changes, while open (see WriteAheadLog)
+        self.wal = None
+        # Latency histograms and transaction counters, or None when metrics are off.
+        # Only Queries created once it is set are timed.
+        self.metrics = Metrics() if metrics else None
+        # Spans of running transactions while tracing (see start_tracing), else None
+        self.tracer = None
 
     def open(self, path):
         """
         Open the database at 'path'. If the directory does not exist, create it.
-        Then load all tables (files ending in ".tbl") and reset their versions.
+        Then load all tables (files ending in ".tbl") and reset their versions,
+        and replay the changes logged since they were last persisted.
         """
         self.db_path = path
         if not os.path.exists(path):
             os.makedirs(path)
-        self.tables = {}
+        self.bufferpool.open(os.path.join(path, "pages"))
+        self.tables = self.load_tables(path)
+        if ENABLE_WAL:
+            self.wal = WriteAheadLog(os.path.join(path, WAL_FILE))
+            self.replay(self.wal.recover())
+
+    def load_tables(self, path, reset_versions=True):
+        """
+        Read the tables persisted in 'path', attached to this database: {name: table}.
+        With reset_versions, each record keeps only its original version (as open()
+        does), otherwise every persisted version.
+        """
+        tables = {}
         for filename in os.listdir(path):
             if filename.endswith(".tbl"):
                 file_path = os.path.join(path, filename)
@@ -40,27 +90,119 @@ class Database:
                         data, raw=False, ext_hook=ext_hook, strict_map_key=False
                     )
                     table.db = self
-                    # Reset the table so that each record has exactly one (original) version.
-                    table.reset_versions()
-                    self.tables[table.name] = table
+                    if reset_versions:
+                        # Reset the table so that each record has exactly one (original) version.
+                        table.reset_versions()
+                    tables[table.name] = table
+        return tables
 
     def close(self):
         """
-        Persist all tables to disk by writing each table's data to a .tbl file.
+        Persist all tables to disk by writing each table's data to a .tbl file,
+        then empty the log: everything in it is now in the tables.
         """
         if not self.db_path:
             raise ValueError("Database path is not set.")
         for table_name, table in self.tables.items():
             file_path = os.path.join(self.db_path, f"{table_name}.tbl")
-            with open(file_path, "wb") as f:
+            # write aside and rename, so a crash (or a replica reading) never sees half a table
+            with open(file_path + ".tmp", "wb") as f:
                 data = msgpack.packb(table, use_bin_type=True, default=custom_default)
                 f.write(data)
+            os.replace(file_path + ".tmp", file_path)
+        if self.wal is not None:
+            self.wal.checkpoint()
+
+    def replay(self, records):
+        """
+        Apply logged (timestamp, changes) records, oldest first: crash recovery, and
+        replicas catching up with the writer's log.
+        """
+        tables = self._log_targets()
+        touched = set()
+        for ts, changes in records:
+            if isinstance(changes, dict):
+                self._replay_schema(changes["op"], changes["table"], changes["args"])
+                tables = self._log_targets()
+                continue
+            for table_name, rid, version in changes:
+                table = tables.get(table_name)
+                if table is not None:
+                    table.apply_redo(rid, version, ts)
+                    touched.add(table)
+            self._clock = max(self._clock, ts)
+        for table in touched:
+            if table.over_memory_budget():
+                table.start_background_merge()
+
+    def memory_estimate(self):
+        """
+        Running estimate of the bytes all tables hold in memory (see Table.memory_estimate).
+        """
+        return sum(table.memory_estimate() for table in list(self.tables.values()))
+
+    def over_memory_budget(self):
+        return self.memory_budget is not None and self.memory_estimate() > self.memory_budget
+
+    def stats(self, reset=False):
+        """
+        Per-operation latencies (microseconds), transaction commits, aborts by
+        reason and retries, lock contention (see LockManager.contention) and
+        bufferpool counters (see Bufferpool.stats);
+        None if the database was created without metrics.
+        With reset, the counters start over afterwards.
+        """
+        if self.metrics is None:
+            return None
+        stats = self.metrics.snapshot()
+        stats["locks"] = self.lock_manager.contention()
+        stats["bufferpool"] = self.bufferpool.stats()
+        if reset:
+            self.metrics.reset()
+            self.lock_manager.reset_contention()
+            self.bufferpool.reset_stats()
+        return stats
+
+    def start_tracing(self, max_events=MAX_EVENTS, profile_interval=None):
+        """
+        Record a span for each phase of every transaction from now on (see Tracer).
+        With profile_interval (seconds), a SamplingProfiler also attributes CPU
+        to Query methods meanwhile.
+        """
+        tracer = Tracer(max_events)
+        if profile_interval:
+            tracer.profiler = SamplingProfiler(profile_interval)
+            tracer.profiler.start()
+        self.tracer = tracer
+        return tracer
+
+    def stop_tracing(self, path=None):
+        """
+        Stop recording; with a path, write the trace there as Chrome trace JSON.
+        Returns the Tracer.
+        """
+        tracer, self.tracer = self.tracer, None
+        if tracer is not None:
+            if tracer.profiler is not None:
+                tracer.profiler.stop()
+            if path:
+                tracer.export(path)
+        return tracer
 
-    def create_table(self, name, num_columns, key_index):
+    def create_table(self, name, num_columns, key_index, partitioning=None):
         """
         Create a new table and attach it to this database.
+        With a partitioning spec, such as ("hash", 4) or ("range", [1000, 2000]),
+        the table is split on its key column (see PartitionedTable).
         """
-        table = Table(name, num_columns, key_index)
+        self.log_schema("create_table", name, num_columns, key_index, partitioning)
+        return self._create_table(name, num_columns, key_index, partitioning)
+
+    def _create_table(self, name, num_columns, key_index, partitioning):
+        if partitioning is None:
+            table = Table(name, num_columns, key_index)
+        else:
+            table = PartitionedTable(name, num_columns, key_index, partitioning)
         table.db = self
         self.tables[name] = table
         return table
@@ -70,8 +212,12 @@ class Database:
         Remove a table from memory and delete its file from disk.
         """
         if name in self.tables:
+            self.log_schema("drop_table", name)
             del self.tables[name]
-            os.remove(os.path.join(self.db_path, f"{name}.tbl"))
+            if self.db_path:
+                file_path = os.path.join(self.db_path, f"{name}.tbl")
+                if os.path.exists(file_path):
+                    os.remove(file_path)
 
     def get_table(self, name):
         """
@@ -83,8 +229,185 @@ class Database:
         return tbl
 
     def get_next_txn_id(self):
-        self._next_txn_id += 1
-        return self._next_txn_id
+        with self._txn_lock:
+            self._next_txn_id += 1
+            return self._next_txn_id
+
+    def next_timestamp(self):
+        """
+        Advance the logical clock and return the new timestamp.
+        """
+        with self._txn_lock:
+            self._clock += 1
+            return self._clock
+
+    def begin_transaction(self, transaction):
+        """
+        Register a transaction as active. Assigns it an id if it has none, and a start
+        timestamp: every version written so far is visible to it.
+        """
+        with self._txn_lock:
+            if transaction.tid == -1:
+                self._next_txn_id += 1
+                transaction.tid = self._next_txn_id
+            transaction.start_ts = self._clock
+            self.active_transactions[transaction.tid] = self._clock
+
+    def _log_targets(self):
+        # tables by the name their changes are logged under (partitions by their own)
+        tables = {}
+        for table in self.tables.values():
+            for part in (table.partitions if isinstance(table, PartitionedTable) else [table]):
+                tables[part.name] = part
+        return tables
+
+    def _replay_schema(self, op, name, args):
+        if op == "create_table":
+            if name not in self.tables:
+                self._create_table(name, *args)
+        elif op == "drop_table":
+            self.tables.pop(name, None)
+        else:
+            table = self._log_targets().get(name)
+            if table is None:
+                return
+            if op == "create_index":
+                table.index._build(*args)
+            elif op == "drop_index":
+                table.index.secondary_indexes.pop(args[0], None)
+
+    def log_schema(self, op, table_name, *args):
+        """
+        Log a schema change (create_table, drop_table, create_index, drop_index of
+        table_name with args), so recovery and replicas replay it.
+        """
+        if self.wal is not None:
+            self.wal.append(self._clock, {"op": op, "table": table_name, "args": list(args)})
+
+    def end_transaction(self, transaction):
+        with self._txn_lock:
+            self.active_transactions.pop(transaction.tid, None)
+        self._blame.pop(transaction.tid, None)
+
+    def blame(self, tid, reason):
+        """
+        Note why transaction tid is about to fail, for when it aborts.
+        """
+        self._blame[tid] = reason
+
+    def abort_reason(self, tid, reason):
+        """
+        Why transaction tid aborts: the reason it was blamed for, if any, else `reason`.
+        """
+        return self._blame.pop(tid, reason)
+
+    def log_undo(self, tid, entry):
+        """
+        Append an undo entry for a change transaction tid made. Entries are tuples:
+          ("insert", table, rid)
+          ("update", table, rid, [(col, old value, new value) for each changed indexed column])
+          ("delete", table, rid)
+        Each leaves a pending version (stamped -tid) on rid's chain, a delete a
+        tombstone (None) that commit_versions replaces by removing the record.
+        """
+        self.undo_logs.setdefault(tid, []).append(entry)
+
+    def log_autocommit(self, table, rid):
+        """
+        Log a change made outside any transaction (visible at once) to rid.
+        """
+        if self.wal is not None:
+            self.wal.append(self._clock, [[table.name, rid, _row_image(table, rid)]])
+
+    def log_bulk_load(self, table, timestamp, first_rid, versions):
+        """
+        Log the records bulk-loaded into table under RIDs first_rid, first_rid + 1, ...,
+        BULK_LOG_ROWS per log record.
+        """
+        if self.wal is None:
+            return
+        for start in range(0, len(versions), BULK_LOG_ROWS):
+            batch = versions[start:start + BULK_LOG_ROWS]
+            self.wal.append(timestamp, [[table.name, rid, list(version)]
+                                        for rid, version in enumerate(batch, first_rid + start)])
+
+    def commit_versions(self, tid):
+        """
+        Stamp every version tid wrote with one commit timestamp, making them visible
+        to transactions that start afterwards. The log is written first, outside the
+        clock lock, so concurrent commits share its fsyncs. The commit timestamp is
+        only taken then, under the lock, for the stamping: no transaction can start
+        between the first and the last stamp, and every one that starts after this
+        returns sees the commit.
+        """
+        log = self.undo_logs.pop(tid, None)
+        if not log:
+            return
+        pending = -tid
+        if self.wal is not None:
+            # final image of every row changed, logged before it becomes visible
+            changed = dict.fromkeys((entry[1], entry[2]) for entry in log)
+            tracer = self.tracer
+            start = time.perf_counter_ns() if tracer is not None else 0
+            self.wal.append(self._clock, [[table.name, rid, _row_image(table, rid)]
+                                          for table, rid in changed])
+            if tracer is not None:
+                tracer.span("log_flush", start, time.perf_counter_ns(), tid=tid, rows=len(changed))
+        with self._txn_lock:
+            self._clock += 1
+            commit_ts = self._clock
+            stamped = set()
+            deleted = []
+            for entry in log:
+                kind, table, rid = entry[0], entry[1], entry[2]
+                if kind == "delete":
+                    deleted.append((table, rid))
+                if (table, rid) in stamped:
+                    continue
+                stamped.add((table, rid))
+                timestamps = table.rid_to_timestamps.get(rid, ())
+                for idx in range(len(timestamps) - 1, -1, -1):
+                    if timestamps[idx] != pending:
+                        break
+                    timestamps[idx] = commit_ts
+            # now that the tombstones are stamped, no snapshot taken from here on sees them
+            for table, rid in deleted:
+                table.remove_record(rid)
+
+    def rollback_versions(self, tid):
+        """
+        Undo tid's changes, newest first: drop the versions (and tombstones) it wrote,
+        revert its index changes and remove the records it inserted.
+        Costs O(changes made), whatever the size of the records.
+        """
+        log = self.undo_logs.pop(tid, None)
+        if not log:
+            return
+        pending = -tid
+        for entry in reversed(log):
+            kind, table, rid = entry[0], entry[1], entry[2]
+            if kind == "update":
+                table.undo_update(rid, pending, entry[3])
+            elif kind == "insert":
+                table.undo_insert(rid)
+            elif kind == "delete":
+                table.undo_delete(rid, pending)
+
+    def oldest_active_timestamp(self):
+        """
+        Start timestamp of the oldest running transaction, or None if nothing is running.
+        Versions older than what this transaction can see are eligible for garbage collection.
+        """
+        with self._txn_lock:
+            if not self.active_transactions:
+                return None
+            return min(self.active_transactions.values())
+
+
+def _row_image(table, rid):
+    # newest version of rid as a plain list for the log, None if it was deleted
+    version = table.get_latest_version(rid)
+    return list(version) if version is not None else None
 
 
 # --- Serialization Helpers ---
@@ -94,6 +417,8 @@ EXT_CODE_PAGE   = 2
 EXT_CODE_QUERY  = 3
 EXT_CODE_RECORD = 4
 EXT_CODE_TABLE  = 5
+EXT_CODE_PARTITIONED_TABLE = 6
+EXT_CODE_ARRAY  = 7
 
 def custom_default(obj):
     from lstore.index import Index
@@ -115,14 +440,27 @@ def custom_default(obj):
         packed_state = msgpack.packb(state, use_bin_type=True)
         return msgpack.ExtType(EXT_CODE_QUERY, packed_state)
     elif isinstance(obj, Record):
-        state = obj.__dict__
+        state = {"rid": obj.rid, "key": obj.key, "columns": obj.columns}
         packed_state = msgpack.packb(state, use_bin_type=True)
         return msgpack.ExtType(EXT_CODE_RECORD, packed_state)
     elif isinstance(obj, Table):
-        state = obj.__dict__.copy()
-        state.pop("db", None)
+        # underscore attributes are runtime state (locks, GC bookkeeping) rebuilt by Table()
+        state = {k: getattr(obj, k) for k in Table.__slots__ if k != "db" and not k.startswith("_")}
+        # persisted tables hold every version in full
+        state["rid_to_versions"] = obj.resolved_versions()
         packed_state = msgpack.packb(state, use_bin_type=True, default=custom_default)
         return msgpack.ExtType(EXT_CODE_TABLE, packed_state)
+    elif isinstance(obj, PartitionedTable):
+        state = {"name": obj.name, "num_columns": obj.num_columns, "key": obj.key,
+                 "partitioning": obj.partitioning, "partitions": obj.partitions}
+        packed_state = msgpack.packb(state, use_bin_type=True, default=custom_default)
+        return msgpack.ExtType(EXT_CODE_PARTITIONED_TABLE, packed_state)
+    elif isinstance(obj, array):
+        # typecode, then the items little-endian
+        if sys.byteorder == "big":
+            obj = array(obj.typecode, obj)
+            obj.byteswap()
+        return msgpack.ExtType(EXT_CODE_ARRAY, obj.typecode.encode() + obj.tobytes())
     return None
 
 def ext_hook(code, data):
@@ -147,12 +485,25 @@ def ext_hook(code, data):
         return q
     elif code == EXT_CODE_RECORD:
         state = msgpack.unpackb(data, raw=False, strict_map_key=False)
-        record = Record(0, None, None)
-        record.__dict__.update(state)
-        return record
+        return Record(state.get("rid"), state.get("key"), state.get("columns"))
     elif code == EXT_CODE_TABLE:
         state = msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=ext_hook)
         tbl = Table(state["name"], state["num_columns"], state["key"])
-        tbl.__dict__.update(state)
+        for k, v in state.items():
+            if k in Table.__slots__:
+                setattr(tbl, k, v)
+        tbl.index.table = tbl
+        tbl._resident_tail = sum(len(versions) - 1 for versions in tbl.rid_to_versions.values())
+        return tbl
+    elif code == EXT_CODE_PARTITIONED_TABLE:
+        state = msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=ext_hook)
+        tbl = PartitionedTable(state["name"], state["num_columns"], state["key"], state["partitioning"])
+        tbl.partitions = state["partitions"]
         return tbl
+    elif code == EXT_CODE_ARRAY:
+        arr = array(data[:1].decode())
+        arr.frombytes(data[1:])
+        if sys.byteorder == "big":
+            arr.byteswap()
+        return arr
     return None
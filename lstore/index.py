@@ -2,7 +2,9 @@ class Index:
     def __init__(self, table):
         self.table = table
         self.pk_index = {}            # pk_value -> rid
-        self.secondary_indexes = {}   # col_id -> { value -> [rids] }
+        # col_id -> { value -> [rids] }: a record is listed under the value of each version
+        # it retains, so snapshot readers find it by the value they see (they filter on it)
+        self.secondary_indexes = {}
 
     def create_index(self, column_number):
         """
@@ -11,12 +13,24 @@ class Index:
         """
         if column_number == self.table.key:
             return  # already have a primary key index
+        self._build(column_number)
+        self._log("create_index", column_number)
 
-        self.secondary_indexes[column_number] = {}
-        for rid, versions in self.table.rid_to_versions.items():
-            newest = versions[-1]
-            val = newest[column_number]
-            self.secondary_indexes[column_number].setdefault(val, []).append(rid)
+    def _build(self, column_number):
+        dct = self.secondary_indexes[column_number] = {}
+        for rid, versions in list(self.table.rid_to_versions.items()):
+            for version in self.table.live_versions(versions):
+                rids = dct.setdefault(version[column_number], [])
+                if not rids or rids[-1] != rid:
+                    rids.append(rid)
+
+    def add(self, column_number, value, rid):
+        """
+        List rid under value in column_number's index, if it is not already.
+        """
+        rids = self.secondary_indexes[column_number].setdefault(value, [])
+        if rid not in rids:
+            rids.append(rid)
 
     def locate(self, column_number, value):
         """
@@ -30,3 +44,10 @@ class Index:
     def drop_index(self, column_number):
         if column_number in self.secondary_indexes:
             del self.secondary_indexes[column_number]
+            self._log("drop_index", column_number)
+
+    def _log(self, op, column_number):
+        # in the database's log, so recovery and replicas have the index too
+        db = self.table.db
+        if db is not None:
+            db.log_schema(op, self.table.name, column_number)
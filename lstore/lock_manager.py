@@ -1,99 +1,492 @@
+import heapq
 import threading
-from collections import defaultdict
+import time
+from collections import deque
+from lstore.config import LOCK_STRIPES, LOCK_POLICY, LOCK_WAIT_TIMEOUT, LOCK_ESCALATION_THRESHOLD
+from lstore.metrics import Histogram
 
 class LockMode:
     SHARED = "SHARED"
     EXCLUSIVE = "EXCLUSIVE"
+    # table-level intention modes: the transaction locks rows of the table in S (IS) or X (IX),
+    # or reads the whole table and writes some rows (SIX)
+    INTENTION_SHARED = "IS"
+    INTENTION_EXCLUSIVE = "IX"
+    SHARED_INTENTION_EXCLUSIVE = "SIX"
+
+# which table lock modes can be held together by different transactions
+_COMPATIBLE = {
+    LockMode.INTENTION_SHARED: {LockMode.INTENTION_SHARED, LockMode.INTENTION_EXCLUSIVE,
+                                LockMode.SHARED, LockMode.SHARED_INTENTION_EXCLUSIVE},
+    LockMode.INTENTION_EXCLUSIVE: {LockMode.INTENTION_SHARED, LockMode.INTENTION_EXCLUSIVE},
+    LockMode.SHARED: {LockMode.INTENTION_SHARED, LockMode.SHARED},
+    LockMode.SHARED_INTENTION_EXCLUSIVE: {LockMode.INTENTION_SHARED},
+    LockMode.EXCLUSIVE: set(),
+}
+
+# modes each table lock mode is at least as strong as
+_IMPLIES = {
+    LockMode.INTENTION_SHARED: {LockMode.INTENTION_SHARED},
+    LockMode.INTENTION_EXCLUSIVE: {LockMode.INTENTION_SHARED, LockMode.INTENTION_EXCLUSIVE},
+    LockMode.SHARED: {LockMode.INTENTION_SHARED, LockMode.SHARED},
+    LockMode.SHARED_INTENTION_EXCLUSIVE: {LockMode.INTENTION_SHARED, LockMode.INTENTION_EXCLUSIVE,
+                                          LockMode.SHARED, LockMode.SHARED_INTENTION_EXCLUSIVE},
+    LockMode.EXCLUSIVE: set(_COMPATIBLE),
+}
+
+def _combine(held, requested):
+    """
+    The weakest table lock mode at least as strong as both `held` and `requested` (upgrades).
+    """
+    if held is None or requested in _IMPLIES[held]:
+        return held if held is not None else requested
+    if held in _IMPLIES[requested]:
+        return requested
+    # the remaining incomparable pair is S + IX
+    return LockMode.SHARED_INTENTION_EXCLUSIVE
+
+class LockPolicy:
+    """
+    What a conflicting lock request does. Transaction ids double as ages
+    (a smaller id is an older transaction), which keeps both waiting policies deadlock-free.
+    - NO_WAIT: fail immediately.
+    - WAIT_DIE: an older requester waits, a younger one fails ("dies").
+    - WOUND_WAIT: an older requester wounds younger holders (they fail their next
+      lock request and abort) and waits; a younger requester waits.
+    """
+    NO_WAIT = "NO_WAIT"
+    WAIT_DIE = "WAIT_DIE"
+    WOUND_WAIT = "WOUND_WAIT"
+    ALL = (NO_WAIT, WAIT_DIE, WOUND_WAIT)
+
+class LockEntry:
+    """
+    The lock on one key: its mode (row locks), its holders (a set of txn ids for
+    a row, {txn_id -> LockMode} for a table) and, once anyone waited, the
+    waiters as a deque of (txn_id, wakeup Event).
+    """
+    __slots__ = ("lock_mode", "holders", "waiters")
+
+    def __init__(self, lock_mode, holders):
+        self.lock_mode = lock_mode
+        self.holders = holders
+        self.waiters = None
+
+class LockStats:
+    """
+    Contention counters of a LockManager created with track_contention=True
+    (see LockManager.contention for the report):
+    - conflicts = { key -> conflicting requests }, keys as in rid_locks / table_locks
+    - requests, refused (returned False), upgrade_failures (refused while the
+      transaction already held the key in a weaker mode), wounds, escalations
+    - hold times of row and table locks, from first grant to release, and time
+      blocked waiting for a lock
+    - per stripe mutex: acquisitions that found it taken and the time spent getting it
+    """
+
+    def __init__(self, num_stripes):
+        self.row_hold = Histogram()
+        self.table_hold = Histogram()
+        self.lock_wait = Histogram()
+        self.stripe_wait = Histogram()
+        self.stripe_contended = [0] * num_stripes
+        self.granted = {}   # (txn_id, key) -> time of the first grant, in ns
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Start the counters over (locks held now still report their full hold time).
+        """
+        with self._lock:
+            self.conflicts = {}
+            self.requests = 0
+            self.refused = 0
+            self.upgrade_failures = 0
+            self.wounds = 0
+            self.escalations = 0
+            self.stripe_acquisitions = 0
+            self.stripe_contended[:] = [0] * len(self.stripe_contended)
+        for histogram in (self.row_hold, self.table_hold, self.lock_wait, self.stripe_wait):
+            histogram.clear()
+
+    def grant(self, transaction_id, key):
+        self.granted.setdefault((transaction_id, key), time.perf_counter_ns())
+        with self._lock:
+            self.requests += 1
+
+    def conflict(self, key):
+        with self._lock:
+            self.conflicts[key] = self.conflicts.get(key, 0) + 1
+
+    def refuse(self, upgrade):
+        with self._lock:
+            self.requests += 1
+            self.refused += 1
+            if upgrade:
+                self.upgrade_failures += 1
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def release(self, transaction_id, key, histogram):
+        start = self.granted.pop((transaction_id, key), None)
+        if start is not None:
+            histogram.record(time.perf_counter_ns() - start)
+
+
+class _TimedStripe:
+    """
+    A stripe mutex that counts how often it is found taken and how long getting it
+    then takes. Only used when contention is tracked.
+    """
+    __slots__ = ("_lock", "_index", "_stats")
+
+    def __init__(self, index, stats):
+        self._lock = threading.Lock()
+        self._index = index
+        self._stats = stats
+
+    def acquire(self):
+        stats = self._stats
+        if not self._lock.acquire(False):
+            start = time.perf_counter_ns()
+            self._lock.acquire()
+            stats.stripe_wait.record(time.perf_counter_ns() - start)
+            stats.stripe_contended[self._index] += 1  # under the stripe itself
+        stats.stripe_acquisitions += 1  # approximate: not worth a lock of its own
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
 
 class LockManager:
     """
-    Simple lock manager implementing strict 2PL + no-wait.
-    - rid_locks = { rid -> { "lock_mode": LockMode, "holders": set(txn_ids) } }
+    Lock manager implementing strict 2PL with a configurable conflict policy (see LockPolicy).
+    Locks are hierarchical: a transaction takes an intention lock on a table (IS/IX)
+    before S/X locks on its rows, or a single S/SIX/X lock covering the whole table.
+    - rid_locks = { (table_name, rid) -> LockEntry(lock_mode, holders=set(txn_ids)) }
+      (acquire_lock also accepts any other hashable key, for callers without tables)
+    - table_locks = { table_name -> LockEntry(None, holders={txn_id -> LockMode}) }
+    - txn_locks = { txn_id -> set(row keys) }, txn_tables = { txn_id -> set(table_names) },
+      so releasing costs O(locks held)
+    - txn_rows = { txn_id -> { table_name -> set(row keys) } }: row locks taken under each
+      table's intention lock. Past escalation_threshold rows the transaction tries to
+      escalate to a table lock and drops the row locks it covers.
+    The lock table is striped: each key is guarded by one of num_stripes mutexes
+    chosen by its hash, so requests on unrelated keys do not contend.
+    With track_contention, self.stats (a LockStats) counts conflicts, hold and wait
+    times and stripe contention; contention() reports them.
     """
 
-    def __init__(self):
+    def __init__(self, policy=LOCK_POLICY, num_stripes=LOCK_STRIPES, wait_timeout=LOCK_WAIT_TIMEOUT,
+                 escalation_threshold=LOCK_ESCALATION_THRESHOLD, track_contention=False):
+        if policy not in LockPolicy.ALL:
+            raise ValueError(f"Unknown lock policy '{policy}'")
+        self.policy = policy
+        self.wait_timeout = wait_timeout
+        self.escalation_threshold = escalation_threshold
         self.rid_locks = {}
-        self._lock = threading.Lock()
+        self.table_locks = {}
+        self.txn_locks = {}
+        self.txn_tables = {}
+        self.txn_rows = {}
+        self.wounded = set()
+        self._waiting = {}  # txn_id -> wakeup Event of the request it is blocked on
+        self.stats = LockStats(num_stripes) if track_contention else None
+        if self.stats is None:
+            self._stripes = [threading.Lock() for _ in range(num_stripes)]
+        else:
+            self._stripes = [_TimedStripe(i, self.stats) for i in range(num_stripes)]
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
 
     def acquire_lock(self, transaction_id, rid, lock_mode):
         """
         Attempt to acquire a lock for `transaction_id` on `rid` with `lock_mode`.
-        Return True if granted, False if not (no-wait).
+        Return True if granted, False if the transaction must abort.
+        Depending on the policy, a conflicting request may first wait for the holders.
+        This is a flat lock on one key; lock_row also takes the table's intention lock.
         """
-        with self._lock:
-            lock_info = self.rid_locks.get(rid)
-
-            # If no lock info, grant lock
-            if lock_info is None:
-                self.rid_locks[rid] = {
-                    "lock_mode": lock_mode,
-                    "holders": {transaction_id}
-                }
-                return True
-
-            current_mode = lock_info["lock_mode"]
-            holders = lock_info["holders"]
-
-            # If same txn is already a holder
-            if transaction_id in holders:
-                # If already EXCLUSIVE, done
-                if current_mode == LockMode.EXCLUSIVE:
-                    return True
-                # If current is SHARED but lock_mode = SHARED, also done
-                if lock_mode == LockMode.SHARED:
-                    return True
-                # If want EXCLUSIVE but we share with only ourselves -> upgrade
-                if lock_mode == LockMode.EXCLUSIVE and len(holders) == 1:
-                    lock_info["lock_mode"] = LockMode.EXCLUSIVE
+        return self._acquire(self.rid_locks, rid, transaction_id, lock_mode,
+                             self._conflicts, self._grant)
+
+    def lock_table(self, transaction_id, table_name, lock_mode, wait=True):
+        """
+        Acquire (or upgrade to) a table lock: IS, IX, S, SIX or X.
+        With wait=False a conflict fails immediately, whatever the policy.
+        Return True if granted, False if refused.
+        """
+        held = self.table_mode(transaction_id, table_name)
+        if held is not None and lock_mode in _IMPLIES[held]:
+            return True
+        return self._acquire(self.table_locks, table_name, transaction_id, _combine(held, lock_mode),
+                             self._table_conflicts, self._grant_table, wait)
+
+    def table_mode(self, transaction_id, table_name):
+        """
+        The mode of transaction_id's lock on table_name, or None.
+        """
+        lock_info = self.table_locks.get(table_name)
+        return lock_info.holders.get(transaction_id) if lock_info else None
+
+    def covers(self, transaction_id, table_name, lock_mode):
+        """
+        True if transaction_id's table lock already grants lock_mode on every row of the table.
+        """
+        held = self.table_mode(transaction_id, table_name)
+        return held == LockMode.EXCLUSIVE or (lock_mode == LockMode.SHARED and held in (
+            LockMode.SHARED, LockMode.SHARED_INTENTION_EXCLUSIVE))
+
+    def lock_row(self, transaction_id, table_name, rid, lock_mode):
+        """
+        Lock one row (S or X) under the hierarchy: take IS/IX on the table first, unless
+        the transaction's table lock already covers the row. Return False => abort.
+        """
+        if self.covers(transaction_id, table_name, lock_mode):
+            return True
+        intention = (LockMode.INTENTION_SHARED if lock_mode == LockMode.SHARED
+                     else LockMode.INTENTION_EXCLUSIVE)
+        if not self.lock_table(transaction_id, table_name, intention):
+            return False
+        key = (table_name, rid)
+        if not self.acquire_lock(transaction_id, key, lock_mode):
+            return False
+        rows = self.txn_rows.setdefault(transaction_id, {}).setdefault(table_name, set())
+        if key not in rows:
+            rows.add(key)
+            if self.escalation_threshold and len(rows) % self.escalation_threshold == 0:
+                self._escalate(transaction_id, table_name, rows)
+        return True
+
+    def _escalate(self, transaction_id, table_name, rows):
+        """
+        Replace a transaction's row locks on a table by one table lock: S if it only
+        reads the table, X once it writes to it. Never waits; if another transaction's
+        intention lock is in the way the row locks stay and escalation is retried
+        after another escalation_threshold rows.
+        """
+        if self.table_mode(transaction_id, table_name) == LockMode.INTENTION_SHARED:
+            mode = LockMode.SHARED
+        else:
+            mode = LockMode.EXCLUSIVE
+        if not self.lock_table(transaction_id, table_name, mode, wait=False):
+            return
+        if self.stats is not None:
+            self.stats.count("escalations")
+        for key in rows:
+            self.release_lock(transaction_id, key)
+        del self.txn_rows[transaction_id][table_name]
+
+    def _acquire(self, locks, key, transaction_id, lock_mode, conflicts_of, grant, wait=True):
+        """
+        Shared request loop of row and table locks: grant if compatible, otherwise
+        fail, wound or wait according to the policy.
+        """
+        stripe = self._stripe(key)
+        stats = self.stats
+        deadline = None
+        lock_info = None
+        conflicted = False
+        with stripe:
+            while True:
+                if transaction_id in self.wounded:
+                    break
+                lock_info = locks.get(key)
+                conflicts = conflicts_of(lock_info, transaction_id, lock_mode)
+                if not conflicts:
+                    grant(lock_info, transaction_id, key, lock_mode)
+                    if stats is not None:
+                        stats.grant(transaction_id, key)
                     return True
-                # Else cannot upgrade -> fail
-                return False
-            else:
-                # Another transaction holds the lock
-                if current_mode == LockMode.EXCLUSIVE:
-                    # cannot share or re-get exclusive
-                    return False
-                else:
-                    # current_mode = SHARED
-                    if lock_mode == LockMode.SHARED:
-                        # multiple shared is okay
-                        holders.add(transaction_id)
-                        return True
-                    elif lock_mode == LockMode.EXCLUSIVE:
-                        # can't upgrade if multiple holders
-                        if len(holders) == 1:
-                            # If there's exactly 1 holder (a different txn), no-wait => fail
-                            return False
-                        else:
-                            # definitely fail
-                            return False
+                if stats is not None and not conflicted:
+                    stats.conflict(key)
+                conflicted = True
+
+                if not wait or self.policy == LockPolicy.NO_WAIT:
+                    break
+                if self.policy == LockPolicy.WAIT_DIE:
+                    if transaction_id > min(conflicts):
+                        break  # younger than a holder => die
+                elif self.policy == LockPolicy.WOUND_WAIT:
+                    for holder in conflicts:
+                        if holder > transaction_id:
+                            self._wound(holder)
+
+                timeout = None
+                if self.wait_timeout is not None:
+                    if deadline is None:
+                        deadline = time.monotonic() + self.wait_timeout
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                self._wait(stripe, locks, key, lock_info, transaction_id, timeout)
+            if stats is not None:
+                stats.refuse(upgrade=lock_info is not None and transaction_id in lock_info.holders)
+            return False
+
+    def _conflicts(self, lock_info, transaction_id, lock_mode):
+        """
+        The other transactions whose locks on this rid are incompatible with the request.
+        """
+        if lock_info is None or not lock_info.holders:
+            return ()
+        others = lock_info.holders - {transaction_id}
+        if lock_mode == LockMode.SHARED and lock_info.lock_mode == LockMode.SHARED:
+            return ()
+        if lock_mode == LockMode.SHARED and transaction_id in lock_info.holders:
+            return ()  # we already hold it exclusively
+        return others
+
+    def _table_conflicts(self, lock_info, transaction_id, lock_mode):
+        """
+        The other transactions whose table locks are incompatible with the request.
+        """
+        if lock_info is None:
+            return ()
+        compatible = _COMPATIBLE[lock_mode]
+        return [tid for tid, mode in lock_info.holders.items()
+                if tid != transaction_id and mode not in compatible]
+
+    def _grant(self, lock_info, transaction_id, rid, lock_mode):
+        # caller holds rid's stripe and checked there are no conflicts
+        if lock_info is None:
+            self.rid_locks[rid] = LockEntry(lock_mode, {transaction_id})
+        else:
+            if not lock_info.holders or lock_mode == LockMode.EXCLUSIVE:
+                lock_info.lock_mode = lock_mode
+            lock_info.holders.add(transaction_id)
+        self.txn_locks.setdefault(transaction_id, set()).add(rid)
+
+    def _grant_table(self, lock_info, transaction_id, table_name, lock_mode):
+        # caller holds the table's stripe and checked there are no conflicts
+        if lock_info is None:
+            lock_info = self.table_locks[table_name] = LockEntry(None, {})
+        lock_info.holders[transaction_id] = lock_mode
+        self.txn_tables.setdefault(transaction_id, set()).add(table_name)
+
+    def _wait(self, stripe, locks, key, lock_info, transaction_id, timeout):
+        """
+        Queue on the key's wait queue and block until a holder releases it, this transaction
+        is wounded, or the timeout passes. Caller holds the stripe; it is released while blocked.
+        """
+        wakeup = threading.Event()
+        if lock_info.waiters is None:
+            lock_info.waiters = deque()
+        waiters = lock_info.waiters
+        waiters.append((transaction_id, wakeup))
+        self._waiting[transaction_id] = wakeup
+        stripe.release()
+        start = time.perf_counter_ns() if self.stats is not None else 0
+        try:
+            # re-check after registering: a wound issued just before would have missed the event
+            if transaction_id not in self.wounded:
+                wakeup.wait(timeout)
+        finally:
+            if self.stats is not None:
+                self.stats.lock_wait.record(time.perf_counter_ns() - start)
+            stripe.acquire()
+            waiters.remove((transaction_id, wakeup))
+            self._waiting.pop(transaction_id, None)
+            if not waiters and not lock_info.holders and locks.get(key) is lock_info:
+                del locks[key]
+
+    def _wound(self, transaction_id):
+        """
+        Make a younger holder abort: its next (or current) lock request fails.
+        """
+        if self.stats is not None and transaction_id not in self.wounded:
+            self.stats.count("wounds")
+        self.wounded.add(transaction_id)
+        wakeup = self._waiting.get(transaction_id)
+        if wakeup is not None:
+            wakeup.set()
 
     def release_lock(self, transaction_id, rid):
         """
         Release the lock on `rid` held by `transaction_id`.
         """
-        with self._lock:
-            if rid not in self.rid_locks:
-                return
-            lock_info = self.rid_locks[rid]
-            if transaction_id in lock_info["holders"]:
-                lock_info["holders"].remove(transaction_id)
-                if not lock_info["holders"]:
-                    del self.rid_locks[rid]
+        with self._stripe(rid):
+            self._release(self.rid_locks, transaction_id, rid)
+        held = self.txn_locks.get(transaction_id)
+        if held is not None:
+            held.discard(rid)
 
     def release_all(self, transaction_id):
         """
-        Release all locks held by transaction_id.
+        Release all locks held by transaction_id: rows first, then the tables above them.
         """
-        with self._lock:
-            rids_to_release = []
-            for rid, lock_info in self.rid_locks.items():
-                if transaction_id in lock_info["holders"]:
-                    rids_to_release.append(rid)
-
-            for rid in rids_to_release:
-                lock_info = self.rid_locks.get(rid)
-                if lock_info:
-                    lock_info["holders"].discard(transaction_id)
-                    if not lock_info["holders"]:
-                        del self.rid_locks[rid]
+        for rid in self.txn_locks.pop(transaction_id, ()):
+            with self._stripe(rid):
+                self._release(self.rid_locks, transaction_id, rid)
+        for table_name in self.txn_tables.pop(transaction_id, ()):
+            with self._stripe(table_name):
+                self._release(self.table_locks, transaction_id, table_name)
+        self.txn_rows.pop(transaction_id, None)
+        self.wounded.discard(transaction_id)
+
+    def _release(self, locks, transaction_id, key):
+        # caller holds key's stripe
+        lock_info = locks.get(key)
+        if lock_info:
+            holders = lock_info.holders
+            if isinstance(holders, dict):
+                holders.pop(transaction_id, None)
+            else:
+                holders.discard(transaction_id)
+            if self.stats is not None:
+                self.stats.release(transaction_id, key, self.stats.table_hold if locks is self.table_locks
+                                   else self.stats.row_hold)
+            if lock_info.waiters:
+                for _, wakeup in lock_info.waiters:
+                    wakeup.set()
+            elif not holders:
+                del locks[key]
+
+    def reset_contention(self):
+        if self.stats is not None:
+            self.stats.reset()
+
+    def contention(self, top=10):
+        """
+        Snapshot of the contention counters (see LockStats), or None if they are not
+        tracked: the `top` most conflicted keys, conflicts per table (to guide
+        partitioning), hold and wait times in microseconds and the current size of
+        the lock table.
+        """
+        stats = self.stats
+        if stats is None:
+            return None
+        with stats._lock:
+            conflicts = dict(stats.conflicts)
+            report = {"requests": stats.requests, "conflicts": sum(conflicts.values()),
+                      "refused": stats.refused, "upgrade_failures": stats.upgrade_failures,
+                      "wounds": stats.wounds, "escalations": stats.escalations}
+        by_table = {}
+        for key, count in conflicts.items():
+            table_name = key[0] if isinstance(key, tuple) else key
+            by_table[table_name] = by_table.get(table_name, 0) + count
+        report["hot_keys"] = heapq.nlargest(top, conflicts.items(), key=lambda item: item[1])
+        report["conflicts_by_table"] = by_table
+        report["row_hold"] = stats.row_hold.snapshot()
+        report["table_hold"] = stats.table_hold.snapshot()
+        report["lock_wait"] = stats.lock_wait.snapshot()
+        contended = stats.stripe_contended
+        report["stripes"] = {
+            "acquisitions": stats.stripe_acquisitions,
+            "contended": sum(contended),
+            "wait": stats.stripe_wait.snapshot(),
+            "hot_stripes": heapq.nlargest(top, ((i, n) for i, n in enumerate(contended) if n),
+                                          key=lambda item: item[1]),
+        }
+        report["lock_table"] = {"rows": len(self.rid_locks), "tables": len(self.table_locks),
+                                "transactions": len(self.txn_locks)}
+        return report
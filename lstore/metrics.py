@@ -0,0 +1,178 @@
+import functools
+import threading
+import time
+
+# Histogram buckets: exact below 2 * SUB_BUCKETS, then SUB_BUCKETS buckets per power
+# of two, so every recorded value is within ~3% of its bucket (as in HdrHistogram)
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS
+PERCENTILES = (("p50", 50.0), ("p90", 90.0), ("p99", 99.0), ("p999", 99.9))
+
+OPERATIONS = ("insert", "update", "delete", "select", "select_version", "sum", "sum_version")
+
+# reasons a transaction aborts, as counted by Metrics.abort
+ABORT_LOCK_CONFLICT = "lock_conflict"   # a lock could not be acquired
+ABORT_VALIDATION = "validation"         # optimistic commit found a read overwritten
+ABORT_WRITE_CONFLICT = "write_conflict" # snapshot writer found the record changed since it started
+ABORT_QUERY_FAILED = "query_failed"     # a query returned False (missing key, duplicate key, ...)
+ABORT_EXCEPTION = "exception"           # a query raised
+ABORT_EXPLICIT = "explicit"             # abort() called by the caller (e.g. a 2PC coordinator)
+# aborts a re-run may get past; the others would fail again the same way
+RETRYABLE_ABORTS = (ABORT_LOCK_CONFLICT, ABORT_VALIDATION, ABORT_WRITE_CONFLICT)
+
+
+def _bucket(value):
+    shift = max(0, value.bit_length() - SUB_BITS - 1)
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def _bucket_high(index):
+    # highest value counted in bucket `index`
+    shift = max(0, (index >> SUB_BITS) - 1)
+    return ((index - (shift << SUB_BITS) + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    Latency histogram in nanoseconds with log-linear buckets: constant memory
+    and O(1) record, percentiles within ~3%.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.counts = {}    # bucket -> count
+            self.count = 0
+            self.failed = 0     # calls that returned False
+            self.total = 0
+            self.min = None
+            self.max = 0
+
+    def record(self, value, failed=False):
+        index = _bucket(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if failed:
+                self.failed += 1
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def merge(self, other):
+        """
+        Add other's recorded values to this histogram.
+        """
+        with other._lock:
+            counts, count, failed, total = dict(other.counts), other.count, other.failed, other.total
+            low, high = other.min, other.max
+        with self._lock:
+            for index, n in counts.items():
+                self.counts[index] = self.counts.get(index, 0) + n
+            self.count += count
+            self.failed += failed
+            self.total += total
+            if low is not None and (self.min is None or low < self.min):
+                self.min = low
+            self.max = max(self.max, high)
+
+    def percentile(self, p):
+        """
+        Value (ns) at or below which p percent of the recorded values fall.
+        """
+        with self._lock:
+            return self._percentile(p)
+
+    def _percentile(self, p):
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * p // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_high(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        """
+        Count, failures and latencies in microseconds.
+        """
+        with self._lock:
+            stats = {"count": self.count, "failed": self.failed,
+                     "mean_us": self.total / self.count / 1000 if self.count else 0.0,
+                     "min_us": (self.min or 0) / 1000, "max_us": self.max / 1000}
+            for name, p in PERCENTILES:
+                stats[name + "_us"] = self._percentile(p) / 1000
+        return stats
+
+
+class Metrics:
+    """
+    Counters of a Database, when it is created with metrics=True: a latency
+    Histogram per Query operation and for commits, and transaction commits,
+    aborts by reason and retries. Database.stats() reports them.
+    With metrics off the Database has none, and nothing is measured.
+    """
+
+    def __init__(self):
+        self.operations = {op: Histogram() for op in OPERATIONS}
+        self.commit_latency = Histogram()
+        self.commits = 0
+        self.aborts = {}    # reason -> count
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Start every counter over. The histograms are cleared in place, as timed
+        operations hold on to them.
+        """
+        for histogram in self.operations.values():
+            histogram.clear()
+        self.commit_latency.clear()
+        with self._lock:
+            self.commits = 0
+            self.aborts = {}
+            self.retries = 0
+
+    def timed(self, op, fn):
+        """
+        fn wrapped to record each call's latency under operation `op`.
+        """
+        histogram = self.operations[op]
+        clock = time.perf_counter_ns
+
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            start = clock()
+            result = fn(*args, **kwargs)
+            histogram.record(clock() - start, result is False)
+            return result
+        return timed_fn
+
+    def commit(self, latency):
+        self.commit_latency.record(latency)
+        with self._lock:
+            self.commits += 1
+
+    def abort(self, reason):
+        with self._lock:
+            self.aborts[reason] = self.aborts.get(reason, 0) + 1
+
+    def retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            transactions = {"commits": self.commits, "aborts": sum(self.aborts.values()),
+                            "abort_reasons": dict(self.aborts), "retries": self.retries}
+        transactions["commit_latency"] = self.commit_latency.snapshot()
+        return {"operations": {op: histogram.snapshot() for op, histogram in self.operations.items()},
+                "transactions": transactions}
@@ -0,0 +1,328 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+
+from lstore.config import MAX_IN_FLIGHT
+from lstore.db import Database
+from lstore.lock_manager import LockPolicy
+from lstore.partition import partition_of
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+# Query operations a partitioned transaction may contain
+POINT_OPS = {"insert", "update", "delete", "select", "select_version"}
+SCAN_OPS = {"sum", "sum_version"}
+
+
+def _partition_worker(conn, path):
+    """
+    Main loop of a partition process. Owns a private Database holding this
+    partition's rows and executes the operations routed to it.
+
+    Messages (tuples) received on conn:
+      ("create_table", name, num_columns, key)
+      ("tables",)                   -> reply [(name, num_columns, key), ...]
+      ("run", gid, ops)             -> reply (gid, committed, results)
+      ("prepare", gid, ops)         -> reply (gid, vote, results); locks stay held
+      ("commit", gid) / ("abort", gid)   finish a prepared transaction (no reply)
+      ("close",)                    persist (if a path was given) and exit
+    """
+    # no-wait: a lock wait would block this loop while the holder's commit message sits queued behind it
+    db = Database(lock_policy=LockPolicy.NO_WAIT)
+    if path:
+        db.open(path)
+    queries = {name: Query(table) for name, table in db.tables.items()}
+    prepared = {}
+    # replies go out from their own thread: blocked on a full pipe, this loop
+    # would stop reading requests while the coordinator blocks sending them
+    replies = queue.SimpleQueue()
+
+    def send_replies():
+        while True:
+            reply = replies.get()
+            if reply is None:
+                return
+            conn.send(reply)
+
+    sender = threading.Thread(target=send_replies, name="replies", daemon=True)
+    sender.start()
+
+    def build(ops):
+        txn = Transaction()
+        for table_name, op, args in ops:
+            query = queries[table_name]
+            txn.add_query(getattr(query, op), query.table, *args)
+        return txn
+
+    while True:
+        msg = conn.recv()
+        kind = msg[0]
+        if kind == "run":
+            _, gid, ops = msg
+            txn = build(ops)
+            committed = txn.run()
+            replies.put((gid, committed, txn.results if committed else None))
+        elif kind == "prepare":
+            _, gid, ops = msg
+            txn = build(ops)
+            vote = txn.prepare()
+            if vote:
+                prepared[gid] = txn
+            replies.put((gid, vote, txn.results if vote else None))
+        elif kind == "commit":
+            prepared.pop(msg[1]).commit()
+        elif kind == "abort":
+            prepared.pop(msg[1]).abort()
+        elif kind == "create_table":
+            _, name, num_columns, key = msg
+            queries[name] = Query(db.create_table(name, num_columns, key))
+        elif kind == "tables":
+            replies.put([(t.name, t.num_columns, t.key) for t in db.tables.values()])
+        elif kind == "close":
+            if path:
+                db.close()
+            replies.put(None)
+            sender.join()
+            conn.close()
+            return
+
+
+class PartitionedTransaction:
+    """
+    A transaction for a PartitionedDatabase. Queries are described by table name,
+    operation name and arguments (bound Query methods cannot cross process boundaries):
+
+        t = PartitionedTransaction()
+        t.add_query("Grades", "update", key, None, 5, None, None, None)
+
+    After running, self.results holds each query's return value in order.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.results = []
+
+    def add_query(self, table_name, op, *args):
+        if op not in POINT_OPS and op not in SCAN_OPS:
+            raise ValueError(f"Unsupported operation '{op}'")
+        self.queries.append((table_name, op, args))
+
+
+class PartitionedQuery:
+    """
+    Query-like interface for one table of a PartitionedDatabase.
+    Each call runs as its own single-query transaction; returns False if it aborts.
+    """
+
+    def __init__(self, db, table_name):
+        self.db = db
+        self.table_name = table_name
+
+    def _run(self, op, *args):
+        txn = PartitionedTransaction()
+        txn.add_query(self.table_name, op, *args)
+        if not self.db.run(txn):
+            return False
+        return txn.results[0]
+
+    def insert(self, *columns):
+        return self._run("insert", *columns)
+
+    def update(self, primary_key, *columns):
+        return self._run("update", primary_key, *columns)
+
+    def delete(self, primary_key):
+        return self._run("delete", primary_key)
+
+    def select(self, search_key, search_key_index, projected_columns_index):
+        return self._run("select", search_key, search_key_index, projected_columns_index)
+
+    def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
+        return self._run("select_version", search_key, search_key_index, projected_columns_index, relative_version)
+
+    def sum(self, start_range, end_range, aggregate_column_index):
+        return self._run("sum", start_range, end_range, aggregate_column_index)
+
+    def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
+        return self._run("sum_version", start_range, end_range, aggregate_column_index, relative_version)
+
+
+class PartitionedDatabase:
+    """
+    Execution engine that hash-partitions every table by primary key across
+    worker processes, so Query execution is not limited to one core by the GIL.
+
+    Each partition process owns its rows in a private Database. Transactions touching
+    a single partition run there directly; transactions spanning partitions (including
+    scans such as sum, and selects on non-key columns, which touch every partition) are
+    coordinated with two-phase commit. Partitions use no-wait locking, so a prepared
+    transaction never blocks a partition's message loop.
+
+    On platforms that start processes with "spawn" (macOS, Windows) the calling
+    script must guard its entry point with `if __name__ == "__main__":`.
+    """
+
+    def __init__(self, num_partitions=None):
+        self.num_partitions = num_partitions or os.cpu_count() or 1
+        self.tables = {}   # name -> (num_columns, key)
+        self.db_path = None
+        self._conns = []
+        self._procs = []
+        self._replies = []  # per partition: {gid -> reply} read ahead of their turn
+        self._in_flight = []  # per partition: requests sent whose reply is not read yet
+        self._gids = itertools.count(1)
+
+    def open(self, path=None):
+        """
+        Start the partition processes. With a path, partition i persists to
+        path/partition<i> and previously stored tables are loaded.
+        """
+        self.db_path = path
+        ctx = multiprocessing.get_context()
+        for i in range(self.num_partitions):
+            part_path = os.path.join(path, f"partition{i}") if path else None
+            parent_conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(target=_partition_worker, args=(child_conn, part_path), daemon=True)
+            proc.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._procs.append(proc)
+            self._replies.append({})
+            self._in_flight.append(0)
+        self._conns[0].send(("tables",))
+        for name, num_columns, key in self._conns[0].recv():
+            self.tables[name] = (num_columns, key)
+
+    def close(self):
+        """
+        Persist every partition (if opened with a path) and stop the processes.
+        """
+        for conn in self._conns:
+            conn.send(("close",))
+        for proc in self._procs:
+            proc.join()
+        for conn in self._conns:
+            conn.close()
+        self._conns, self._procs, self._replies, self._in_flight = [], [], [], []
+
+    def create_table(self, name, num_columns, key_index):
+        for conn in self._conns:
+            conn.send(("create_table", name, num_columns, key_index))
+        self.tables[name] = (num_columns, key_index)
+        return PartitionedQuery(self, name)
+
+    def get_table(self, name):
+        if name not in self.tables:
+            raise RuntimeError(f"Table '{name}' not found. Did you create it or load it from disk?")
+        return PartitionedQuery(self, name)
+
+    def _partitions_for(self, table_name, op, args):
+        """
+        Partitions an operation must run on: the key's owner for point operations
+        on the primary key, every partition otherwise.
+        """
+        num_columns, key = self.tables[table_name]
+        if op == "insert":
+            return [partition_of(args[key], self.num_partitions)]
+        if op in ("update", "delete"):
+            return [partition_of(args[0], self.num_partitions)]
+        if op in ("select", "select_version") and args[1] == key:
+            return [partition_of(args[0], self.num_partitions)]
+        return list(range(self.num_partitions))
+
+    def _plan(self, txn):
+        """
+        Split a transaction into per-partition operation lists.
+        Returns {partition: [(query_index, (table_name, op, args)), ...]}.
+        """
+        plan = {}
+        for i, (table_name, op, args) in enumerate(txn.queries):
+            for part in self._partitions_for(table_name, op, args):
+                plan.setdefault(part, []).append((i, (table_name, op, args)))
+        return plan
+
+    def _submit(self, part, msg):
+        """
+        Send partition `part` a request that gets a reply. With MAX_IN_FLIGHT of its
+        requests unanswered, replies are read ahead first, so neither side's pipe
+        fills up while the other waits on it.
+        """
+        while self._in_flight[part] >= MAX_IN_FLIGHT:
+            self._receive(part)
+        self._conns[part].send(msg)
+        self._in_flight[part] += 1
+
+    def _receive(self, part):
+        reply = self._conns[part].recv()
+        self._replies[part][reply[0]] = reply
+        self._in_flight[part] -= 1
+
+    def _reply(self, part, gid):
+        """
+        Wait for partition `part`'s reply to request `gid`, buffering replies to other requests.
+        """
+        pending = self._replies[part]
+        while gid not in pending:
+            self._receive(part)
+        return pending.pop(gid)
+
+    def run(self, txn):
+        """
+        Run one PartitionedTransaction. Returns True if it committed.
+        """
+        return self.run_all([txn])[0]
+
+    def run_all(self, transactions):
+        """
+        Run a batch of transactions. Requests are sent ahead of their replies (up to
+        MAX_IN_FLIGHT per partition), so partitions execute the batch in parallel. Transactions in a batch are
+        concurrent: no order between them is guaranteed.
+        Returns a list of booleans (committed or not), one per transaction.
+        """
+        submitted = []
+        for txn in transactions:
+            plan = self._plan(txn)
+            gid = next(self._gids)
+            if len(plan) == 1:
+                (part, ops), = plan.items()
+                self._submit(part, ("run", gid, [op for _, op in ops]))
+            else:
+                for part, ops in plan.items():
+                    self._submit(part, ("prepare", gid, [op for _, op in ops]))
+            submitted.append((txn, gid, plan))
+
+        outcomes = []
+        for txn, gid, plan in submitted:
+            replies = {part: self._reply(part, gid) for part in plan}
+            committed = all(vote for _, vote, _ in replies.values())
+            if len(plan) > 1:
+                # second phase: partitions that voted no have already aborted
+                for part, (_, vote, _) in replies.items():
+                    if vote:
+                        self._conns[part].send(("commit" if committed else "abort", gid))
+            if committed:
+                txn.results = self._combine(txn, plan, replies)
+            outcomes.append(committed)
+        return outcomes
+
+    def _combine(self, txn, plan, replies):
+        """
+        Merge per-partition results back into one result per query, in query order.
+        """
+        partials = [[] for _ in txn.queries]
+        for part, ops in plan.items():
+            part_results = replies[part][2]
+            for (i, _), result in zip(ops, part_results):
+                partials[i].append(result)
+        results = []
+        for (table_name, op, args), parts in zip(txn.queries, partials):
+            if len(parts) == 1:
+                results.append(parts[0])
+            elif op in SCAN_OPS:
+                results.append(sum(parts))
+            else:
+                # selects on a non-key column: concatenate the records found in each partition
+                results.append([record for records in parts for record in records])
+        return results
@@ -1,3 +1,5 @@
+import sys
+from array import array
 from lstore.config import PAGE_SIZE
 
 class Page:
@@ -20,3 +22,20 @@ class Page:
         start = slot * Page.RECORD_SIZE
         val_bytes = value.to_bytes(8, byteorder='little', signed=True)
         self.data[start:start+8] = val_bytes
+
+    def read_many(self, slot, count):
+        """
+        `count` consecutive values from `slot`, as an array('q').
+        """
+        start = slot * Page.RECORD_SIZE
+        values = array('q', bytes(self.data[start:start + count * Page.RECORD_SIZE]))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def write_many(self, slot, values):
+        start = slot * Page.RECORD_SIZE
+        values = array('q', values)
+        if sys.byteorder == "big":
+            values.byteswap()
+        self.data[start:start + len(values) * Page.RECORD_SIZE] = values.tobytes()
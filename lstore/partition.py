@@ -0,0 +1,136 @@
+import bisect
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from lstore.table import Table, bulk_rows
+
+HASH = "hash"
+RANGE = "range"
+
+
+def partition_of(key, num_partitions):
+    """
+    Owning partition of a primary key. Must be stable across processes and restarts,
+    so non-integer keys are hashed with crc32 rather than the (randomized) builtin hash.
+    """
+    if isinstance(key, int):
+        return key % num_partitions
+    return zlib.crc32(repr(key).encode()) % num_partitions
+
+
+class PartitionedIndex:
+    """
+    Index interface of a PartitionedTable: each partition indexes its own records,
+    so creating or dropping an index applies it to every partition.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def create_index(self, column_number):
+        for partition in self.table.partitions:
+            partition.index.create_index(column_number)
+
+    def drop_index(self, column_number):
+        for partition in self.table.partitions:
+            partition.index.drop_index(column_number)
+
+    def locate(self, column_number, value):
+        """
+        (partition number, rid) of the records that have 'value' in column_number.
+        """
+        return [(i, rid) for i, partition in enumerate(self.table.partitions)
+                for rid in partition.index.locate(column_number, value)]
+
+
+class PartitionedTable:
+    """
+    A table split on its primary key into partitions. Each partition is a Table
+    named "<name>#<i>" with its own versions, indexes, merge and locks, so writes
+    to different partitions do not contend. Query routes point operations to the
+    owning partition and runs scans on all partitions in parallel.
+
+    partitioning is one of:
+      ("hash", n)                 n partitions, by partition_of(key, n)
+      ("range", [b1, b2, ...])    partition 0 holds keys < b1, partition 1 keys in
+                                  [b1, b2), ..., the last one keys >= the last bound
+    """
+
+    def __init__(self, name, num_columns, key, partitioning):
+        kind, arg = partitioning
+        if kind == HASH:
+            count = arg
+        elif kind == RANGE:
+            arg = sorted(arg)
+            count = len(arg) + 1
+        else:
+            raise ValueError(f"Unknown partitioning '{kind}'")
+        self.name = name
+        self.num_columns = num_columns
+        self.key = key
+        self.partitioning = [kind, arg]
+        self.partitions = [Table(f"{name}#{i}", num_columns, key) for i in range(count)]
+        self.index = PartitionedIndex(self)
+        self._db = None
+        # scan workers, started on first use
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def db(self):
+        return self._db
+
+    @db.setter
+    def db(self, db):
+        self._db = db
+        for partition in self.partitions:
+            partition.db = db
+
+    def partition_for(self, key):
+        """
+        Index of the partition owning primary key `key`.
+        """
+        kind, arg = self.partitioning
+        if kind == HASH:
+            return partition_of(key, arg)
+        return bisect.bisect_right(arg, key)
+
+    def partitions_in_range(self, start_range, end_range):
+        """
+        Indexes of the partitions that may hold keys in [start_range, end_range].
+        """
+        kind, arg = self.partitioning
+        if kind == HASH:
+            return list(range(len(self.partitions)))
+        return list(range(bisect.bisect_right(arg, start_range), bisect.bisect_right(arg, end_range) + 1))
+
+    def scan(self, fn, partition_ids):
+        """
+        Call fn(i) for each partition index in parallel; returns the results in order.
+        """
+        if len(partition_ids) <= 1:
+            return [fn(i) for i in partition_ids]
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=len(self.partitions),
+                                                        thread_name_prefix=f"scan-{self.name}")
+        return list(self._executor.map(fn, partition_ids))
+
+    def bulk_load(self, source):
+        """
+        Table.bulk_load, each row going to the partition owning its key. The rows of
+        every partition are checked before any partition stores its records.
+        """
+        rows = [[] for _ in self.partitions]
+        for row in bulk_rows(source, self.num_columns):
+            rows[self.partition_for(row[self.key])].append(row)
+        prepared = [partition._prepare_bulk(part) for partition, part in zip(self.partitions, rows)]
+        return sum(partition._install_bulk(part) for partition, part in zip(self.partitions, prepared))
+
+    def memory_estimate(self):
+        return sum(partition.memory_estimate() for partition in self.partitions)
+
+    def reset_versions(self):
+        for partition in self.partitions:
+            partition.reset_versions()
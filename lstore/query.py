@@ -1,4 +1,9 @@
-from lstore.table import Record
+import time
+from lstore.config import ENABLE_CONCURRENCY
+from lstore.metrics import OPERATIONS, ABORT_LOCK_CONFLICT, ABORT_WRITE_CONFLICT
+from lstore.partition import PartitionedTable
+from lstore.table import Record, pack_version
+from lstore.transaction import IsolationLevel
 try:
     from lstore.lock_manager import LockMode
 except ImportError:
@@ -6,24 +11,195 @@ except ImportError:
     class LockMode:
         SHARED = "SHARED"
         EXCLUSIVE = "EXCLUSIVE"
+        INTENTION_SHARED = "IS"
+        INTENTION_EXCLUSIVE = "IX"
 
 class Query:
     """
     Provides an interface for insert, select, update, delete, sum, etc.
-    Each operation optionally uses transaction_id for concurrency (2PL).
+    Each operation optionally uses transaction_id for concurrency:
+    writers take exclusive locks (2PL); readers either read the snapshot at the
+    transaction's start timestamp without locking (IsolationLevel.SNAPSHOT)
+    or take shared locks (IsolationLevel.SERIALIZABLE).
+    In an optimistic transaction (ConcurrencyMode.OPTIMISTIC) writes are buffered
+    in its OptimisticState instead, and reads see them.
+    On a PartitionedTable, operations on a primary key run on the owning partition
+    and other selects and sums run on all (relevant) partitions in parallel.
+    If the table's database has metrics on, every operation's latency is recorded.
     """
 
-    def __init__(self, table):
+    def __init__(self, table, instrument=True):
         self.table = table
+        # one Query per partition of a partitioned table, else None;
+        # they are not timed, their calls are part of this Query's operations
+        self.partitions = None
+        if isinstance(table, PartitionedTable):
+            self.partitions = [Query(partition, instrument=False) for partition in table.partitions]
+        metrics = getattr(table.db, "metrics", None) if instrument else None
+        if metrics is not None:
+            # timed wrappers on the instance, so Queries without metrics run the plain methods
+            for op in OPERATIONS:
+                setattr(self, op, metrics.timed(op, getattr(self, op)))
+
+    def _partition(self, primary_key):
+        """
+        The partition Query owning primary_key.
+        """
+        return self.partitions[self.table.partition_for(primary_key)]
 
     def _acquire_lock_for_rid(self, transaction_id, rid, lock_mode):
         """
-        Acquire no-wait lock if concurrency is enabled. Return True if success, False if fail => abort.
+        Acquire a row lock (under the lock manager's policy) if concurrency is enabled,
+        together with the matching intention lock on this table.
+        Return True if success, False if fail => abort.
         """
-        if transaction_id is None or transaction_id == -1 or not self.table.db:
+        if not ENABLE_CONCURRENCY or transaction_id is None or transaction_id == -1 or not self.table.db:
             return True
         lm = self.table.db.lock_manager
-        return lm.acquire_lock(transaction_id, rid, lock_mode)
+        tracer = self.table.db.tracer
+        if tracer is None or lm.covers(transaction_id, self.table.name, lock_mode):
+            granted = lm.lock_row(transaction_id, self.table.name, rid, lock_mode)
+        else:
+            start = time.perf_counter_ns()
+            granted = lm.lock_row(transaction_id, self.table.name, rid, lock_mode)
+            tracer.span("lock", start, time.perf_counter_ns(), tid=transaction_id,
+                        key=f"{self.table.name}:{rid}", mode=lock_mode, granted=granted)
+        if granted:
+            return True
+        self._blame_lock_conflict(transaction_id)
+        return False
+
+    def _lock_table_for_scan(self, transaction_id):
+        """
+        A scan whose reads take shared locks locks the whole table in S once instead of
+        every row it visits. Snapshot and optimistic reads take no locks.
+        Return True if success, False if fail => abort.
+        """
+        if not ENABLE_CONCURRENCY or not self._is_transactional(transaction_id):
+            return True
+        db = self.table.db
+        if transaction_id in db.optimistic or db.isolation_level == IsolationLevel.SNAPSHOT:
+            return True
+        tracer = db.tracer
+        start = time.perf_counter_ns() if tracer is not None else 0
+        granted = db.lock_manager.lock_table(transaction_id, self.table.name, LockMode.SHARED)
+        if tracer is not None:
+            tracer.span("lock", start, time.perf_counter_ns(), tid=transaction_id,
+                        key=self.table.name, mode=LockMode.SHARED, granted=granted)
+        if granted:
+            return True
+        self._blame_lock_conflict(transaction_id)
+        return False
+
+    def _blame_lock_conflict(self, transaction_id):
+        self.table.db.blame(transaction_id, ABORT_LOCK_CONFLICT)
+
+    def _write_conflict(self, transaction_id, rid):
+        """
+        First updater wins: under snapshot isolation a transaction may not change a
+        record that a transaction committed after it started changed too, or it would
+        overwrite a version it never saw. Call with rid locked exclusively.
+        """
+        if not self._is_transactional(transaction_id):
+            return False
+        db = self.table.db
+        if db.isolation_level != IsolationLevel.SNAPSHOT:
+            return False
+        snapshot_ts = db.active_transactions.get(transaction_id)
+        committed = self.table.committed_timestamp(rid)
+        if snapshot_ts is None or committed is None or committed <= snapshot_ts:
+            return False
+        db.blame(transaction_id, ABORT_WRITE_CONFLICT)
+        return True
+
+    def _is_transactional(self, transaction_id):
+        return transaction_id is not None and transaction_id != -1 and self.table.db is not None
+
+    def _write_timestamp(self, transaction_id):
+        """
+        Timestamp for a version this query writes. A transaction's versions stay
+        pending (stamped -tid, visible only to itself) until it commits.
+        """
+        if not self._is_transactional(transaction_id):
+            return self.table.new_timestamp()
+        return -transaction_id
+
+    def _log_change(self, transaction_id, *entry):
+        """
+        Record a change: in the transaction's undo log (see Database.log_undo), or
+        straight in the redo log if it is made outside any transaction.
+        """
+        if self._is_transactional(transaction_id):
+            self.table.db.log_undo(transaction_id, entry)
+        elif self.table.db is not None:
+            self.table.db.log_autocommit(self.table, entry[2])
+
+    def _optimistic(self, transaction_id):
+        """
+        The OptimisticState of an optimistic transaction that is still buffering, else None.
+        """
+        if not self._is_transactional(transaction_id):
+            return None
+        state = self.table.db.optimistic.get(transaction_id)
+        if state is None or state.installing:
+            return None
+        return state
+
+    def _read_optimistic(self, state, rid, transaction_id, relative_version):
+        """
+        Read for an optimistic transaction: its own buffered write if it has one, otherwise
+        the snapshot version, whose timestamp is recorded for validation at commit.
+        """
+        key = (self.table, rid)
+        if key in state.overlay:
+            if state.overlay[key] is None or relative_version == 0:
+                return state.overlay[key]
+            relative_version += 1  # the buffered write counts as the newest version
+        snapshot_ts = self.table.db.active_transactions.get(transaction_id)
+        if key not in state.reads:
+            state.reads[key] = self.table.committed_timestamp(rid, snapshot_ts)
+        return self.table.read_version(rid, snapshot_ts, transaction_id, relative_version)
+
+    def _read(self, rid, transaction_id, relative_version=0):
+        """
+        The version of rid this query reads (relative_version steps behind it).
+        Returns None if the record is not visible, False if a lock was refused.
+        """
+        state = self._optimistic(transaction_id)
+        if state is not None:
+            return self._read_optimistic(state, rid, transaction_id, relative_version)
+        db = self.table.db
+        if self._is_transactional(transaction_id) and db.isolation_level == IsolationLevel.SNAPSHOT:
+            snapshot_ts = db.active_transactions.get(transaction_id)
+            if snapshot_ts is not None:
+                return self.table.read_version(rid, snapshot_ts, transaction_id, relative_version)
+        if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.SHARED):
+            return False
+        return self.table.get_relative_version(rid, relative_version)
+
+    def _candidate_rids(self, search_key, search_key_index, transaction_id):
+        """
+        RIDs that may hold search_key in a non-key column: from the secondary index
+        if there is one (it lists every value a record's retained versions hold, so
+        a value it does not list matches no record), otherwise every record.
+        Readers filter on the version they see.
+        """
+        if search_key_index not in self.table.index.secondary_indexes:
+            return list(self.table.rid_to_versions.keys())
+        rids = list(self.table.index.locate(search_key_index, search_key))
+        state = self._optimistic(transaction_id)
+        if state is not None:
+            # an optimistic transaction's own updates reach the index only at commit
+            listed = set(rids)
+            rids.extend(rid for (table, rid), cols in list(state.overlay.items())
+                        if table is self.table and cols is not None
+                        and cols[search_key_index] == search_key and rid not in listed)
+        return rids
+
+    def _pks_in_range(self, start_range, end_range):
+        # list() copies the keys atomically, so concurrent inserts cannot break the scan
+        return [pk for pk in list(self.table.index.pk_index)
+                if start_range <= pk <= end_range]
 
     def insert(self, *columns, transaction_id=None):
         """
@@ -32,22 +208,35 @@ class Query:
         """
         if len(columns) < self.table.num_columns:
             return False
+        if self.partitions is not None:
+            return self._partition(columns[self.table.key]).insert(*columns, transaction_id=transaction_id)
 
         col_list = list(columns)
         pk_val = col_list[self.table.key]
 
-        # ensure pk is unique
-        if pk_val in self.table.index.pk_index:
+        # ensure pk is unique (this transaction may reinsert a key it deleted)
+        existing = self.table.index.pk_index.get(pk_val)
+        if existing is not None and not self._deleted_by(transaction_id, existing):
             return False
 
+        state = self._optimistic(transaction_id)
+        if state is not None:
+            # buffered until commit
+            if (self.table, pk_val) in state.inserted:
+                return False
+            state.inserted[(self.table, pk_val)] = col_list
+            state.writes.append((self.insert, columns))
+            return True
+
         new_rid = self.table.get_new_rid()
 
         if not self._acquire_lock_for_rid(transaction_id, new_rid, LockMode.EXCLUSIVE):
             return False
 
-        # store new record
-        self.table.rid_to_versions[new_rid] = [col_list]
-        self.table.index.pk_index[pk_val] = new_rid
+        # store new record, unless a concurrent insert claimed the key meanwhile
+        if not self.table.claim_key(new_rid, pack_version(col_list), self._write_timestamp(transaction_id),
+                                    lambda rid: self._deleted_by(transaction_id, rid)):
+            return False
 
         # build secondary indexes if they exist
         for col_id, val in enumerate(col_list):
@@ -55,96 +244,103 @@ class Query:
                 dct = self.table.index.secondary_indexes[col_id]
                 dct.setdefault(val, []).append(new_rid)
 
+        self._log_change(transaction_id, "insert", self.table, new_rid)
+
+        # a table that only grows must keep to its memory budget too
+        self.table.num_inserts += 1
+        if self.table.num_inserts >= self.table.MERGE_THRESHOLD:
+            self.table.num_inserts = 0
+            if self.table.over_memory_budget():
+                self.table.start_background_merge()
         return True
 
+    def _deleted_by(self, transaction_id, rid):
+        """
+        Whether rid's newest version is a delete tombstone transaction_id wrote.
+        """
+        if not self._is_transactional(transaction_id):
+            return False
+        versions = self.table.rid_to_versions.get(rid)
+        timestamps = self.table.rid_to_timestamps.get(rid)
+        return bool(versions) and versions[-1] is None and timestamps[-1] == -transaction_id
+
     def delete(self, primary_key, transaction_id=None):
+        """
+        In a transaction the record gets a tombstone (None) version: it is hidden from
+        the transaction at once and removed when the transaction commits. Outside any
+        transaction it is removed at once.
+        """
+        if self.partitions is not None:
+            return self._partition(primary_key).delete(primary_key, transaction_id=transaction_id)
+        state = self._optimistic(transaction_id)
+        if state is not None:
+            return self._buffer_delete(state, primary_key, transaction_id)
+
         rid = self.table.index.pk_index.get(primary_key)
         if rid is None:
             return False
 
         if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.EXCLUSIVE):
             return False
+        if self._write_conflict(transaction_id, rid):
+            return False
 
-        # remove from pk_index
-        del self.table.index.pk_index[primary_key]
-        old_versions = self.table.rid_to_versions.pop(rid, None)
-
-        # remove from any secondary indexes
-        if old_versions and len(old_versions) > 0:
-            old_vals = old_versions[-1]
-            for col_id, val in enumerate(old_vals):
-                if col_id in self.table.index.secondary_indexes:
-                    if val in self.table.index.secondary_indexes[col_id]:
-                        lst = self.table.index.secondary_indexes[col_id][val]
-                        if rid in lst:
-                            lst.remove(rid)
+        versions = self.table.rid_to_versions.get(rid)
+        if not versions or versions[-1] is None:
+            return False  # already deleted, by a transaction still running
+        if self._is_transactional(transaction_id):
+            self.table.append_version(rid, None, -transaction_id)
+        else:
+            self.table.remove_record(rid)
+        self._log_change(transaction_id, "delete", self.table, rid)
         return True
 
     def select(self, search_key, search_key_index, projected_columns_index, transaction_id=None):
         """
         Return list of Record objects or False if concurrency fails.
         """
-        results = []
-
-        # If searching by primary key
-        if search_key_index == self.table.key:
-            rid = self.table.index.pk_index.get(search_key, None)
-            if rid is None:
-                return []
-            if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.SHARED):
-                return False
-            newest = self.table.get_latest_version(rid)
-            projected = [newest[i] for i, flag in enumerate(projected_columns_index) if flag == 1]
-            results.append(Record(rid, search_key, projected))
-        else:
-            # searching by some other column => check if we have a secondary index
-            rids = self.table.index.locate(search_key_index, search_key)
-            if not rids:
-                # fallback brute force if no index or no match
-                rids = []
-                for rid, versions in self.table.rid_to_versions.items():
-                    if versions[-1][search_key_index] == search_key:
-                        rids.append(rid)
-
-            for rid in rids:
-                if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.SHARED):
-                    return False
-                newest = self.table.rid_to_versions[rid][-1]
-                projected = [newest[i] for i, flag in enumerate(projected_columns_index) if flag == 1]
-                results.append(Record(rid, search_key, projected))
-
-        return results
+        return self._select(search_key, search_key_index, projected_columns_index, 0, transaction_id)
 
     def update(self, primary_key, *columns, transaction_id=None):
+        if self.partitions is not None:
+            return self._partition(primary_key).update(primary_key, *columns, transaction_id=transaction_id)
+        state = self._optimistic(transaction_id)
+        if state is not None:
+            return self._buffer_update(state, primary_key, columns, transaction_id)
+
         rid = self.table.index.pk_index.get(primary_key, None)
         if rid is None:
             return False
 
         if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.EXCLUSIVE):
             return False
+        if self._write_conflict(transaction_id, rid):
+            return False
 
-        versions = self.table.rid_to_versions[rid]
+        newest = self.table.get_latest_version(rid)
+        if newest is None:
+            return False  # deleted, by a transaction still running
         # copy the newest version
-        newest = versions[-1][:]
+        newest = list(newest)
 
         updated = False
+        index_deltas = []
         for col_idx, val in enumerate(columns):
             if val is not None:
                 old_val = newest[col_idx]
                 newest[col_idx] = val
                 updated = True
-
-                # update secondary index if needed
-                if col_idx in self.table.index.secondary_indexes:
-                    if old_val in self.table.index.secondary_indexes[col_idx]:
-                        lst = self.table.index.secondary_indexes[col_idx][old_val]
-                        if rid in lst:
-                            lst.remove(rid)
-                    self.table.index.secondary_indexes[col_idx].setdefault(val, []).append(rid)
+                if col_idx in self.table.index.secondary_indexes and val != old_val:
+                    index_deltas.append((col_idx, old_val, val))
 
         # only append if we actually changed something
         if updated:
-            versions.append(newest)
+            self.table.append_version(rid, pack_version(newest), self._write_timestamp(transaction_id))
+            # the record stays listed under its old values too, for snapshots that still
+            # see them; merges drop entries no retained version holds
+            for col_idx, _, val in index_deltas:
+                self.table.index.add(col_idx, val, rid)
+            self._log_change(transaction_id, "update", self.table, rid, index_deltas)
             self.table.num_updates += 1
 
             # check if we should do a background merge
@@ -154,23 +350,54 @@ class Query:
 
         return True
 
-    def sum(self, start_range, end_range, aggregate_column_index, transaction_id=None):
+    def _buffer_update(self, state, primary_key, columns, transaction_id):
         """
-        Summation of a column for pk in [start_range, end_range].
+        Optimistic update: apply the new values to this transaction's view of the record
+        and buffer the query for commit.
         """
-        relevant_pks = [pk for pk in self.table.index.pk_index.keys()
-                        if start_range <= pk <= end_range]
-        if not relevant_pks:
-            return 0
+        inserted_key = (self.table, primary_key)
+        rid = None
+        if inserted_key in state.inserted:
+            base = state.inserted[inserted_key]
+        else:
+            rid = self.table.index.pk_index.get(primary_key)
+            if rid is None:
+                return False
+            base = self._read_optimistic(state, rid, transaction_id, 0)
+            if base is None:
+                return False
 
-        total = 0
-        for pk in relevant_pks:
-            rid = self.table.index.pk_index[pk]
-            if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.SHARED):
+        newest = list(base)
+        for col_idx, val in enumerate(columns):
+            if val is not None:
+                newest[col_idx] = val
+        if rid is None:
+            state.inserted[inserted_key] = newest
+        else:
+            state.overlay[(self.table, rid)] = newest
+        state.writes.append((self.update, (primary_key,) + tuple(columns)))
+        return True
+
+    def _buffer_delete(self, state, primary_key, transaction_id):
+        """
+        Optimistic delete: hide the record from this transaction and buffer the query for commit.
+        """
+        inserted_key = (self.table, primary_key)
+        if inserted_key in state.inserted:
+            del state.inserted[inserted_key]
+        else:
+            rid = self.table.index.pk_index.get(primary_key)
+            if rid is None or self._read_optimistic(state, rid, transaction_id, 0) is None:
                 return False
-            newest = self.table.rid_to_versions[rid][-1]
-            total += newest[aggregate_column_index]
-        return total
+            state.overlay[(self.table, rid)] = None
+        state.writes.append((self.delete, (primary_key,)))
+        return True
+
+    def sum(self, start_range, end_range, aggregate_column_index, transaction_id=None):
+        """
+        Summation of a column for pk in [start_range, end_range].
+        """
+        return self._sum(start_range, end_range, aggregate_column_index, 0, transaction_id)
 
     def select_version(self, search_key, search_key_index, projected_columns_index, relative_version, transaction_id=None):
         """
@@ -180,37 +407,55 @@ class Query:
             = -2 => 2 versions back
             ...
         """
+        return self._select(search_key, search_key_index, projected_columns_index, relative_version, transaction_id)
+
+    def _select(self, search_key, search_key_index, projected_columns_index, relative_version, transaction_id):
+        if self.partitions is not None:
+            if search_key_index == self.table.key:
+                part_ids = [self.table.partition_for(search_key)]
+            else:
+                part_ids = list(range(len(self.partitions)))
+            parts = self.table.scan(lambda i: self.partitions[i]._select(
+                search_key, search_key_index, projected_columns_index, relative_version, transaction_id), part_ids)
+            if any(part is False for part in parts):
+                return False
+            return [record for part in parts for record in part]
+
         results = []
+        # records an optimistic transaction inserted are only in its buffer
+        state = self._optimistic(transaction_id)
+        for (table, pk), cols in (state.inserted.items() if state else ()):
+            if table is self.table and cols[search_key_index] == search_key:
+                projected = [cols[i] for i, flag in enumerate(projected_columns_index) if flag == 1]
+                results.append(Record(None, pk, projected))
 
         if search_key_index == self.table.key:
+            if results:
+                return results
             rid = self.table.index.pk_index.get(search_key)
             if rid is None:
                 return []
-            if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.SHARED):
+            # clamped to the oldest retained version
+            older = self._read(rid, transaction_id, relative_version)
+            if older is False:
                 return False
-            versions = self.table.rid_to_versions[rid]
-
-            # clamp the index so it never goes below 0
-            idx = max(0, len(versions) - 1 + relative_version)
-            older = versions[idx]
-            projected = [older[i] for i, flag in enumerate(projected_columns_index) if flag == 1]
-            results.append(Record(rid, search_key, projected))
+            if older is not None:
+                projected = [older[i] for i, flag in enumerate(projected_columns_index) if flag == 1]
+                results.append(Record(rid, search_key, projected))
         else:
-            # secondary index path
-            rids = self.table.index.locate(search_key_index, search_key)
-            if not rids:
-                # fallback brute force
-                rids = []
-                for rid, vs in self.table.rid_to_versions.items():
-                    if vs[-1][search_key_index] == search_key:
-                        rids.append(rid)
-
-            for rid in rids:
-                if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.SHARED):
+            # secondary index path; without an index every record is scanned
+            if search_key_index not in self.table.index.secondary_indexes:
+                if not self._lock_table_for_scan(transaction_id):
+                    return False
+            for rid in self._candidate_rids(search_key, search_key_index, transaction_id):
+                current = self._read(rid, transaction_id)
+                if current is False:
                     return False
-                versions = self.table.rid_to_versions[rid]
-                idx = max(0, len(versions) - 1 + relative_version)
-                older = versions[idx]
+                if current is None or current[search_key_index] != search_key:
+                    continue
+                older = current if relative_version == 0 else self._read(rid, transaction_id, relative_version)
+                if older is None:
+                    continue
                 projected = [older[i] for i, flag in enumerate(projected_columns_index) if flag == 1]
                 results.append(Record(rid, search_key, projected))
 
@@ -220,18 +465,37 @@ class Query:
         """
         Sum a column at a certain version for pk in [start_range, end_range].
         """
-        relevant_pks = [pk for pk in self.table.index.pk_index.keys()
-                        if start_range <= pk <= end_range]
-        if not relevant_pks:
-            return 0
+        return self._sum(start_range, end_range, aggregate_column_index, relative_version, transaction_id)
+
+    def _sum(self, start_range, end_range, aggregate_column_index, relative_version, transaction_id):
+        if self.partitions is not None:
+            parts = self.table.scan(lambda i: self.partitions[i]._sum(
+                start_range, end_range, aggregate_column_index, relative_version, transaction_id),
+                self.table.partitions_in_range(start_range, end_range))
+            if any(part is False for part in parts):
+                return False
+            return sum(parts)
 
         total = 0
+        # records an optimistic transaction inserted are only in its buffer
+        state = self._optimistic(transaction_id)
+        for (table, pk), cols in (state.inserted.items() if state else ()):
+            if table is self.table and start_range <= pk <= end_range:
+                total += cols[aggregate_column_index]
+
+        relevant_pks = self._pks_in_range(start_range, end_range)
+        if not relevant_pks:
+            return total
+        if not self._lock_table_for_scan(transaction_id):
+            return False
+
         for pk in relevant_pks:
-            rid = self.table.index.pk_index[pk]
-            if not self._acquire_lock_for_rid(transaction_id, rid, LockMode.SHARED):
+            rid = self.table.index.pk_index.get(pk)
+            if rid is None:
+                continue  # deleted since the scan started
+            older = self._read(rid, transaction_id, relative_version)
+            if older is False:
                 return False
-            versions = self.table.rid_to_versions[rid]
-            idx = max(0, len(versions) - 1 + relative_version)
-            older = versions[idx]
-            total += older[aggregate_column_index]
+            if older is not None:
+                total += older[aggregate_column_index]
         return total
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from lstore.config import REPLICA_MAX_STALENESS
+from lstore.db import Database, WAL_FILE
+from lstore.query import Query
+from lstore.wal import WalReader
+
+
+class Replica:
+    """
+    Read-only copy of the database at `path`, kept up to date by tailing the
+    writer's log, typically in another process than the writer:
+
+        replica = Replica(path)
+        replica.start()                       # optional background catch-up
+        grades = replica.get_table("Grades")
+        grades.select(key, 0, [1, 1, 1, 1, 1])
+
+    Reads never see a state older than max_staleness seconds: if the last catch-up
+    is older than that, a read first applies what the writer logged since.
+    When the writer checkpoints (Database.close), the replica finishes the old log
+    and goes on with the new one; if it missed a whole log (several checkpoints
+    since the last catch-up), it reloads the tables.
+    """
+
+    def __init__(self, path, max_staleness=REPLICA_MAX_STALENESS):
+        self.path = path
+        self.max_staleness = max_staleness
+        self.db = Database()
+        self.synced_at = 0.0
+        self._reader = None
+        self._lock = threading.Lock()  # one catch-up at a time
+        self._stop = threading.Event()
+        self._thread = None
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        # caller holds self._lock
+        if self._reader is not None:
+            self._reader.close()
+        # open the log before reading the tables: a checkpoint in between shows up as a rotation
+        self._reader = WalReader(os.path.join(self.path, WAL_FILE))
+        self.db.tables = self.db.load_tables(self.path, reset_versions=False)
+        self.db.replay(self._reader.read_new())
+        self.synced_at = time.monotonic()
+
+    def catch_up(self):
+        """
+        Apply everything the writer has logged so far.
+        """
+        with self._lock:
+            records = self._reader.read_new()
+            if self._reader.rotated():
+                # the rest of the old log is still readable through our open file; what
+                # was logged since the checkpoint is in the new one, from its start
+                records += self._reader.read_new()
+                epoch = self._reader.epoch
+                self._reader.close()
+                self._reader = WalReader(os.path.join(self.path, WAL_FILE))
+                if self._reader.epoch != epoch + 1:
+                    self._reload()
+                    return
+                records += self._reader.read_new()
+            self.db.replay(records)
+            self.synced_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """
+        Catch up if the last catch-up is older than max_staleness.
+        """
+        if time.monotonic() - self.synced_at > self.max_staleness:
+            self.catch_up()
+
+    def start(self, interval=None):
+        """
+        Catch up every `interval` seconds (default: half of max_staleness) on a
+        background thread, so reads rarely have to wait for it.
+        """
+        if interval is None:
+            interval = self.max_staleness / 2
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._follow, args=(interval,), name="Replica", daemon=True)
+        self._thread.start()
+
+    def _follow(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.catch_up()
+            except (OSError, ValueError):
+                pass  # the writer is mid-checkpoint; retry on the next tick
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def get_table(self, name):
+        self.ensure_fresh()
+        if name not in self.db.tables:
+            self.catch_up()  # it may have been created since the last catch-up
+        self.db.get_table(name)  # raises if it does not exist
+        return ReplicaQuery(self, name)
+
+
+class ReplicaQuery:
+    """
+    The read operations of Query on a replica's table. Writes go to the writer.
+    """
+
+    def __init__(self, replica, table_name):
+        self.replica = replica
+        self.table_name = table_name
+
+    def _query(self):
+        self.replica.ensure_fresh()
+        # looked up on every read: a reload replaces the table objects
+        return Query(self.replica.db.get_table(self.table_name))
+
+    def select(self, search_key, search_key_index, projected_columns_index):
+        return self._query().select(search_key, search_key_index, projected_columns_index)
+
+    def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
+        return self._query().select_version(search_key, search_key_index, projected_columns_index,
+                                            relative_version)
+
+    def sum(self, start_range, end_range, aggregate_column_index):
+        return self._query().sum(start_range, end_range, aggregate_column_index)
+
+    def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
+        return self._query().sum_version(start_range, end_range, aggregate_column_index, relative_version)
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import os
+import struct
+import msgpack
+from lstore.aio import AsyncDatabase, AsyncTransaction
+from lstore.db import custom_default, ext_hook
+from lstore.query import Query
+
+# Wire format, both directions: a 4-byte big-endian length, then a msgpack array.
+# Requests are [request_id, kind, body] and replies [request_id, status, payload],
+# status being "ok" or "error" (payload = message). Records travel as msgpack ext
+# types (see lstore.db.custom_default). Request kinds and their ok payloads:
+#   "create_table" [name, num_columns, key, partitioning]   -> None
+#   "drop_table"   [name]                                   -> None
+#   "tables"       []                                       -> [[name, num_columns, key], ...]
+#   "run"          [[table_name, op, args], ...]            -> [committed, results]
+#   "batch"        [transaction, ...] (each as for "run")   -> [[committed, results], ...]
+# A client may pipeline: send many requests before reading replies. Requests on one
+# connection run concurrently and replies may arrive out of order; match them by id.
+FRAME_HEADER = struct.Struct(">I")
+OPS = {"insert", "update", "delete", "select", "select_version", "sum", "sum_version"}
+
+
+def pack_frame(message):
+    payload = msgpack.packb(message, use_bin_type=True, default=custom_default)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def unpack_frame(payload):
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False, ext_hook=ext_hook)
+
+
+class Server:
+    """
+    Serves one Database to many local processes over a Unix or TCP socket.
+    Built on AsyncDatabase: every request is a transaction run on the event loop.
+    """
+
+    def __init__(self, db_path=None, adb=None):
+        self.adb = adb if adb is not None else AsyncDatabase()
+        self.db_path = db_path
+        self.queries = {}   # table name -> Query
+        self._server = None
+
+    async def start(self, address):
+        """
+        Listen on `address`: a filesystem path (Unix socket) or a (host, port) pair.
+        """
+        if self.db_path:
+            await self.adb.open(self.db_path)
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            self._server = await asyncio.start_unix_server(self._serve_connection, path=address)
+        else:
+            host, port = address
+            self._server = await asyncio.start_server(self._serve_connection, host, port)
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """
+        Stop accepting connections and persist the database (if it has a path).
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self.db_path:
+            await self.adb.close()
+
+    def _query(self, table_name):
+        query = self.queries.get(table_name)
+        if query is None:
+            query = self.queries[table_name] = Query(self.adb.get_table(table_name))
+        return query
+
+    async def _serve_connection(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    payload = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+                except asyncio.IncompleteReadError:
+                    break
+                task = asyncio.ensure_future(self._respond(unpack_frame(payload), writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _respond(self, request, writer):
+        request_id, kind, body = request
+        try:
+            reply = [request_id, "ok", await self._handle(kind, body)]
+        except Exception as e:
+            reply = [request_id, "error", f"{type(e).__name__}: {e}"]
+        writer.write(pack_frame(reply))
+        await writer.drain()
+
+    async def _handle(self, kind, body):
+        if kind == "run":
+            return await self._run(body)
+        if kind == "batch":
+            return list(await asyncio.gather(*(self._run(ops) for ops in body)))
+        if kind == "create_table":
+            name, num_columns, key, partitioning = body
+            self.queries[name] = Query(self.adb.create_table(name, num_columns, key, partitioning))
+            return None
+        if kind == "drop_table":
+            self.queries.pop(body[0], None)
+            self.adb.drop_table(body[0])
+            return None
+        if kind == "tables":
+            return [[t.name, t.num_columns, t.key] for t in self.adb.db.tables.values()]
+        raise ValueError(f"Unknown request '{kind}'")
+
+    async def _run(self, ops):
+        txn = AsyncTransaction()
+        for table_name, op, args in ops:
+            if op not in OPS:
+                raise ValueError(f"Unsupported operation '{op}'")
+            query = self._query(table_name)
+            txn.add_query(getattr(query, op), query.table, *args)
+        committed = await self.adb.run(txn)
+        return [committed, txn.results if committed else None]
+
+
+async def serve(address, db_path=None):
+    """
+    Serve the database at db_path on `address` until cancelled, then persist it.
+    """
+    server = Server(db_path)
+    await server.start(address)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an L-Store database over a socket.")
+    parser.add_argument("--db", help="database directory (in-memory only if omitted)")
+    parser.add_argument("--unix", help="Unix socket path to listen on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070)
+    args = parser.parse_args()
+    address = args.unix if args.unix else (args.host, args.port)
+    try:
+        asyncio.run(serve(address, args.db))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
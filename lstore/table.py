@@ -1,7 +1,86 @@
+import csv
+import os
+import sys
 import threading
+import time
+from array import array
+from itertools import groupby
+from operator import itemgetter
+from lstore.config import BACKGROUND_MERGE, BULK_READ_ROWS, RID_BLOCK_SIZE, VERSION_RETENTION, PAGE_SIZE, TABLE_MEMORY_BUDGET
 from lstore.index import Index
+from lstore.page import Page
+
+# memory_estimate's charges: per record (dict entries, chain list, timestamps, pk index entry)
+# and per in-memory version (array header, chain and timestamp slots) plus 8 bytes per column
+ROW_OVERHEAD = 330
+VERSION_OVERHEAD = 80
+
+def pack_version(values):
+    """
+    Compact storage for one version: an array('q') (8 bytes per column, no boxed ints)
+    if every column is a 64-bit integer, otherwise a list.
+    """
+    try:
+        return array('q', values)
+    except (TypeError, OverflowError):
+        return list(values)
+
+def new_timestamps(timestamp):
+    """
+    A version chain's timestamps, starting with `timestamp`.
+    """
+    return array('q', [timestamp])
+
+def bulk_rows(source, num_columns):
+    """
+    The rows of a bulk load (see Table.bulk_load), checked to have num_columns
+    columns. source is an iterable of rows, or the path of a file: a .csv file has
+    one record per line, integer columns; any other file holds records of
+    num_columns little-endian int64s, back to back.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if os.fspath(source).endswith(".csv"):
+            source = _csv_rows(source)
+        else:
+            source = _binary_rows(source, num_columns)
+    for number, row in enumerate(source):
+        if len(row) != num_columns:
+            raise ValueError(f"Bulk load row {number} has {len(row)} columns, not {num_columns}")
+        yield row
+
+def _csv_rows(path):
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if row:
+                yield [int(value) for value in row]
+
+def _binary_rows(path, num_columns):
+    width = num_columns * 8
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(width * BULK_READ_ROWS)
+            if not chunk:
+                return
+            if len(chunk) % width:
+                raise ValueError(f"{path} does not hold whole {num_columns}-column records")
+            values = array('q', chunk)
+            if sys.byteorder == "big":
+                values.byteswap()
+            for start in range(0, len(values), num_columns):
+                yield values[start:start + num_columns]
+
+class SpilledVersion(int):
+    """
+    Stand-in for a version that Table.spill moved to a bufferpool page: the int is
+    the version's spill number within its table (see Table._spill_location).
+    Kept this small so that spilling actually frees memory. Table's read helpers
+    fault it back in.
+    """
+    __slots__ = ()
 
 class Record:
+    __slots__ = ("rid", "key", "columns")
+
     def __init__(self, rid, key, columns):
         self.rid = rid
         self.key = key
@@ -11,12 +90,23 @@ class Table:
     """
     In-memory table storing:
       - name, num_columns, key (primary key index)
-      - rid_to_versions: dict mapping record IDs to a list of versions (each version is a list of column values)
+      - rid_to_versions: dict mapping record IDs to a list of versions (each version is the
+        column values, packed by pack_version)
+      - rid_to_timestamps: dict mapping record IDs to an array('q') of the timestamp of each
+        version (same order as rid_to_versions)
       - index: primary and secondary indexes
-      - next_rid: generator for new record IDs
+      - next_rid: first record ID not yet reserved by any thread
       - db: reference to the Database
+      - memory_budget: bytes this table's versions may use before merges spill old
+        versions and cold records to disk (None = no limit; the Database may also have a budget)
     """
 
+    __slots__ = ("name", "num_columns", "key", "rid_to_versions", "rid_to_timestamps", "index",
+                 "next_rid", "_rid_lock", "_rid_blocks", "db", "num_updates", "MERGE_THRESHOLD",
+                 "_merge_lock", "_dirty_rids", "_gc_epoch", "memory_budget", "_resident_tail",
+                 "_spill_lock", "_next_spill", "_free_spills", "_released_spills", "_spill_candidates",
+                 "num_inserts", "_insert_lock")
+
     def __init__(self, name, num_columns, key):
         self.name = name
         self.num_columns = num_columns
@@ -24,49 +114,578 @@ class Table:
 
         # Each record (rid) maps to a list of versions (each version is a list of column values)
         self.rid_to_versions = {}
+        # Parallel to rid_to_versions: the database timestamp at which each version was written
+        self.rid_to_timestamps = {}
 
         # Primary and secondary indexes
         self.index = Index(self)
         self.next_rid = 0
+        # each thread hands out RIDs from its own reserved block [next, end)
+        self._rid_lock = threading.Lock()
+        self._rid_blocks = threading.local()
+        # held by inserts while they check that the primary key is free and claim it
+        self._insert_lock = threading.Lock()
 
         # Database reference (set when table is attached to a Database)
         self.db = None
 
-        # For update counting and merge threshold
+        # For update counting and merge threshold (inserts only check the memory budget)
         self.num_updates = 0
+        self.num_inserts = 0
         self.MERGE_THRESHOLD = 200
+        self._merge_lock = threading.Lock()
+        # records that gained versions since the last merge; only these are garbage-collected
+        self._dirty_rids = set()
+        # odd while a merge is pruning chains; lock-free readers retry if it changed under them
+        self._gc_epoch = 0
+
+        # Memory accounting: in-memory versions less one per record (below zero once newest
+        # versions are spilled), and where the next spilled version goes. _spill_lock orders replacing chain entries with
+        # SpilledVersions (and back) against merges pruning the chains.
+        self.memory_budget = TABLE_MEMORY_BUDGET
+        self._resident_tail = 0
+        self._spill_lock = threading.Lock()
+        self._next_spill = 0
+        # spill numbers no chain refers to any more: released ones become free (reusable)
+        # at the next merge, whose epoch change makes readers that still hold them retry
+        self._free_spills = []
+        self._released_spills = []
+        # records that may have versions to spill: those a merge found updated, inserted or
+        # read back from disk, until spill has moved all it can. None until the first spill,
+        # which starts from every record
+        self._spill_candidates = None
 
     def get_new_rid(self):
-        rid = self.next_rid
-        self.next_rid += 1
+        """
+        Allocate a record ID. Threads reserve RID_BLOCK_SIZE ids at a time under a lock
+        and hand them out locally, so concurrent inserts rarely contend and never collide.
+        RIDs are unique but not dense: a thread's unused ids are never handed out.
+        """
+        block = self._rid_blocks
+        rid = getattr(block, "next", 0)
+        if rid >= getattr(block, "end", 0):
+            with self._rid_lock:
+                rid = self.next_rid
+                self.next_rid += RID_BLOCK_SIZE
+            block.end = rid + RID_BLOCK_SIZE
+        block.next = rid + 1
         return rid
 
+    def new_timestamp(self):
+        """
+        Timestamp for a version written now (0 if the table is not attached to a Database).
+        """
+        return self.db.next_timestamp() if self.db else 0
+
     def insert_record(self, record_values):
         """
         Insert a new record with the given column values.
         Returns the new record ID.
         """
         rid = self.get_new_rid()
-        self.rid_to_versions[rid] = [record_values]
+        self.store_record(rid, pack_version(record_values), self.new_timestamp())
         pk_val = record_values[self.key]
         self.index.pk_index[pk_val] = rid
         return rid
 
+    def store_record(self, rid, version, timestamp):
+        """
+        Store a new record rid with one (packed) version stamped `timestamp`; indexing
+        it is up to the caller.
+        """
+        self.rid_to_versions[rid] = [version]
+        self.rid_to_timestamps[rid] = new_timestamps(timestamp)
+        self._dirty_rids.add(rid)
+
+    def claim_key(self, rid, version, timestamp, replaceable=None):
+        """
+        Store new record rid with one (packed) version stamped `timestamp` and point its
+        primary key at it, unless the key belongs to another record (one for which
+        replaceable(rid) is true does not count). The check and the claim are one step,
+        so of concurrent inserts of one key only one succeeds. Returns whether it did;
+        secondary indexes are up to the caller.
+        """
+        key = version[self.key]
+        with self._insert_lock:
+            existing = self.index.pk_index.get(key)
+            if existing is not None and not (replaceable and replaceable(existing)):
+                return False
+            self.store_record(rid, version, timestamp)
+            self.index.pk_index[key] = rid
+        return True
+
+    def bulk_load(self, source):
+        """
+        Load many new records at once, far faster than inserting them one by one.
+        source is an iterable of rows, or a CSV or binary file (see bulk_rows).
+        Every primary key is checked against the others and the table before any
+        record is stored (ValueError, and nothing is loaded, on a duplicate). The
+        records then share one timestamp, and each index is built in one pass over
+        the sorted keys and values. No locks are taken, so no other thread may be
+        writing to the table. Returns the number of records loaded.
+        """
+        return self._install_bulk(self._prepare_bulk(bulk_rows(source, self.num_columns)))
+
+    def _prepare_bulk(self, rows):
+        """
+        Pack rows and check their primary keys: (versions, keys, order), where order
+        lists the positions of the rows sorted by key.
+        """
+        versions = [pack_version(row) for row in rows]
+        keys = [version[self.key] for version in versions]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        for previous, current in zip(order, order[1:]):
+            if keys[previous] == keys[current]:
+                raise ValueError(f"Duplicate primary key {keys[current]!r} in bulk load of '{self.name}'")
+        pk_index = self.index.pk_index
+        if pk_index:
+            for key in keys:
+                if key in pk_index:
+                    raise ValueError(f"Primary key {key!r} already exists in '{self.name}'")
+        return versions, keys, order
+
+    def _install_bulk(self, prepared):
+        """
+        Store records checked by _prepare_bulk under consecutive new RIDs, index and log them.
+        """
+        versions, keys, order = prepared
+        count = len(versions)
+        if not count:
+            return 0
+        with self._rid_lock:
+            first = self.next_rid
+            self.next_rid += count
+        timestamp = self.new_timestamp()
+        rids = range(first, first + count)
+        self.rid_to_versions.update(zip(rids, ([version] for version in versions)))
+        stamp = new_timestamps(timestamp)
+        self.rid_to_timestamps.update((rid, stamp[:]) for rid in rids)
+
+        self.index.pk_index.update((keys[i], first + i) for i in order)
+        for column, index in self.index.secondary_indexes.items():
+            pairs = sorted((version[column], rid) for rid, version in enumerate(versions, first))
+            for value, group in groupby(pairs, key=itemgetter(0)):
+                existing = index.get(value)
+                if existing is None:
+                    index[value] = [rid for _, rid in group]
+                else:
+                    existing.extend(rid for _, rid in group)
+
+        if self._spill_candidates is not None:
+            self._spill_candidates.update(rids)
+
+        if self.db is not None:
+            self.db.log_bulk_load(self, timestamp, first, versions)
+            if self.over_memory_budget():
+                self.merge_base_tail()
+        return count
+
+    def append_version(self, rid, version, timestamp=None):
+        """
+        Append a new newest version to rid's chain, stamped with `timestamp`
+        (default: the current timestamp).
+        """
+        if timestamp is None:
+            timestamp = self.new_timestamp()
+        # version first: readers locate versions through the timestamps
+        self.rid_to_versions[rid].append(version)
+        self.rid_to_timestamps[rid].append(timestamp)
+        self._dirty_rids.add(rid)
+        self._resident_tail += 1
+
+    def detach_record(self, rid):
+        """
+        Remove rid's version chain (not its index entries); returns (versions, timestamps).
+        """
+        versions = self.rid_to_versions.pop(rid, None)
+        timestamps = self.rid_to_timestamps.pop(rid, None)
+        if versions:
+            self._resident_tail -= self._resident(versions) - 1
+        if self._spill_candidates is not None:
+            self._spill_candidates.discard(rid)
+        return versions, timestamps
+
+    @staticmethod
+    def _resident(versions):
+        return sum(1 for v in versions if not isinstance(v, SpilledVersion))
+
+    def live_versions(self, versions):
+        """
+        The versions of a chain that hold values: spilled ones read back (without
+        faulting them in), delete tombstones (None) left out.
+        """
+        return [self._load_spilled(v) if isinstance(v, SpilledVersion) else v
+                for v in list(versions) if v is not None]
+
+    def remove_record(self, rid):
+        """
+        Remove a deleted record for good: its version chain, primary key and every
+        secondary index entry.
+        """
+        versions, _ = self.detach_record(rid)
+        live = self.live_versions(versions) if versions else ()
+        if not live:
+            return
+        self._release_spilled(versions)
+        key = live[-1][self.key]
+        if self.index.pk_index.get(key) == rid:
+            del self.index.pk_index[key]
+        for col_id, dct in self.index.secondary_indexes.items():
+            for value in {version[col_id] for version in live}:
+                lst = dct.get(value)
+                if lst and rid in lst:
+                    lst.remove(rid)
+
+    def _release_spilled(self, versions):
+        with self._spill_lock:
+            self._released_spills.extend(v for v in versions if isinstance(v, SpilledVersion))
+
+    def drop_stale_index_entries(self, rid, candidates):
+        """
+        A secondary index lists a record under the value of every version it retains,
+        so snapshot readers find it by the values they see. Remove rid's entries for
+        the values in candidates ({col: values}) that no version holds any more,
+        restoring one a concurrent update wrote back meanwhile.
+        """
+        def held(col_id, value):
+            versions = self.rid_to_versions.get(rid)
+            return bool(versions) and any(v[col_id] == value for v in self.live_versions(versions))
+
+        for col_id, values in candidates.items():
+            dct = self.index.secondary_indexes.get(col_id)
+            if dct is None:
+                continue
+            for value in values:
+                lst = dct.get(value)
+                if not lst or rid not in lst or held(col_id, value):
+                    continue
+                lst.remove(rid)
+                if held(col_id, value):
+                    self.index.add(col_id, value, rid)
+
+    def _pop_pending(self, rid, timestamp):
+        # drop rid's newest version if it is stamped `timestamp`
+        versions = self.rid_to_versions.get(rid)
+        timestamps = self.rid_to_timestamps.get(rid)
+        if versions and timestamps and timestamps[-1] == timestamp:
+            timestamps.pop()
+            versions.pop()
+            self._resident_tail -= 1
+        return versions
+
+    def undo_update(self, rid, timestamp, index_deltas):
+        """
+        Roll back an update: drop rid's newest version if it is stamped `timestamp`,
+        and the index entries of the new values it introduced (index_deltas = [(col, old, new)]).
+        """
+        self._pop_pending(rid, timestamp)
+        candidates = {}
+        for col_id, _, new_val in index_deltas:
+            candidates.setdefault(col_id, set()).add(new_val)
+        self.drop_stale_index_entries(rid, candidates)
+
+    def undo_insert(self, rid):
+        """
+        Roll back an insert: remove the record and its index entries.
+        """
+        versions, _ = self.detach_record(rid)
+        if not versions:
+            return
+        inserted = versions[-1]
+        if self.index.pk_index.get(inserted[self.key]) == rid:
+            del self.index.pk_index[inserted[self.key]]
+        for col_id, dct in self.index.secondary_indexes.items():
+            lst = dct.get(inserted[col_id])
+            if lst and rid in lst:
+                lst.remove(rid)
+
+    def undo_delete(self, rid, timestamp):
+        """
+        Roll back a delete: drop rid's tombstone if it is stamped `timestamp`, and point
+        the primary key back at rid (the transaction may have inserted the key anew).
+        """
+        self._pop_pending(rid, timestamp)
+        version = self.get_latest_version(rid)
+        if version is not None:
+            self.index.pk_index[version[self.key]] = rid
+
+    def apply_redo(self, rid, version, timestamp):
+        """
+        Apply a logged change (recovery, replicas): make `version` the newest version
+        of rid, inserting the record if needed, or remove the record if version is None.
+        """
+        current = self.get_latest_version(rid)
+        secondary = self.index.secondary_indexes
+        if version is None:
+            self.remove_record(rid)
+        elif current is None:
+            self.store_record(rid, pack_version(version), timestamp)
+            self.index.pk_index[version[self.key]] = rid
+            for col_id, dct in secondary.items():
+                dct.setdefault(version[col_id], []).append(rid)
+            self.next_rid = max(self.next_rid, rid + 1)
+        else:
+            for col_id, dct in secondary.items():
+                if current[col_id] != version[col_id]:
+                    lst = dct.get(current[col_id])
+                    if lst and rid in lst:
+                        lst.remove(rid)
+                    dct.setdefault(version[col_id], []).append(rid)
+            self.append_version(rid, pack_version(version), timestamp)
+
     def get_latest_version(self, rid):
         """
-        Return the most recent version (last element) for the given record ID.
+        Return the most recent version (last element) for the given record ID, faulted
+        back in if it was spilled; None if there is none or it is a delete tombstone.
+        """
+        return self.get_relative_version(rid, 0)
+
+    def get_relative_version(self, rid, relative_version):
+        """
+        Return the version `relative_version` steps behind the newest (0 => newest),
+        clamped to the oldest version still retained.
+        Returns None if the record does not exist.
+        """
+        while True:
+            epoch = self._gc_epoch
+            if epoch % 2:
+                time.sleep(0)  # a merge is pruning chains; let it finish
+                continue
+            versions = self.rid_to_versions.get(rid)
+            if not versions:
+                return None
+            try:
+                version = self._resolve(rid, versions, max(0, len(versions) - 1 + relative_version))
+            except IndexError:
+                continue  # chain pruned under us
+            if self._gc_epoch == epoch:
+                return version
+
+    def _resolve(self, rid, versions, idx):
+        """
+        versions[idx] of rid, faulted back in from disk if it was spilled.
+        """
+        version = versions[idx]
+        if isinstance(version, SpilledVersion):
+            spilled, version = version, self._load_spilled(version)
+            with self._spill_lock:
+                # a merge may have pruned the chain meanwhile: only put it back where it was
+                if idx < len(versions) and versions[idx] is spilled:
+                    versions[idx] = version
+                    self._resident_tail += 1
+                    self._released_spills.append(spilled)
+                    self._dirty_rids.add(rid)  # hot again, and spillable
+        return version
+
+    @staticmethod
+    def visible_index(timestamps, snapshot_ts, transaction_id=None):
+        """
+        Index of the version a reader at snapshot_ts sees, or -1 if none is visible:
+        the newest one committed at or before snapshot_ts, or the reader's own
+        pending version (stamped -transaction_id) if it wrote one.
         """
-        versions = self.rid_to_versions.get(rid, [])
-        return versions[-1] if versions else None
+        pending = -transaction_id if transaction_id is not None else None
+        for idx in range(len(timestamps) - 1, -1, -1):
+            ts = timestamps[idx]
+            if ts == pending or 0 <= ts <= snapshot_ts:
+                return idx
+        return -1
+
+    def committed_timestamp(self, rid, snapshot_ts=None):
+        """
+        Timestamp of the newest committed version of rid (at or before snapshot_ts, if given),
+        or None if there is none. Optimistic transactions validate their reads with this.
+        """
+        timestamps = self.rid_to_timestamps.get(rid)
+        if timestamps is None:
+            return None
+        for ts in reversed(list(timestamps)):
+            if ts >= 0 and (snapshot_ts is None or ts <= snapshot_ts):
+                return ts
+        return None
+
+    def read_version(self, rid, snapshot_ts, transaction_id, relative_version=0):
+        """
+        Lock-free snapshot read: the version of rid visible at snapshot_ts to transaction_id
+        (relative_version steps behind it, clamped to the oldest retained version).
+        Returns None if no version is visible, e.g. the record's insert is not committed yet.
+        """
+        while True:
+            epoch = self._gc_epoch
+            if epoch % 2:
+                time.sleep(0)  # a merge is pruning chains; let it finish
+                continue
+            versions = self.rid_to_versions.get(rid)
+            timestamps = self.rid_to_timestamps.get(rid)
+            if versions is None or timestamps is None:
+                return None
+            idx = self.visible_index(timestamps, snapshot_ts, transaction_id)
+            try:
+                version = self._resolve(rid, versions, max(0, idx + relative_version)) if idx >= 0 else None
+            except IndexError:
+                continue  # chain pruned under us
+            if self._gc_epoch == epoch:
+                return version
 
     def merge_base_tail(self):
         """
-        This is a no-op for the test – we do not discard any older versions.
+        Garbage-collect tail versions that no active transaction can still read.
+        For every record we keep the base version, the version visible to the oldest
+        active transaction and everything newer, and at least VERSION_RETENTION versions
+        behind the newest so select_version keeps working.
+        """
+        if not self._merge_lock.acquire(blocking=False):
+            return  # another merge is already pruning this table
+        try:
+            self._prune()
+        finally:
+            self._merge_lock.release()
+
+    def _prune(self):
+        # merge_base_tail's work, under _merge_lock
+        self._gc_epoch += 1
+        dirty = ()
+        try:
+            horizon = self.db.oldest_active_timestamp() if self.db else None
+            secondary = self.index.secondary_indexes
+            dirty, self._dirty_rids = self._dirty_rids, set()
+            for rid in list(dirty):  # writers may still add to it
+                versions = self.rid_to_versions.get(rid)
+                timestamps = self.rid_to_timestamps.get(rid)
+                if not versions or not timestamps:
+                    continue
+                keep_from = len(versions) - 1 - VERSION_RETENTION
+                if horizon is not None:
+                    visible = self.visible_index(timestamps, horizon)
+                    if visible < keep_from:
+                        # an active transaction still needs older versions; revisit next merge
+                        self._dirty_rids.add(rid)
+                        keep_from = visible
+                if keep_from > 1:
+                    # delete in place so concurrent appends to the same list are never lost
+                    with self._spill_lock:
+                        pruned = versions[1:keep_from]
+                        self._resident_tail -= self._resident(pruned)
+                        del versions[1:keep_from]
+                        del timestamps[1:keep_from]
+                    if secondary:
+                        values = self.live_versions(pruned)
+                        self.drop_stale_index_entries(rid, {col_id: {v[col_id] for v in values}
+                                                            for col_id in secondary})
+                    self._release_spilled(pruned)
+            # still mid-merge: a reader holding any of these retries once it is over
+            with self._spill_lock:
+                self._free_spills.extend(self._released_spills)
+                self._released_spills = []
+        finally:
+            self._gc_epoch += 1
+        if self._spill_candidates is not None:
+            self._spill_candidates.update(dirty)
+        if self.over_memory_budget():
+            self.spill(hot=dirty)
+
+    def memory_estimate(self):
+        """
+        Running estimate of the bytes this table's records hold in memory (O(1)).
+        """
+        version_bytes = VERSION_OVERHEAD + 8 * self.num_columns
+        rows = len(self.rid_to_versions)
+        return rows * ROW_OVERHEAD + max(0, rows + self._resident_tail) * version_bytes
+
+    def over_memory_budget(self):
+        if self.memory_budget is not None and self.memory_estimate() > self.memory_budget:
+            return True
+        return self.db is not None and self.db.over_memory_budget()
+
+    def _spill_location(self, number):
+        # (page_id, slot) of spilled version `number`: pages are filled one after the other
+        per_page = PAGE_SIZE // Page.RECORD_SIZE // self.num_columns
+        return f"{self.name}.{number // per_page}", (number % per_page) * self.num_columns
+
+    def _load_spilled(self, number):
+        page_id, slot = self._spill_location(number)
+        return self.db.bufferpool.read_values(page_id, slot, self.num_columns)
+
+    def resolved_versions(self):
         """
-        pass
+        rid_to_versions with spilled versions read back (without faulting them in),
+        for persisting the table.
+        """
+        if self._next_spill == 0:
+            return self.rid_to_versions
+        return {rid: [self._load_spilled(v) if isinstance(v, SpilledVersion) else v for v in versions]
+                for rid, versions in list(self.rid_to_versions.items())}
+
+    def spill(self, hot=()):
+        """
+        Move versions to bufferpool pages until this table (and its database) are within
+        their memory budgets, going through the records that may have any to spill: first
+        the old versions of records not in `hot` (updated or read back since the last
+        merge), then those of any record, then the newest versions of records not in
+        `hot`, so whole cold records. The newest committed version of a record stays in
+        memory while a delete tombstone or uncommitted versions sit above it (if they
+        are undone, it is the newest again). Readers and writers fault spilled versions
+        back in. Only versions of 64-bit integers can be spilled, to the slots of versions
+        pruned or faulted back in before the next ones. Returns how many were spilled.
+        """
+        if self.db is None or PAGE_SIZE // Page.RECORD_SIZE < self.num_columns:
+            return 0
+        if self._spill_candidates is None:
+            self._spill_candidates = set(self.rid_to_versions)
+        candidates = list(self._spill_candidates)
+        spilled = 0
+        for whole, skip_hot in ((False, True), (False, False), (True, True)):
+            for rid in candidates:
+                if not self.over_memory_budget():
+                    return spilled
+                if skip_hot and rid in hot:
+                    continue
+                spilled += self._spill_record(rid, whole)
+        return spilled
+
+    def _spill_record(self, rid, whole):
+        # spill rid's old versions, and its newest committed one too if `whole`; once
+        # nothing is left to spill, rid is no candidate any more. Returns how many.
+        versions = self.rid_to_versions.get(rid)
+        timestamps = self.rid_to_timestamps.get(rid)
+        if not versions or not timestamps:
+            self._spill_candidates.discard(rid)
+            return 0
+        top = min(len(versions), len(timestamps)) - 1
+        newest = top
+        while newest > 0 and (versions[newest] is None or timestamps[newest] < 0):
+            newest -= 1
+        end = newest + 1 if whole and newest == top and timestamps[top] >= 0 else newest
+        pool = self.db.bufferpool
+        spilled = 0
+        for idx in range(end):
+            version = versions[idx]
+            if not isinstance(version, array) or len(version) != self.num_columns:
+                continue
+            with self._spill_lock:
+                if self._free_spills:
+                    number = self._free_spills.pop()
+                else:
+                    number = self._next_spill
+                    self._next_spill += 1
+            page_id, slot = self._spill_location(number)
+            pool.write_values(page_id, slot, version)
+            with self._spill_lock:
+                # the record may have been removed, or an abort may have undone the version
+                if self.rid_to_versions.get(rid) is versions and idx < len(versions) and versions[idx] is version:
+                    versions[idx] = SpilledVersion(number)
+                    self._resident_tail -= 1
+                    spilled += 1
+                else:
+                    self._free_spills.append(number)
+        if whole and not any(isinstance(v, array) and len(v) == self.num_columns for v in list(versions)):
+            self._spill_candidates.discard(rid)
+        return spilled
 
     def start_background_merge(self):
-        # Launch a dummy merge thread (which does nothing in this test)
+        if not BACKGROUND_MERGE:
+            self.merge_base_tail()
+            return
         merge_thread = threading.Thread(target=self.merge_base_tail, daemon=True)
         merge_thread.start()
 
@@ -78,3 +697,36 @@ class Table:
         for rid, versions in self.rid_to_versions.items():
             if versions:
                 self.rid_to_versions[rid] = [versions[0]]
+                self.rid_to_timestamps[rid] = new_timestamps(0)
+        self._resident_tail = 0
+        self._spill_candidates = None
+
+    def memory_usage(self):
+        """
+        Approximate bytes held by this table's records and indexes:
+        {"rows", "versions", "spilled_versions", "version_bytes", "index_bytes", "bytes",
+        "bytes_per_row"}. Walks every record; memory_estimate is the cheap running figure.
+        Small ints (-5..256) are shared by the interpreter and not counted.
+        """
+        def sizeof_values(values):
+            size = sys.getsizeof(values)
+            if isinstance(values, list):
+                size += sum(sys.getsizeof(v) for v in values
+                            if not (isinstance(v, int) and -5 <= v <= 256))
+            return size
+
+        version_bytes = sys.getsizeof(self.rid_to_versions) + sys.getsizeof(self.rid_to_timestamps)
+        num_versions = spilled = 0
+        for rid, versions in list(self.rid_to_versions.items()):
+            num_versions += len(versions)
+            spilled += len(versions) - self._resident(versions)
+            version_bytes += sys.getsizeof(versions) + sum(sizeof_values(v) for v in versions)
+            version_bytes += sizeof_values(self.rid_to_timestamps.get(rid, ()))
+        index_bytes = sys.getsizeof(self.index.pk_index)
+        for dct in self.index.secondary_indexes.values():
+            index_bytes += sys.getsizeof(dct) + sum(sizeof_values(rids) for rids in dct.values())
+        rows = len(self.rid_to_versions)
+        total = version_bytes + index_bytes
+        return {"rows": rows, "versions": num_versions, "spilled_versions": spilled,
+                "version_bytes": version_bytes, "index_bytes": index_bytes, "bytes": total,
+                "bytes_per_row": total / rows if rows else 0.0}
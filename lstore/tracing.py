@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import threading
+import time
+
+MAX_EVENTS = 1000000   # spans a Tracer keeps; later ones are counted as dropped
+
+
+class Tracer:
+    """
+    Collects timed spans of transactions, for Database.start_tracing():
+      transaction   a whole Transaction.run (args: txn id, committed)
+      queue         from being queued in a TransactionWorker (or for a retry) to running
+      execute       the queries of Transaction.prepare, with a span per query inside
+      lock          a lock request of a query (args: key, mode, granted)
+      log_flush     appending the commit record to the write-ahead log
+      commit/abort  finishing the transaction
+    export() writes them in Chrome trace format, for chrome://tracing or Perfetto:
+    spans on one thread nest by time. A SamplingProfiler attached as self.profiler
+    has its report exported along.
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self.threads = {}   # thread ident -> name
+        self.origin = time.perf_counter_ns()
+        self.profiler = None
+
+    def span(self, name, start, end, **args):
+        """
+        Record span `name` from start to end (perf_counter_ns) on the calling thread.
+        """
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        ident = threading.get_ident()
+        if ident not in self.threads:
+            self.threads[ident] = threading.current_thread().name
+        # list.append is atomic: spans from any thread need no lock
+        self.events.append((name, start, end, ident, args))
+
+    def trace_events(self):
+        """
+        The spans as Chrome trace events (timestamps in microseconds).
+        """
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": ident, "args": {"name": name}}
+                  for ident, name in list(self.threads.items())]
+        for name, start, end, ident, args in list(self.events):
+            events.append({"name": name, "cat": "lstore", "ph": "X", "pid": pid, "tid": ident,
+                           "ts": (start - self.origin) / 1000, "dur": (end - start) / 1000,
+                           "args": args})
+        return events
+
+    def export(self, path):
+        """
+        Write the trace as a Chrome trace / Perfetto JSON file.
+        """
+        other = {"dropped_spans": self.dropped}
+        if self.profiler is not None:
+            other["cpu_by_method"] = self.profiler.report()
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms",
+                       "otherData": other}, f, default=str)
+
+
+class SamplingProfiler:
+    """
+    Attributes CPU time to Query methods without an external profiler: every
+    `interval` seconds a thread looks at the stack of every other thread and
+    counts a sample for the innermost Query method running there, and for the
+    function actually executing (the leaf). Threads blocked on a lock or event
+    count as waiting, not CPU.
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        ...                       # run the workload
+        profiler.stop()
+        profiler.report()         # {"Query.update": {"samples": ..., "share": ..., "top": [...]}, ...}
+    """
+
+    def __init__(self, interval=0.005, classes=None):
+        if classes is None:
+            from lstore.query import Query
+            classes = (Query,)
+        self.interval = interval
+        # code object -> "Class.method" of the methods samples are attributed to
+        self.targets = {}
+        for cls in classes:
+            for name, attr in vars(cls).items():
+                code = getattr(attr, "__code__", None)
+                if code is not None:
+                    self.targets[code] = f"{cls.__name__}.{name}"
+        self.samples = {}   # method -> {leaf function: count}
+        self.stacks = {}    # collapsed stack -> count
+        self.total = 0
+        self.waiting = 0
+        self.outside = 0    # samples of threads not inside a target method
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._sample(frame)
+
+    def _sample(self, frame):
+        self.total += 1
+        leaf = frame.f_code
+        if os.path.basename(leaf.co_filename) == "threading.py":
+            self.waiting += 1  # blocked in Event.wait, Thread.join, ...
+            return
+        names = []
+        method = None
+        while frame is not None:
+            code = frame.f_code
+            names.append(code.co_name)
+            if method is None and code in self.targets:
+                method = self.targets[code]
+            frame = frame.f_back
+        if method is None:
+            self.outside += 1
+            return
+        leaf_name = f"{os.path.basename(leaf.co_filename)}:{leaf.co_name}"
+        counts = self.samples.setdefault(method, {})
+        counts[leaf_name] = counts.get(leaf_name, 0) + 1
+        stack = ";".join(reversed(names))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def report(self, top=5):
+        """
+        {method: {"samples", "share" of all CPU samples, "top" leaf functions}}, busiest first.
+        """
+        busy = self.total - self.waiting
+        report = {}
+        for method, counts in sorted(self.samples.items(), key=lambda item: -sum(item[1].values())):
+            samples = sum(counts.values())
+            report[method] = {"samples": samples, "share": samples / busy if busy else 0.0,
+                              "top": sorted(counts.items(), key=lambda item: -item[1])[:top]}
+        return report
+
+    def collapsed(self):
+        """
+        The sampled stacks in "frame;frame;frame count" lines, the input of flame graph tools.
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in
+                         sorted(self.stacks.items(), key=lambda item: -item[1]))
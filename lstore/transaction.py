@@ -1,22 +1,76 @@
+import time
+from lstore.config import ENABLE_CONCURRENCY
+from lstore.lock_manager import LockMode
+from lstore.metrics import (ABORT_EXPLICIT, ABORT_EXCEPTION, ABORT_LOCK_CONFLICT, ABORT_QUERY_FAILED,
+                            ABORT_VALIDATION, RETRYABLE_ABORTS)
+
+class IsolationLevel:
+    """
+    How a transaction's reads are isolated from concurrent writers.
+    - SNAPSHOT: multi-version reads of the snapshot at the transaction's start
+      timestamp, without locks. Writers still take exclusive locks, and abort if the
+      record was changed by a transaction that committed after they started (first
+      updater wins). A delete takes effect for others when it commits: from then on
+      even older snapshots no longer see the record.
+    - SERIALIZABLE: strict 2PL; reads take shared locks and see the newest version.
+    """
+    SNAPSHOT = "SNAPSHOT"
+    SERIALIZABLE = "SERIALIZABLE"
+
+class ConcurrencyMode:
+    """
+    How a transaction is kept isolated from concurrent writers.
+    - PESSIMISTIC: strict 2PL; locks are taken as each query runs.
+    - OPTIMISTIC: reads record the version they saw and writes are buffered;
+      commit validates the reads and installs the writes atomically.
+    """
+    PESSIMISTIC = "2PL"
+    OPTIMISTIC = "OCC"
+
+class OptimisticState:
+    """
+    Bookkeeping of a transaction running in ConcurrencyMode.OPTIMISTIC.
+    - reads:    {(table, rid): timestamp of the committed version read}
+    - overlay:  {(table, rid): columns this transaction wrote, or None if it deleted the record}
+    - inserted: {(table, pk): columns of records this transaction inserted}
+    - writes:   buffered write queries [(query_fn, args)], replayed at commit
+    """
+
+    def __init__(self):
+        self.reads = {}
+        self.overlay = {}
+        self.inserted = {}
+        self.writes = []
+        # set while commit replays the writes, so queries execute instead of buffering
+        self.installing = False
+
 class Transaction:
     """
     A transaction that can run multiple queries.
     If concurrency is used, we store a valid transaction ID.
-    Otherwise, we store -1 or None to skip concurrency.
+    Otherwise, we store -1 until the database assigns one when the transaction starts.
     """
 
-    def __init__(self, transaction_id=None):
+    def __init__(self, transaction_id=None, mode=None):
         """
-        If transaction_id is None => single-thread or no concurrency
+        If transaction_id is None => the database assigns an id when run() starts.
         Otherwise store an integer ID for lock manager usage.
+        mode is a ConcurrencyMode; None => the database's concurrency_mode.
         """
         if transaction_id is None:
             self.tid = -1
         else:
             self.tid = transaction_id
+        self.mode = mode
 
         self.queries = []
-        self.rollback_log = []
+        self.results = []
+        # set by Database.begin_transaction: the versions this transaction can see
+        self.start_ts = None
+        # when it was last queued to run (perf_counter_ns), for the "queue" trace span
+        self.queued_at = None
+        # why the last run aborted (an ABORT_* reason), None if it did not
+        self.abort_reason = None
 
     def add_query(self, query_fn, table, *args):
         """
@@ -26,56 +80,172 @@ class Transaction:
         """
         self.queries.append((query_fn, table, args))
 
-        # If it's an update or delete, store old columns for rollback
-        if query_fn.__name__ in ["update", "delete"]:
-            if args:
-                key = args[0]  # the primary key
-                rid = table.index.pk_index.get(key, None)
-                if rid is not None and rid in table.rid_to_versions:
-                    # the newest version's columns
-                    old_cols = table.rid_to_versions[rid][-1]
-                    # Store for rollback
-                    self.rollback_log.append((table, rid, old_cols))
+    @property
+    def retryable(self):
+        """
+        Whether the last run aborted for a reason a re-run may get past (a lock,
+        validation or write conflict), rather than a query that will fail again.
+        """
+        return self.abort_reason in RETRYABLE_ABORTS
+
+    def _database(self):
+        """
+        The Database the queried tables belong to, if any.
+        """
+        if self.queries:
+            return self.queries[0][1].db
+        return None
 
     def run(self):
         """
         Run each query in order. If any fails (returns False), abort.
+        While running, the transaction is registered with the database so
+        version garbage collection keeps everything it can still read.
         """
-        for (query_fn, table, args) in self.queries:
-            result = query_fn(*args, transaction_id=self.tid)
-            if result is False:
-                return self.abort()
-        return self.commit()
+        db = self._database()
+        tracer = db.tracer if db else None
+        if tracer is None:
+            if not self.prepare():
+                return False
+            return self.commit()
+        start = time.perf_counter_ns()
+        if self.queued_at is not None:
+            tracer.span("queue", self.queued_at, start)
+        committed = False
+        try:
+            committed = self.prepare() and self.commit()
+        finally:
+            tracer.span("transaction", start, time.perf_counter_ns(), tid=self.tid, committed=committed)
+        return committed
 
-    def abort(self):
+    def prepare(self):
         """
-        Roll back changes if possible.
-        Then release locks.
+        Execute every query without committing, keeping all locks held.
+        Query return values are collected in self.results.
+        If any query fails the transaction is aborted and False is returned;
+        otherwise the caller must finish with commit() or abort()
+        (a two-phase commit coordinator votes on the result in between).
         """
-        # naive rollback: restore old columns
-        for (table, rid, old_cols) in reversed(self.rollback_log):
-            if rid in table.rid_to_versions and table.rid_to_versions[rid]:
-                # revert the newest version to old_cols
-                table.rid_to_versions[rid][-1] = old_cols[:]
-            # If you maintain secondary indexes or special flags, you'd revert them too.
+        db = self._database()
+        self.abort_reason = None
+        if db:
+            db.begin_transaction(self)
+            if (self.mode or db.concurrency_mode) == ConcurrencyMode.OPTIMISTIC:
+                db.optimistic[self.tid] = OptimisticState()
+        tracer = db.tracer if db else None
+        start = time.perf_counter_ns() if tracer is not None else 0
+        self.results = []
+        try:
+            for (query_fn, table, args) in self.queries:
+                if tracer is None:
+                    result = query_fn(*args, transaction_id=self.tid)
+                else:
+                    result = self._traced_query(tracer, query_fn, args)
+                if result is False:
+                    self.abort(ABORT_QUERY_FAILED)
+                    return False
+                self.results.append(result)
+        except Exception:
+            self.abort(ABORT_EXCEPTION)
+            raise
+        finally:
+            if tracer is not None:
+                tracer.span("execute", start, time.perf_counter_ns(), tid=self.tid)
+        return True
 
-        # release locks
-        if self.queries:
-            table = self.queries[0][1]
-            if table.db and table.db.lock_manager and self.tid != -1:
-                table.db.lock_manager.release_all(self.tid)
+    def _traced_query(self, tracer, query_fn, args):
+        start = time.perf_counter_ns()
+        result = query_fn(*args, transaction_id=self.tid)
+        tracer.span(getattr(query_fn, "__name__", "query"), start, time.perf_counter_ns(),
+                    tid=self.tid, failed=result is False)
+        return result
+
+    def abort(self, reason=ABORT_EXPLICIT):
+        """
+        Roll back changes: drop every version this transaction wrote.
+        Then release locks. `reason` becomes self.abort_reason (and what the abort is
+        counted under in the database's metrics), unless a lock conflict caused it.
+        """
+        db = self._database()
+        tracer = db.tracer if db else None
+        start = time.perf_counter_ns() if tracer is not None else 0
+        if db:
+            db.rollback_versions(self.tid)
+            reason = db.abort_reason(self.tid, reason)
+            if db.metrics is not None:
+                db.metrics.abort(reason)
+        self.abort_reason = reason
 
-        self.rollback_log.clear()
+        self._finish(db)
+        if tracer is not None:
+            tracer.span("abort", start, time.perf_counter_ns(), tid=self.tid, reason=reason)
         return False
 
     def commit(self):
         """
-        Release locks at commit.
+        Make this transaction's versions visible, then release locks.
+        An optimistic transaction first validates its reads and installs its writes,
+        and aborts instead if validation fails.
         """
-        if self.queries:
-            table = self.queries[0][1]
-            if table.db and table.db.lock_manager and self.tid != -1:
-                table.db.lock_manager.release_all(self.tid)
-
-        self.rollback_log.clear()
+        db = self._database()
+        metrics = db.metrics if db else None
+        tracer = db.tracer if db else None
+        start = time.perf_counter_ns() if metrics is not None or tracer is not None else 0
+        if db:
+            state = db.optimistic.get(self.tid)
+            if state is not None and not self._install(db, state):
+                return self.abort(ABORT_VALIDATION)
+            db.commit_versions(self.tid)
+        self._finish(db)
+        if metrics is not None or tracer is not None:
+            end = time.perf_counter_ns()
+            if metrics is not None:
+                metrics.commit(end - start)
+            if tracer is not None:
+                tracer.span("commit", start, end, tid=self.tid)
         return True
+
+    def _finish(self, db):
+        # release locks and unregister
+        if db and db.lock_manager and self.tid != -1:
+            db.lock_manager.release_all(self.tid)
+        if db:
+            db.optimistic.pop(self.tid, None)
+            db.end_transaction(self)
+
+    def _install(self, db, state):
+        """
+        Optimistic commit: lock the write set exclusively and the read set shared (so
+        no 2PL writer is mid-flight on them), then under the database's commit lock
+        check nothing we read has been overwritten since and replay the buffered writes.
+        The locks are taken first, in one order, as waiting for one (WAIT_DIE,
+        WOUND_WAIT) must not hold up every other optimistic commit.
+        Returns False if the transaction must abort.
+        """
+        if ENABLE_CONCURRENCY:
+            lm = db.lock_manager
+            for table, rid in sorted(state.overlay, key=_lock_order):
+                if not lm.lock_row(self.tid, table.name, rid, LockMode.EXCLUSIVE):
+                    return self._lock_refused(db)
+            for table, rid in sorted(state.reads, key=_lock_order):
+                if not lm.lock_row(self.tid, table.name, rid, LockMode.SHARED):
+                    return self._lock_refused(db)
+        with db._commit_lock:
+            for (table, rid), seen_ts in state.reads.items():
+                if table.committed_timestamp(rid) != seen_ts:
+                    return False
+            state.installing = True
+            for query_fn, args in state.writes:
+                if query_fn(*args, transaction_id=self.tid) is False:
+                    return False
+            return True
+
+    def _lock_refused(self, db):
+        db.blame(self.tid, ABORT_LOCK_CONFLICT)
+        return False
+
+
+def _lock_order(key):
+    # (table, rid) keys in the order commit-time locks are taken
+    table, rid = key
+    return table.name, rid
@@ -1,31 +1,106 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from lstore.config import ENABLE_CONCURRENCY, MAX_RETRIES, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX
+
 class TransactionWorker:
     """
-    A simple worker that can run multiple transactions (synchronously).
-    Your testers call run() and then join(), but we do not actually spin up new threads.
+    A worker that runs its transactions on a dedicated thread.
+    run() starts the thread and returns immediately, join() waits for it.
+    With ENABLE_CONCURRENCY off, run() executes the transactions on the caller's thread.
+
+    A transaction aborted by a lock conflict or failed validation is requeued with
+    exponential, jittered backoff and re-run, up to max_retries times. Other queued
+    transactions run while it backs off. One whose query failed (a duplicate or
+    missing key) would fail again, and is not retried.
     """
 
-    def __init__(self, transactions=None):
+    def __init__(self, transactions=None, max_retries=MAX_RETRIES):
         self.transactions = transactions if transactions else []
+        self.max_retries = max_retries
         self.stats = []
         self.result = 0
+        # per-worker throughput/abort stats, filled in by run()
+        self.aborts = 0
+        self.retries = 0
+        self.elapsed = 0.0
+        # (transaction, retries, committed) for every transaction, in completion order
+        self.outcomes = []
+        self._thread = None
+        self._error = None
 
     def add_transaction(self, t):
         self.transactions.append(t)
 
     def run(self):
         """
-        Execute each transaction in this worker (synchronously).
-        If a transaction aborts, we do not retry here unless your spec requires it.
+        Start executing this worker's transactions.
         """
+        if not ENABLE_CONCURRENCY:
+            self._run()
+            return
+        self._thread = threading.Thread(target=self._run, name="TransactionWorker")
+        self._thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        # (ready_at, seq, attempt, txn); seq keeps ordering stable among equal ready times
+        seq = itertools.count()
+        queue = [(start, next(seq), 0, txn) for txn in self.transactions]
+        queued_at = time.perf_counter_ns()
         for txn in self.transactions:
-            success = txn.run()
-            self.stats.append(success)
+            txn.queued_at = queued_at
+        try:
+            while queue:
+                ready_at, _, attempt, txn = heapq.heappop(queue)
+                delay = ready_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                success = txn.run()
+                if not success:
+                    self.aborts += 1
+                    if attempt < self.max_retries and txn.retryable:
+                        self.retries += 1
+                        db = txn._database()
+                        if db is not None and db.metrics is not None:
+                            db.metrics.retry()
+                        ready = time.perf_counter() + self._backoff(attempt)
+                        txn.queued_at = time.perf_counter_ns()
+                        heapq.heappush(queue, (ready, next(seq), attempt + 1, txn))
+                        continue
+                self.stats.append(success)
+                self.outcomes.append((txn, attempt, success))
+        except Exception as e:
+            self._error = e
+        finally:
+            self.elapsed = time.perf_counter() - start
+            # how many eventually succeeded
+            self.result = sum(1 for x in self.stats if x)
 
-        # how many eventually succeeded
-        self.result = sum(1 for x in self.stats if x)
+    @staticmethod
+    def _backoff(attempt):
+        """
+        Full-jitter exponential backoff: uniform in [0, min(max, base * 2^attempt)],
+        so retries of transactions that collided spread out instead of colliding again.
+        """
+        return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * (2 ** attempt)))
 
     def join(self):
         """
-        No-op, required so your tester doesn't crash on worker.join().
+        Wait for the worker thread to finish. Re-raises anything a transaction raised.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    @property
+    def throughput(self):
+        """
+        Committed transactions per second over the last run.
         """
-        pass
+        return self.result / self.elapsed if self.elapsed else 0.0
@@ -0,0 +1,160 @@
+import os
+import struct
+import threading
+import msgpack
+from lstore.config import WAL_FSYNC
+
+# File layout: an 8-byte header holding the log's epoch (incremented at every
+# checkpoint, when the log is replaced by an empty one), then records, each a
+# 4-byte big-endian length and a msgpack array:
+#   [timestamp, [[table_name, rid, newest version or None if deleted], ...]]
+# where timestamp is the clock when the commit was logged (it is stamped later, see
+# Database.commit_versions; a record's rows were locked, so per row they stay ordered)
+# or, for a schema change (see Database.log_schema):
+#   [timestamp, {"op": "create_table" | "drop_table" | "create_index" | "drop_index",
+#                "table": table_name, "args": [...]}]
+HEADER = struct.Struct(">Q")
+LENGTH = struct.Struct(">I")
+
+
+def read_epoch(path):
+    """
+    Epoch of the log at path, or None if there is none.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    return HEADER.unpack(header)[0] if len(header) == HEADER.size else None
+
+
+class WalReader:
+    """
+    Reads the records of a log file incrementally, as they are appended.
+    A record still being written (or torn by a crash) is left for the next call.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.epoch = HEADER.unpack(self._file.read(HEADER.size))[0]
+        self.offset = HEADER.size
+
+    def read_new(self):
+        """
+        The records appended since the last call, as (timestamp, changes) pairs.
+        """
+        records = []
+        self._file.seek(self.offset)
+        data = self._file.read()
+        pos = 0
+        while pos + LENGTH.size <= len(data):
+            size = LENGTH.unpack_from(data, pos)[0]
+            end = pos + LENGTH.size + size
+            if end > len(data):
+                break
+            ts, changes = msgpack.unpackb(data[pos + LENGTH.size:end], raw=False, strict_map_key=False)
+            records.append((ts, changes))
+            pos = end
+        self.offset += pos
+        return records
+
+    def rotated(self):
+        """
+        True once the log at self.path has been replaced by a checkpoint.
+        """
+        return read_epoch(self.path) != self.epoch
+
+    def close(self):
+        self._file.close()
+
+
+class WriteAheadLog:
+    """
+    Redo log of a Database. Every commit appends one record with the final image of
+    each row it changed, before the changes become visible; open() replays the log
+    over the last checkpoint (the .tbl files) and close() checkpoints and empties it.
+    Records are flushed to the OS at once, so replicas tailing the file see them;
+    with WAL_FSYNC they are also fsynced, surviving power loss and not just crashes.
+    Commits appending at the same time share fsyncs (group commit).
+    """
+
+    def __init__(self, path, fsync=WAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # records appended, and how many of them an fsync has covered
+        self._appended = 0
+        self._synced = 0
+        self._sync_lock = threading.Lock()
+        if read_epoch(path) is None:
+            self._replace(0)
+        self.epoch = read_epoch(path)
+        self._file = None
+
+    def recover(self):
+        """
+        The records in the log, for replay. A torn record at the end (from a crash
+        mid-append) is cut off, then the log is opened for appending.
+        """
+        reader = WalReader(self.path)
+        records = reader.read_new()
+        reader.close()
+        self._file = open(self.path, "r+b")
+        self._file.truncate(reader.offset)
+        self._file.seek(reader.offset)
+        return records
+
+    def append(self, timestamp, changes):
+        """
+        Append one record: [[table_name, rid, version or None], ...] logged at
+        timestamp, or a schema change (a dict, see the file layout above).
+        """
+        payload = msgpack.packb([timestamp, changes], use_bin_type=True)
+        with self._lock:
+            self._file.write(LENGTH.pack(len(payload)) + payload)
+            self._file.flush()
+            self._appended += 1
+            seq = self._appended
+        if self.fsync:
+            self._sync(seq)
+
+    def _sync(self, seq):
+        # fsync through record seq; one fsync covers every record appended before it
+        # started, so commits queued behind it return without their own
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                target = self._appended
+                fileno = self._file.fileno()
+            os.fsync(fileno)
+            self._synced = target
+
+    def checkpoint(self):
+        """
+        Replace the log by an empty one with the next epoch. Call once the tables
+        have been persisted: everything logged so far is in them.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.epoch += 1
+            self._replace(self.epoch)
+            self._file = open(self.path, "ab")
+
+    def _replace(self, epoch):
+        # atomically, so a replica never sees a half-written header
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(epoch))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
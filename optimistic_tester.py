@@ -0,0 +1,95 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction, ConcurrencyMode
+from lstore.transaction_worker import TransactionWorker
+
+from random import randint, sample, seed
+
+db = Database(concurrency_mode=ConcurrencyMode.OPTIMISTIC)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+number_of_records = 100
+number_of_transactions = 200
+num_threads = 8
+seed(3562901)
+
+records = {}
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+keys = sorted(records.keys())
+
+
+def prepared(*queries):
+    t = Transaction()
+    for query_fn, *args in queries:
+        t.add_query(query_fn, grades_table, *args)
+    if not t.prepare():
+        print('transaction error: could not run', queries)
+    return t
+
+
+# buffered writes: only the writer sees them until it commits
+key, new_key = keys[0], 92106429 + number_of_records
+writer = prepared((query.update, key, None, 50, None, None, None),
+                  (query.insert, new_key, 1, 2, 3, 4))
+if query.select(key, 0, [1, 1, 1, 1, 1])[0].columns != records[key] or query.select(new_key, 0, [1, 1, 1, 1, 1]):
+    print('optimistic error: buffered writes are visible before commit')
+if query.select(key, 0, [1, 1, 1, 1, 1], transaction_id=writer.tid)[0].columns[1] != 50:
+    print('optimistic error: the writer does not see its own update')
+if [r.columns[0] for r in query.select(50, 1, [1, 1, 1, 1, 1], transaction_id=writer.tid)] != [key]:
+    print('optimistic error: the writer does not find its own update by value')
+if not query.select(new_key, 0, [1, 1, 1, 1, 1], transaction_id=writer.tid):
+    print('optimistic error: the writer does not see its own insert')
+if not writer.commit():
+    print('optimistic error: the writer failed to commit')
+records[key][1] = 50
+records[new_key] = [new_key, 1, 2, 3, 4]
+for k in (key, new_key):
+    result = query.select(k, 0, [1, 1, 1, 1, 1])
+    if not result or result[0].columns != records[k]:
+        print('select error after commit on', k, ':', result, ', correct:', records[k])
+print("Buffered writes finished")
+
+# validation: a transaction whose read was overwritten before it commits aborts
+key = keys[1]
+reader = prepared((query.select, key, 0, [1, 1, 1, 1, 1]),
+                  (query.update, keys[2], None, 7, None, None, None))
+overwriter = prepared((query.update, key, None, 9, None, None, None))
+overwriter.commit()
+records[key][1] = 9
+if reader.commit():
+    print('validation error: a transaction committed after its read was overwritten')
+if reader.abort_reason != 'validation' or not reader.retryable:
+    print('validation error: abort reason', reader.abort_reason)
+if query.select(keys[2], 0, [1, 1, 1, 1, 1])[0].columns != records[keys[2]]:
+    print('validation error: the aborted transaction installed its update')
+print("Validation finished")
+
+# concurrent transactions install all of their writes or none: every transaction
+# sets both keys of a pair to its own number, so the two always end up equal
+paired = sample(keys[3:], 20)
+pairs = [sorted(paired[i:i + 2]) for i in range(0, len(paired), 2)]
+transaction_workers = [TransactionWorker() for _ in range(num_threads)]
+for i in range(number_of_transactions):
+    first, second = pairs[i % len(pairs)]
+    t = Transaction()
+    t.add_query(query.select, grades_table, first, 0, [1, 1, 1, 1, 1])
+    t.add_query(query.update, grades_table, first, None, None, None, None, i)
+    t.add_query(query.update, grades_table, second, None, None, None, None, i)
+    transaction_workers[i % num_threads].add_transaction(t)
+for worker in transaction_workers:
+    worker.run()
+for worker in transaction_workers:
+    worker.join()
+committed = sum(worker.result for worker in transaction_workers)
+if committed != number_of_transactions:
+    print('optimistic error:', number_of_transactions - committed, 'transactions never committed')
+for first, second in pairs:
+    a = query.select(first, 0, [1, 1, 1, 1, 1])[0].columns[4]
+    b = query.select(second, 0, [1, 1, 1, 1, 1])[0].columns[4]
+    if a != b:
+        print('atomicity error on', first, second, ':', a, b)
+print("Concurrent optimistic transactions finished")
@@ -0,0 +1,98 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction, IsolationLevel
+
+from random import randint, seed
+
+db = Database(isolation_level=IsolationLevel.SNAPSHOT)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+number_of_records = 100
+seed(3562901)
+
+records = {}
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+keys = sorted(records.keys())
+snapshot = {key: columns.copy() for key, columns in records.items()}
+
+
+def prepared(*queries):
+    t = Transaction()
+    for query_fn, *args in queries:
+        t.add_query(query_fn, grades_table, *args)
+    if not t.prepare():
+        print('transaction error: could not run', queries)
+    return t
+
+
+# a reader keeps seeing its snapshot while others commit updates and deletes
+reader = prepared((query.select, keys[0], 0, [1, 1, 1, 1, 1]))
+for key in keys[:50]:
+    records[key][2] = 100 + key % 7
+    query.update(key, None, None, records[key][2], None, None)
+deleted = keys[50:60]
+for key in deleted:
+    query.delete(key)
+    del records[key]
+for key in keys[:50]:
+    result = query.select(key, 0, [1, 1, 1, 1, 1], transaction_id=reader.tid)[0].columns
+    if result != snapshot[key]:
+        print('snapshot error on', key, ':', result, ', correct:', snapshot[key])
+    # by the old value through the secondary index, too
+    if key not in [r.columns[0] for r in query.select(snapshot[key][2], 2, [1, 1, 1, 1, 1], transaction_id=reader.tid)]:
+        print('snapshot index error on', key, ': not found by', snapshot[key][2])
+correct = sum(snapshot[key][1] for key in keys[:50])
+result = query.sum(keys[0], keys[49], 1, transaction_id=reader.tid)
+if result != correct:
+    print('snapshot sum error:', result, ', correct:', correct)
+reader.commit()
+
+# transactions starting now see every commit that returned
+for key in keys:
+    t = prepared((query.select, key, 0, [1, 1, 1, 1, 1]))
+    result = t.results[0]
+    t.commit()
+    if key in records and (not result or result[0].columns != records[key]):
+        print('select error on', key, ':', result, ', correct:', records[key])
+    if key not in records and result:
+        print('select error on deleted', key, ':', result[0].columns)
+print("Snapshot reads finished")
+
+# first updater wins: a writer aborts if the record changed after its snapshot
+key = keys[0]
+first = prepared((query.select, key, 0, [1, 1, 1, 1, 1]))
+second = prepared((query.select, key, 0, [1, 1, 1, 1, 1]))
+if not query.update(key, None, 1, None, None, None, transaction_id=first.tid):
+    print('update error: the first updater failed')
+first.commit()
+records[key][1] = 1
+if query.update(key, None, 2, None, None, None, transaction_id=second.tid):
+    print('write conflict error: the second updater overwrote a newer commit')
+second.abort()
+if second.abort_reason != 'write_conflict' or not second.retryable:
+    print('write conflict error: abort reason', second.abort_reason)
+retry = Transaction()
+retry.add_query(query.update, grades_table, key, None, 2, None, None, None)
+if not retry.run():
+    print('write conflict error: the retry failed')
+records[key][1] = 2
+if query.select(key, 0, [1, 1, 1, 1, 1])[0].columns != records[key]:
+    print('select error after write conflict on', key)
+print("First updater wins finished")
+
+# a reader's snapshot outlives merges that prune versions nobody else needs
+reader = prepared((query.select, keys[1], 0, [1, 1, 1, 1, 1]))
+before = query.select(keys[1], 0, [1, 1, 1, 1, 1], transaction_id=reader.tid)[0].columns
+for value in range(grades_table.MERGE_THRESHOLD * 2):
+    query.update(keys[1], None, None, None, value % 50, None)
+grades_table.merge_base_tail()
+result = query.select(keys[1], 0, [1, 1, 1, 1, 1], transaction_id=reader.tid)[0].columns
+if result != before:
+    print('snapshot error after merge on', keys[1], ':', result, ', correct:', before)
+reader.commit()
+print("Snapshot across merge finished")
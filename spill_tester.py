@@ -0,0 +1,113 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from random import randint, seed
+import shutil
+
+path = './ECS165_spill'
+shutil.rmtree(path, ignore_errors=True)
+db = Database()
+db.open(path)
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+number_of_records = 200
+number_of_updates = 10
+seed(3562901)
+
+records = {}
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+keys = sorted(records.keys())
+
+# keep every version: all of them are older than a transaction that stays open
+history = {key: [records[key].copy()] for key in keys}
+reader = Transaction()
+reader.add_query(query.select, grades_table, keys[0], 0, [1, 1, 1, 1, 1])
+reader.prepare()
+for _ in range(number_of_updates):
+    for key in keys:
+        value = randint(0, 20)
+        records[key][2] = value
+        query.update(key, None, None, value, None, None)
+        history[key].append(records[key].copy())
+reader.commit()
+
+# squeeze the table: merges spill old versions to disk pages
+grades_table.memory_budget = 1
+grades_table.merge_base_tail()
+if grades_table.memory_usage()["spilled_versions"] == 0:
+    print('spill error: no version was spilled')
+print("Spill finished")
+
+# spilled versions fault back in on access
+for key in keys:
+    for relative_version in (0, -1, -2):
+        expected = history[key][max(0, len(history[key]) - 1 + relative_version)]
+        record = query.select_version(key, 0, [1, 1, 1, 1, 1], relative_version)[0]
+        if record.columns != expected:
+            print('select_version error on', key, relative_version, ':', record.columns, ', correct:', expected)
+print("Fault-in finished")
+
+# a merge spills the committed version under an update that then aborts
+key = keys[0]
+transaction = Transaction()
+transaction.add_query(query.update, grades_table, key, None, 99, None, None, None)
+transaction.prepare()
+grades_table.merge_base_tail()
+transaction.abort()
+if not query.update(key, None, 7, None, None, None):
+    print('update error after aborted update on', key)
+records[key][1] = 7
+record = query.select(key, 0, [1, 1, 1, 1, 1])[0]
+if record.columns != records[key]:
+    print('select error after aborted update on', key, ':', record.columns, ', correct:', records[key])
+print("Abort over spilled version finished")
+
+# pruned and faulted-in versions give their spill slots back
+grades_table.memory_budget = 1
+for _ in range(number_of_updates):
+    for key in keys:
+        records[key][3] = randint(0, 20)
+        query.update(key, None, None, None, records[key][3], None)
+    for key in keys[::10]:
+        query.select_version(key, 0, [1, 1, 1, 1, 1], -1)
+    grades_table.merge_base_tail()
+slots = grades_table._next_spill
+for _ in range(number_of_updates):
+    for key in keys:
+        records[key][3] = randint(0, 20)
+        query.update(key, None, None, None, records[key][3], None)
+    grades_table.merge_base_tail()
+if grades_table._next_spill > slots + number_of_records:
+    print('spill error: spill slots keep growing:', slots, '->', grades_table._next_spill)
+for key in keys:
+    record = query.select(key, 0, [1, 1, 1, 1, 1])[0]
+    if record.columns != records[key]:
+        print('select error on', key, ':', record.columns, ', correct:', records[key])
+print("Spill slot reuse finished")
+
+# a table that only grows spills whole cold records, newest versions included
+cold_table = db.create_table('Cold', 5, 0)
+cold_table.memory_budget = 1
+cold_query = Query(cold_table)
+cold_records = {}
+for i in range(0, number_of_records * 10):
+    key = 92106429 + i
+    cold_records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    cold_query.insert(*cold_records[key])
+cold_table.merge_base_tail()
+usage = cold_table.memory_usage()
+if usage["spilled_versions"] < usage["versions"] // 2:
+    print('spill error: only', usage["spilled_versions"], 'of', usage["versions"], 'cold versions spilled')
+for key, columns in cold_records.items():
+    record = cold_query.select(key, 0, [1, 1, 1, 1, 1])[0]
+    if record.columns != columns:
+        print('select error on cold', key, ':', record.columns, ', correct:', columns)
+print("Cold record spill finished")
+
+db.close()
+shutil.rmtree(path)